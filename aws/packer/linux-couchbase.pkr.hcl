@@ -0,0 +1,106 @@
+packer {
+  required_plugins {
+    amazon = {
+      version = ">= 0.0.2"
+      source  = "github.com/hashicorp/amazon"
+    }
+  }
+}
+
+locals {
+  timestamp = "${formatdate("YYYY-MM-DD-hhmm", timestamp())}"
+}
+
+variable "cb_version" {
+  description = "Software version"
+  type        = string
+}
+
+variable "build_digest" {
+  description = "Digest of the build inputs"
+  type        = string
+  default     = ""
+}
+
+variable "base_image" {
+  description = "Base AMI"
+  type        = string
+}
+
+variable "os_arch" {
+  description = "Processor architecture (x86_64 or arm64)"
+  type        = string
+  default     = "x86_64"
+}
+
+variable "os_linux_type" {
+  description = "Linux type"
+  type        = string
+}
+
+variable "os_linux_release" {
+  description = "Linux release"
+  type        = string
+}
+
+variable "os_image_name" {
+  description = "AWS image"
+  type        = string
+  default     = ""
+}
+
+variable "os_image_owner" {
+  description = "AMI owner"
+  type        = string
+  default     = ""
+}
+
+variable "os_image_user" {
+  description = "AMI SSH user"
+  type        = string
+}
+
+variable "region_name" {
+  description = "AWS region"
+  type        = string
+}
+
+variable "host_prep_repo" {
+  description = "Host prep repo"
+  type        = string
+}
+
+source "amazon-ebs" "cb-node" {
+  ami_name      = "${var.os_linux_type}-${var.os_linux_release}-couchbase-${local.timestamp}"
+  instance_type = var.os_arch == "arm64" ? "c6g.large" : "c5.large"
+  region        = "${var.region_name}"
+  source_ami    = "${var.base_image}"
+  ssh_username  = "${var.os_image_user}"
+  tags = {
+    Name    = "${var.os_linux_type}-${var.os_linux_release}-${var.cb_version}"
+    Type    = "${var.os_linux_type}"
+    Release = "${var.os_linux_release}"
+    Arch    = "${var.os_arch}"
+    Version = "${var.cb_version}"
+    Digest  = "${var.build_digest}"
+    Stage   = "couchbase"
+    Base    = "${var.base_image}"
+  }
+}
+
+build {
+  name    = "couchbase-layer-ami"
+  sources = [
+    "source.amazon-ebs.cb-node"
+  ]
+  provisioner "shell" {
+  environment_vars = [
+    "SW_VERSION=${var.cb_version}",
+  ]
+  inline = [
+    "echo Installing Couchbase",
+    "cd /usr/local/hostprep && sudo git pull -q",
+    "sudo /usr/local/hostprep/bin/hostprep.sh -t couchbase -v ${var.cb_version}",
+  ]
+  }
+}
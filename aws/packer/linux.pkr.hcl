@@ -8,7 +8,9 @@ packer {
 }
 
 locals {
-  timestamp = "${formatdate("YYYY-MM-DD-hhmm", timestamp())}"
+  timestamp     = "${formatdate("YYYY-MM-DD-hhmm", timestamp())}"
+  image_role    = var.build_stage == "base" ? "base" : "couchbase"
+  image_version = var.build_stage == "base" ? "base" : var.cb_version
 }
 
 variable "cb_version" {
@@ -16,6 +18,24 @@ variable "cb_version" {
   type        = string
 }
 
+variable "build_digest" {
+  description = "Digest of the build inputs"
+  type        = string
+  default     = ""
+}
+
+variable "build_stage" {
+  description = "Build stage (full or base)"
+  type        = string
+  default     = "full"
+}
+
+variable "os_arch" {
+  description = "Processor architecture (x86_64 or arm64)"
+  type        = string
+  default     = "x86_64"
+}
+
 variable "os_linux_type" {
   description = "Linux type"
   type        = string
@@ -52,8 +72,8 @@ variable "host_prep_repo" {
 }
 
 source "amazon-ebs" "cb-node" {
-  ami_name      = "${var.os_linux_type}-${var.os_linux_release}-couchbase-${local.timestamp}"
-  instance_type = "c5.large"
+  ami_name      = "${var.os_linux_type}-${var.os_linux_release}-${local.image_role}-${local.timestamp}"
+  instance_type = var.os_arch == "arm64" ? "c6g.large" : "c5.large"
   region        = "${var.region_name}"
   source_ami_filter {
     filters = {
@@ -66,10 +86,13 @@ source "amazon-ebs" "cb-node" {
   }
   ssh_username = "${var.os_image_user}"
   tags = {
-    Name    = "${var.os_linux_type}-${var.os_linux_release}-${var.cb_version}"
+    Name    = "${var.os_linux_type}-${var.os_linux_release}-${local.image_version}"
     Type    = "${var.os_linux_type}"
     Release = "${var.os_linux_release}"
-    Version = "${var.cb_version}"
+    Arch    = "${var.os_arch}"
+    Version = "${local.image_version}"
+    Digest  = "${var.build_digest}"
+    Stage   = "${var.build_stage}"
   }
 }
 
@@ -82,12 +105,17 @@ build {
   environment_vars = [
     "SW_VERSION=${var.cb_version}",
   ]
-  inline = [
-    "echo Installing Couchbase",
+  inline = concat([
+    "echo Preparing host",
     "sleep 30",
     "curl -sfL https://raw.githubusercontent.com/${var.host_prep_repo}/main/bin/bootstrap.sh | sudo -E bash -",
     "sudo git clone https://github.com/${var.host_prep_repo} /usr/local/hostprep",
+  ], var.build_stage == "base" ? [
+    "echo Applying OS updates",
+    "if command -v apt-get >/dev/null; then sudo DEBIAN_FRONTEND=noninteractive apt-get -q -y update && sudo DEBIAN_FRONTEND=noninteractive apt-get -q -y upgrade; else sudo yum -q -y update; fi",
+  ] : [
+    "echo Installing Couchbase",
     "sudo /usr/local/hostprep/bin/hostprep.sh -t couchbase -v ${var.cb_version}",
-  ]
+  ])
   }
 }
@@ -0,0 +1,112 @@
+packer {
+  required_plugins {
+    azure = {
+      version = ">= 1.0.0"
+      source  = "github.com/hashicorp/azure"
+    }
+  }
+}
+
+locals {
+  timestamp = "${formatdate("YYYY-MM-DD-hhmm", timestamp())}"
+}
+
+variable "cb_version" {
+  description = "Software version"
+  type        = string
+}
+
+variable "build_digest" {
+  description = "Digest of the build inputs"
+  type        = string
+  default     = ""
+}
+
+variable "base_image" {
+  description = "Base managed image"
+  type        = string
+}
+
+variable "os_linux_type" {
+  description = "Linux type"
+  type        = string
+}
+
+variable "os_linux_release" {
+  description = "Linux release"
+  type        = string
+}
+
+variable "azure_resource_group" {
+  description = "Azure resource group"
+  type        = string
+}
+
+variable "os_image_publisher" {
+  description = "Azure image publisher"
+  type        = string
+  default     = ""
+}
+
+variable "os_image_offer" {
+  description = "Azure image offer"
+  type        = string
+  default     = ""
+}
+
+variable "os_image_sku" {
+  description = "Azure image SKU"
+  type        = string
+  default     = ""
+}
+
+variable "azure_location" {
+  description = "Azure location"
+  type        = string
+}
+
+variable "host_prep_repo" {
+  description = "Host prep repo"
+  type        = string
+}
+
+source "azure-arm" "cb-node" {
+  use_azure_cli_auth = true
+
+  managed_image_resource_group_name = var.azure_resource_group
+  managed_image_name = "${var.os_linux_type}-${var.os_linux_release}-couchbase-${local.timestamp}"
+
+  os_type = "Linux"
+  custom_managed_image_resource_group_name = var.azure_resource_group
+  custom_managed_image_name = var.base_image
+
+  location = var.azure_location
+  vm_size = "Standard_DS2_v2"
+
+  azure_tags = {
+    Name    = "${var.os_linux_type}-${var.os_linux_release}-${var.cb_version}"
+    Type    = "${var.os_linux_type}"
+    Release = "${var.os_linux_release}"
+    Version = "${var.cb_version}"
+    Digest  = "${var.build_digest}"
+    Stage   = "couchbase"
+    Base    = "${var.base_image}"
+  }
+}
+
+build {
+  name    = "couchbase-layer-image"
+  sources = [
+    "source.azure-arm.cb-node"
+  ]
+  provisioner "shell" {
+  environment_vars = [
+    "SW_VERSION=${var.cb_version}",
+  ]
+  inline = [
+    "echo Installing Couchbase",
+    "cd /usr/local/hostprep && sudo git pull -q",
+    "sudo /usr/local/hostprep/bin/hostprep.sh -t couchbase -v ${var.cb_version}",
+  ]
+  }
+}
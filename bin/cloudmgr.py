@@ -17,6 +17,9 @@ from lib.args import params
 from lib.imagemgr import image_manager
 from lib.runmgr import run_manager
 from lib.netmgr import network_manager
+from lib.tfconfig import tf_config
+from lib.inventory import inventory_cache
+from lib.catalog import instance_catalog
 
 VERSION = '2.0-alpha-2'
 
@@ -33,6 +36,8 @@ class cloud_manager(object):
         print("CB Environment Manager - version %s" % VERSION)
         self.args = parameters
         self.verb = self.args.command
+        inventory_cache.set_refresh(getattr(self.args, 'refresh_cache', False))
+        instance_catalog.set_filter(getattr(self.args, 'instance_filter', None), getattr(self.args, 'instance_sort', None))
 
     def run(self):
         if self.verb == 'image':
@@ -41,8 +46,14 @@ class cloud_manager(object):
                 task.list_images()
             elif self.args.delete:
                 task.delete_images()
+            elif self.args.prune:
+                task.prune_images()
             elif self.args.build:
                 task.build_images()
+            elif self.args.replicate:
+                task.replicate_images()
+            elif self.args.fsr:
+                task.fast_restore()
             sys.exit(0)
         elif self.verb == 'create':
             task = run_manager(self.args)
@@ -56,6 +67,10 @@ class cloud_manager(object):
             task = run_manager(self.args)
             task.destroy_env()
             sys.exit(0)
+        elif self.verb == 'repair':
+            task = run_manager(self.args)
+            task.repair_env()
+            sys.exit(0)
         elif self.verb == 'list':
             task = run_manager(self.args)
             if self.args.all:
@@ -72,6 +87,13 @@ class cloud_manager(object):
             elif self.args.cidr:
                 task.add_network()
             sys.exit(0)
+        elif self.verb == 'plugins':
+            if self.args.list:
+                tf_config().list_providers()
+            elif self.args.mirror:
+                task = run_manager(self.args)
+                task.mirror_providers()
+            sys.exit(0)
 
 
 def main():
@@ -0,0 +1,122 @@
+packer {
+  required_plugins {
+    googlecompute = {
+      version = ">= 0.0.1"
+      source = "github.com/hashicorp/googlecompute"
+    }
+  }
+}
+
+locals {
+  timestamp = "${formatdate("YYYY-MM-DD-hhmm", timestamp())}"
+}
+
+variable "cb_version" {
+  description = "Software version"
+  type        = string
+}
+
+variable "build_digest" {
+  description = "Digest of the build inputs"
+  type        = string
+  default     = ""
+}
+
+variable "base_image" {
+  description = "Base image"
+  type        = string
+}
+
+variable "os_arch" {
+  description = "Processor architecture (x86_64 or arm64)"
+  type        = string
+  default     = "x86_64"
+}
+
+variable "os_linux_type" {
+  description = "Linux type"
+  type        = string
+}
+
+variable "os_linux_release" {
+  description = "Linux release"
+  type        = string
+}
+
+variable "gcp_account_file" {
+  description = "GCP auth JSON"
+  type        = string
+}
+
+variable "os_image_name" {
+  description = "GCP image"
+  type        = string
+  default     = ""
+}
+
+variable "os_image_family" {
+  description = "GCP image family"
+  type        = string
+  default     = ""
+}
+
+variable "gcp_project" {
+  description = "GCP project"
+  type        = string
+}
+
+variable "os_image_user" {
+  description = "Image SSH user"
+  type        = string
+}
+
+variable "gcp_zone" {
+  description = "GCP zone"
+  type        = string
+}
+
+variable "host_prep_repo" {
+  description = "Host prep repo"
+  type        = string
+}
+
+source "googlecompute" "cb-node" {
+  image_name              = "${var.os_linux_type}-${var.os_linux_release}-couchbase-${local.timestamp}"
+  account_file            = var.gcp_account_file
+  project_id              = var.gcp_project
+  source_image            = var.base_image
+  source_image_project_id = [var.gcp_project]
+  zone                    = var.gcp_zone
+  disk_size               = 50
+  machine_type            = var.os_arch == "arm64" ? "t2a-standard-2" : "n1-standard-2"
+  communicator            = "ssh"
+  ssh_username            = var.os_image_user
+  ssh_timeout             = "1h"
+  image_labels            = {
+    name    = format("%s-%s-%s", var.os_linux_type, var.os_linux_release, replace(var.cb_version, ".", "_"))
+    type    = "${var.os_linux_type}"
+    release = "${var.os_linux_release}"
+    arch    = var.os_arch
+    version = replace(var.cb_version, ".", "_")
+    digest  = var.build_digest
+    stage   = "couchbase"
+    base    = var.base_image
+  }
+}
+
+build {
+  name    = "couchbase-layer-image"
+  sources = [
+    "source.googlecompute.cb-node"
+  ]
+  provisioner "shell" {
+  environment_vars = [
+    "SW_VERSION=${var.cb_version}",
+  ]
+  inline = [
+    "echo Installing Couchbase",
+    "cd /usr/local/hostprep && sudo git pull -q",
+    "sudo /usr/local/hostprep/bin/hostprep.sh -t couchbase -v ${var.cb_version}",
+  ]
+  }
+}
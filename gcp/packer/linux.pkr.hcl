@@ -8,7 +8,9 @@ packer {
 }
 
 locals {
-  timestamp = "${formatdate("YYYY-MM-DD-hhmm", timestamp())}"
+  timestamp     = "${formatdate("YYYY-MM-DD-hhmm", timestamp())}"
+  image_role    = var.build_stage == "base" ? "base" : "couchbase"
+  image_version = var.build_stage == "base" ? "base" : var.cb_version
 }
 
 variable "cb_version" {
@@ -16,6 +18,24 @@ variable "cb_version" {
   type        = string
 }
 
+variable "build_digest" {
+  description = "Digest of the build inputs"
+  type        = string
+  default     = ""
+}
+
+variable "build_stage" {
+  description = "Build stage (full or base)"
+  type        = string
+  default     = "full"
+}
+
+variable "os_arch" {
+  description = "Processor architecture (x86_64 or arm64)"
+  type        = string
+  default     = "x86_64"
+}
+
 variable "os_linux_type" {
   description = "Linux type"
   type        = string
@@ -62,22 +82,25 @@ variable "host_prep_repo" {
 }
 
 source "googlecompute" "cb-node" {
-  image_name          = "${var.os_linux_type}-${var.os_linux_release}-couchbase-${local.timestamp}"
+  image_name          = "${var.os_linux_type}-${var.os_linux_release}-${local.image_role}-${local.timestamp}"
   account_file        = var.gcp_account_file
   project_id          = var.gcp_project
   source_image        = var.os_image_name
   source_image_family = var.os_image_family
   zone                = var.gcp_zone
   disk_size           = 50
-  machine_type        = "n1-standard-2"
+  machine_type        = var.os_arch == "arm64" ? "t2a-standard-2" : "n1-standard-2"
   communicator        = "ssh"
   ssh_username        = var.os_image_user
   ssh_timeout         = "1h"
   image_labels        = {
-    name    = format("%s-%s-%s", var.os_linux_type, var.os_linux_release, replace(var.cb_version, ".", "_"))
+    name    = format("%s-%s-%s", var.os_linux_type, var.os_linux_release, replace(local.image_version, ".", "_"))
     type    = "${var.os_linux_type}"
     release = "${var.os_linux_release}"
-    version = replace(var.cb_version, ".", "_")
+    arch    = var.os_arch
+    version = replace(local.image_version, ".", "_")
+    digest  = var.build_digest
+    stage   = var.build_stage
   }
 }
 
@@ -90,12 +113,17 @@ build {
   environment_vars = [
     "SW_VERSION=${var.cb_version}",
   ]
-  inline = [
-    "echo Installing Couchbase",
+  inline = concat([
+    "echo Preparing host",
     "sleep 30",
     "curl -sfL https://raw.githubusercontent.com/${var.host_prep_repo}/main/bin/bootstrap.sh | sudo -E bash -",
     "sudo git clone https://github.com/${var.host_prep_repo} /usr/local/hostprep",
+  ], var.build_stage == "base" ? [
+    "echo Applying OS updates",
+    "if command -v apt-get >/dev/null; then sudo DEBIAN_FRONTEND=noninteractive apt-get -q -y update && sudo DEBIAN_FRONTEND=noninteractive apt-get -q -y upgrade; else sudo yum -q -y update; fi",
+  ] : [
+    "echo Installing Couchbase",
     "sudo /usr/local/hostprep/bin/hostprep.sh -t couchbase -v ${var.cb_version}",
-  ]
+  ])
   }
 }
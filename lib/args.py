@@ -20,27 +20,55 @@ class params(object):
         parent_parser.add_argument('--dns', action='store_true', help="Update DNS", default=True)
         parent_parser.add_argument('--all', action='store_true', help="List all environments", default=False)
         parent_parser.add_argument('--standalone', action='store_true', help="Build standalone machine", default=False)
+        parent_parser.add_argument('--force-init', action='store_true', help="Always run terraform init and validate", default=False)
+        parent_parser.add_argument('--refresh', action='store_true', help="Always create a new plan", default=False)
+        parent_parser.add_argument('--refresh-cache', action='store_true', help="Query the cloud instead of using cached inventory", default=False)
+        parent_parser.add_argument('--instance-filter', action='store', help="Instance type filter (e.g. \"vcpu>=16 mem/vcpu>=8 arch=arm64\")")
+        parent_parser.add_argument('--instance-sort', action='store', help="Instance type sort order (e.g. \"-net,vcpu\")")
+        parent_parser.add_argument('--from-phase', action='store', help="Resume deployment from phase (cluster, app, sgw), step (init, validate, apply) or phase:step")
+        parent_parser.add_argument('--retry', action='store', help="Retries for failed resources", type=int, default=1)
+        parent_parser.add_argument('--fast', action='store_true', help="Destroy all roots at once without refresh", default=False)
         image_parser = argparse.ArgumentParser(add_help=False)
         image_parser.add_argument('--list', action='store_true', help='List images')
         image_parser.add_argument('--build', action='store_true', help='Build image')
         image_parser.add_argument('--delete', action='store_true', help='Delete image')
+        image_parser.add_argument('--prune', action='store_true', help='Delete superseded images')
+        image_parser.add_argument('--keep', action='store', help='Images to keep for each version when pruning', type=int, default=2)
+        image_parser.add_argument('--replicate', action='store_true', help='Copy image to other regions')
+        image_parser.add_argument('--image', action='store', help='Image name')
+        image_parser.add_argument('--regions', action='store', nargs='+', help='Target regions for image replication')
+        image_parser.add_argument('--fsr', action='store', choices=['enable', 'disable', 'status'], help='Manage EBS fast snapshot restore')
+        image_parser.add_argument('--zones', action='store', nargs='+', help='Availability zones for fast snapshot restore')
+        image_parser.add_argument('--matrix', action='store', nargs='+', help='Build specs cloud[:os[:release[:cb_version]]]')
+        image_parser.add_argument('--workers', action='store', help='Concurrent image builds', type=int, default=4)
+        image_parser.add_argument('--rebuild', action='store_true', help='Build even if a matching image exists')
+        image_parser.add_argument('--layered', action='store_true', help='Build on a cached OS base image')
+        image_parser.add_argument('--arch', action='store', choices=['x86_64', 'arm64'], help='Image architecture', default='x86_64')
         image_parser.add_argument('-h', '--help', action='help', default=argparse.SUPPRESS, help='Show help message')
         net_parser = argparse.ArgumentParser(add_help=False)
         net_parser.add_argument('--list', action='store_true', help='List network database')
         net_parser.add_argument('--domain', action='store_true', help='Add domain')
         net_parser.add_argument('--cidr', action='store_true', help='Add network')
         net_parser.add_argument('-h', '--help', action='help', default=argparse.SUPPRESS, help='Show help message')
+        plugin_parser = argparse.ArgumentParser(add_help=False)
+        plugin_parser.add_argument('--list', action='store_true', help='List cached and mirrored providers')
+        plugin_parser.add_argument('--mirror', action='store_true', help='Mirror environment providers')
+        plugin_parser.add_argument('-h', '--help', action='help', default=argparse.SUPPRESS, help='Show help message')
         subparsers = parser.add_subparsers(dest='command')
         image_mode = subparsers.add_parser('image', help="Manage CB Images", parents=[parent_parser, image_parser], add_help=False)
         create_mode = subparsers.add_parser('create', help="Create Nodes", parents=[parent_parser], add_help=False)
         deploy_mode = subparsers.add_parser('deploy', help="Deploy Nodes", parents=[parent_parser], add_help=False)
         destroy_mode = subparsers.add_parser('destroy', help="Clean Up", parents=[parent_parser], add_help=False)
+        repair_mode = subparsers.add_parser('repair', help="Replace Failed Nodes", parents=[parent_parser], add_help=False)
         list_mode = subparsers.add_parser('list', help="List Nodes", parents=[parent_parser], add_help=False)
         net_mode = subparsers.add_parser('net', help="Static Network Configuration", parents=[parent_parser, net_parser], add_help=False)
+        plugin_mode = subparsers.add_parser('plugins', help="Manage Terraform Providers", parents=[parent_parser, plugin_parser], add_help=False)
         self.parser = parser
         self.image_parser = image_mode
         self.create_parser = create_mode
         self.deploy_parser = deploy_mode
         self.destroy_parser = destroy_mode
+        self.repair_parser = repair_mode
         self.list_parser = list_mode
         self.net_parser = net_mode
+        self.plugin_parser = plugin_mode
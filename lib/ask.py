@@ -221,7 +221,7 @@ class ask(object):
         if default:
             self.logger.info("ask_machine_type: checking default value %s" % default)
             default_selection = next((i for i, item in enumerate(options) if item['name'] == default), None)
-            if default_selection:
+            if default_selection is not None:
                 if self.ask_yn("Use previous value: \"%s\"" % default, default=True):
                     return default_selection
         num_cpu = self.ask_quantity(options, 1)
@@ -2,14 +2,20 @@
 ##
 
 import logging
-import boto3
 import os
 import re
+import time
+from datetime import datetime
 from lib.exceptions import AWSDriverError
 from typing import Union
 from lib.ask import ask
 from lib.varfile import varfile
 from lib.prereq import prereq
+from lib.imagecache import image_index, market_index
+from lib.constants import COPY_POLL_INTERVAL, AWS_NETWORK_LEVELS, MARKET_SEARCH_LIMIT
+from lib.clients import cloud_clients
+from lib.inventory import inventory_cache
+from lib.catalog import instance_catalog
 
 
 class aws(object):
@@ -31,6 +37,7 @@ class aws(object):
         self.logger = logging.getLogger(self.__class__.__name__)
         self.vf = varfile()
         self.aws_region = None
+        self.aws_account_id = None
         self.aws_availability_zones = []
         self.use_public_ip = True
         self.aws_vpc_id = None
@@ -123,31 +130,31 @@ class aws(object):
         if self.aws_sg_id:
             return self.aws_sg_id
 
-        sg_list = []
-        sg_name_list = []
         if type(default) == list:
             default = default[0]
-        ec2_client = boto3.client('ec2', region_name=self.aws_region)
-        vpc_filter = {
-            'Name': 'vpc-id',
-            'Values': [
-                self.aws_vpc_id,
-            ]
-        }
-        sgs = ec2_client.describe_security_groups(Filters=[vpc_filter, ])
-        for i in range(len(sgs['SecurityGroups'])):
-            sg_list.append(sgs['SecurityGroups'][i]['GroupId'])
-            sg_name_list.append(sgs['SecurityGroups'][i]['GroupName'])
+
+        def query():
+            ec2_client = cloud_clients.aws('ec2', self.aws_region)
+            vpc_filter = {
+                'Name': 'vpc-id',
+                'Values': [
+                    self.aws_vpc_id,
+                ]
+            }
+            sgs = ec2_client.describe_security_groups(Filters=[vpc_filter, ])
+            return [{'id': group['GroupId'], 'name': group['GroupName']} for group in sgs['SecurityGroups']]
+
+        sgs = self.aws_inventory('security', 'security_groups', query, self.aws_vpc_id)
+        sg_list = [group['id'] for group in sgs]
+        sg_name_list = [group['name'] for group in sgs]
 
         selection = inquire.ask_list('Select security group', sg_list, sg_name_list, default=default)
-        self.aws_sg_id = [sgs['SecurityGroups'][selection]['GroupId']]
+        self.aws_sg_id = [sg_list[selection]]
         return self.aws_sg_id
 
     def aws_get_vpc_id(self, default=None, write=None) -> str:
         """Get AWS VPC ID"""
         inquire = ask()
-        vpc_list = []
-        vpc_name_list = []
 
         if write:
             self.aws_vpc_id = write
@@ -156,19 +163,17 @@ class aws(object):
         if self.aws_vpc_id:
             return self.aws_vpc_id
 
-        ec2_client = boto3.client('ec2', region_name=self.aws_region)
-        vpcs = ec2_client.describe_vpcs()
-        for i in range(len(vpcs['Vpcs'])):
-            vpc_list.append(vpcs['Vpcs'][i]['VpcId'])
-            item_name = ''
-            if 'Tags' in vpcs['Vpcs'][i]:
-                item_tag = self.aws_get_tag('Name', vpcs['Vpcs'][i]['Tags'])
-                if item_tag:
-                    item_name = item_tag
-            vpc_name_list.append(item_name)
+        def query():
+            ec2_client = cloud_clients.aws('ec2', self.aws_region)
+            vpcs = ec2_client.describe_vpcs()
+            return [{'id': vpc['VpcId'], 'name': self.aws_get_tag('Name', vpc.get('Tags', [])) or ''} for vpc in vpcs['Vpcs']]
+
+        vpcs = self.aws_inventory('network', 'vpcs', query)
+        vpc_list = [vpc['id'] for vpc in vpcs]
+        vpc_name_list = [vpc['name'] for vpc in vpcs]
 
         selection = inquire.ask_list('Select VPC', vpc_list, vpc_name_list, default=default)
-        self.aws_vpc_id = vpcs['Vpcs'][selection]['VpcId']
+        self.aws_vpc_id = vpc_list[selection]
         return self.aws_vpc_id
 
     def aws_get_availability_zone_list(self) -> list:
@@ -196,41 +201,34 @@ class aws(object):
 
         subnet_list = []
         subnet_name_list = []
-        filter_list = []
         question = "AWS Select Subnet"
-        ec2_client = boto3.client('ec2', region_name=self.aws_region)
-        vpc_filter = {
-            'Name': 'vpc-id',
-            'Values': [
-                self.aws_vpc_id,
-            ]
-        }
-        filter_list.append(vpc_filter)
-        if availability_zone:
-            self.logger.info("AWS: Subnet: Filtering subnets by AZ %s" % availability_zone)
-            question = question + " for zone {}".format(availability_zone)
-            zone_filter = {
-                'Name': 'availability-zone',
+
+        def query():
+            ec2_client = cloud_clients.aws('ec2', self.aws_region)
+            vpc_filter = {
+                'Name': 'vpc-id',
                 'Values': [
-                    availability_zone,
+                    self.aws_vpc_id,
                 ]
             }
-            filter_list.append(zone_filter)
+            subnets = ec2_client.describe_subnets(Filters=[vpc_filter, ])
+            return [{'id': subnet['SubnetId'],
+                     'name': self.aws_get_tag('Name', subnet.get('Tags', [])) or '',
+                     'zone': subnet['AvailabilityZone'],
+                     'public': subnet['MapPublicIpOnLaunch']} for subnet in subnets['Subnets']]
+
+        if availability_zone:
+            self.logger.info("AWS: Subnet: Filtering subnets by AZ %s" % availability_zone)
+            question = question + " for zone {}".format(availability_zone)
         self.logger.info("AWS: Subnet: Use public IP is %s" % self.use_public_ip)
-        subnets = ec2_client.describe_subnets(Filters=filter_list)
-        for i in range(len(subnets['Subnets'])):
-            if self.use_public_ip and not subnets['Subnets'][i]['MapPublicIpOnLaunch']:
+        for subnet in self.aws_inventory('network', 'subnets', query, self.aws_vpc_id):
+            if availability_zone and subnet['zone'] != availability_zone:
                 continue
-            elif not self.use_public_ip and subnets['Subnets'][i]['MapPublicIpOnLaunch']:
+            if bool(self.use_public_ip) != subnet['public']:
                 continue
-            self.logger.info("AWS: Subnet: Found subnet %s" % subnets['Subnets'][i]['SubnetId'])
-            subnet_list.append(subnets['Subnets'][i]['SubnetId'])
-            item_name = ''
-            if 'Tags' in subnets['Subnets'][i]:
-                item_tag = self.aws_get_tag('Name', subnets['Subnets'][i]['Tags'])
-                if item_tag:
-                    item_name = item_tag
-            subnet_name_list.append(item_name)
+            self.logger.info("AWS: Subnet: Found subnet %s" % subnet['id'])
+            subnet_list.append(subnet['id'])
+            subnet_name_list.append(subnet['name'])
 
         selection = inquire.ask_list(question, subnet_list, subnet_name_list, default=default)
         self.aws_subnet_id = subnet_list[selection]
@@ -239,8 +237,6 @@ class aws(object):
     def aws_get_ssh_key(self, default=None, write=None) -> str:
         """Get the AWS SSH key pair to use for node access"""
         inquire = ask()
-        key_list = []
-        key_id_list = []
 
         if write:
             self.aws_ssh_key = write
@@ -249,21 +245,23 @@ class aws(object):
         if self.aws_ssh_key:
             return self.aws_ssh_key
 
-        ec2_client = boto3.client('ec2', region_name=self.aws_region)
-        key_pairs = ec2_client.describe_key_pairs()
-        for i in range(len(key_pairs['KeyPairs'])):
-            key_list.append(key_pairs['KeyPairs'][i]['KeyName'])
-            key_id_list.append(key_pairs['KeyPairs'][i]['KeyPairId'])
+        def query():
+            ec2_client = cloud_clients.aws('ec2', self.aws_region)
+            key_pairs = ec2_client.describe_key_pairs()
+            return [{'name': key['KeyName'], 'id': key['KeyPairId'], 'fingerprint': key['KeyFingerprint']} for key in key_pairs['KeyPairs']]
+
+        key_pairs = self.aws_inventory('security', 'key_pairs', query)
+        key_list = [key['name'] for key in key_pairs]
+        key_id_list = [key['id'] for key in key_pairs]
 
         selection = inquire.ask_list('Select SSH key', key_list, key_id_list, default=default)
-        self.aws_ssh_key = key_pairs['KeyPairs'][selection]['KeyName']
-        self.ssh_key_fingerprint = key_pairs['KeyPairs'][selection]['KeyFingerprint']
+        self.aws_ssh_key = key_pairs[selection]['name']
+        self.ssh_key_fingerprint = key_pairs[selection]['fingerprint']
         return self.aws_ssh_key
 
     def aws_get_instance_type(self, default=None, write=None) -> str:
         """Get the AWS instance type"""
         inquire = ask()
-        size_list = []
 
         if write:
             self.aws_instance_type = write
@@ -272,31 +270,68 @@ class aws(object):
         if self.aws_instance_type:
             return self.aws_instance_type
 
-        ec2_client = boto3.client('ec2', region_name=self.aws_region)
-        describe_args = {}
-        while True:
-            instance_types = ec2_client.describe_instance_types(**describe_args)
-            for machine_type in instance_types['InstanceTypes']:
-                config_block = {}
-                config_block['name'] = machine_type['InstanceType']
-                config_block['cpu'] = int(machine_type['VCpuInfo']['DefaultVCpus'])
-                config_block['mem'] = int(machine_type['MemoryInfo']['SizeInMiB'])
-                config_block['description'] = ",".join(machine_type['ProcessorInfo']['SupportedArchitectures']) \
-                                              + ' ' + str(machine_type['ProcessorInfo']['SustainedClockSpeedInGhz']) + 'GHz' \
-                                              + ', Network: ' + machine_type['NetworkInfo']['NetworkPerformance'] \
-                                              + ', Hypervisor: ' + machine_type['Hypervisor'] if 'Hypervisor' in machine_type else 'NA'
-                size_list.append(config_block)
-            if 'NextToken' not in instance_types:
-                break
-            describe_args['NextToken'] = instance_types['NextToken']
+        size_list = self.aws_instance_catalog().narrow(arch=self.aws_image_arch(), keep=default).options()
         selection = inquire.ask_machine_type('AWS Instance Type', size_list, default=default)
         self.aws_instance_type = size_list[selection]['name']
         return self.aws_instance_type
 
-    def aws_get_market_ami(self, select=True, default=None, write=None, arch="x86_64", root_dev="ebs") -> dict:
-        """Get an AMI name"""
+    def aws_instance_catalog(self) -> instance_catalog:
+        """Catalog of the instance types available in the region"""
+        def query():
+            rows = []
+            ec2_client = cloud_clients.aws('ec2', self.aws_region)
+            paginator = ec2_client.get_paginator('describe_instance_types')
+            for page in paginator.paginate():
+                for machine_type in page['InstanceTypes']:
+                    row = self.aws_instance_row(machine_type)
+                    # Mac instances (x86_64_mac, arm64_mac) run on dedicated hosts and can not run the Linux images
+                    if row['arch'] in ('x86_64', 'arm64'):
+                        rows.append(row)
+            return instance_catalog.from_rows(rows).to_dict()
+
+        return instance_catalog(self.aws_inventory('catalog', 'instance_type_catalog', query))
+
+    @staticmethod
+    def aws_instance_row(machine_type: dict) -> dict:
+        architectures = machine_type['ProcessorInfo']['SupportedArchitectures']
+        network_info = machine_type['NetworkInfo']
+        network_cards = network_info.get('NetworkCards', [])
+        if network_cards and 'BaselineBandwidthInGbps' in network_cards[0]:
+            net = sum([card['BaselineBandwidthInGbps'] for card in network_cards])
+        else:
+            match = re.search(r'([0-9.]+) Gigabit', network_info['NetworkPerformance'])
+            net = float(match.group(1)) if match else AWS_NETWORK_LEVELS.get(network_info['NetworkPerformance'])
+        storage = 'ebs'
+        if machine_type.get('InstanceStorageSupported'):
+            storage_info = machine_type.get('InstanceStorageInfo', {})
+            storage = 'nvme' if storage_info.get('NvmeSupport') in ('required', 'supported') else storage_info.get('Disks', [{}])[0].get('Type', 'ssd')
+        clock_speed = machine_type['ProcessorInfo'].get('SustainedClockSpeedInGhz')
+        description = ",".join(architectures) \
+            + (f" {clock_speed}GHz" if clock_speed else "") \
+            + ', Network: ' + network_info['NetworkPerformance'] \
+            + ', Hypervisor: ' + machine_type.get('Hypervisor', 'NA')
+        return {
+            'name': machine_type['InstanceType'],
+            'vcpu': int(machine_type['VCpuInfo']['DefaultVCpus']),
+            'mem': machine_type['MemoryInfo']['SizeInMiB'] / 1024,
+            'arch': next((arch for arch in ('arm64', 'x86_64') if arch in architectures), architectures[0]),
+            'net': net,
+            'storage': storage,
+            'hypervisor': machine_type.get('Hypervisor', 'none'),
+            'burst': machine_type.get('BurstablePerformanceSupported', False),
+            'description': description,
+        }
+
+    def aws_image_arch(self):
+        """Architecture of the selected image, None if an image has not been selected"""
+        for image in (self.aws_ami_id, self.aws_market_ami):
+            if isinstance(image, dict) and image.get('arch'):
+                return image['arch']
+        return None
+
+    def aws_get_market_ami(self, select=True, default=None, write=None, arch=None, root_dev="ebs") -> dict:
+        """Get an AMI name, prompting for the architecture if it is not given"""
         inquire = ask()
-        image_list = []
         owner_list = [
             {
                 "name": "099720109477",
@@ -346,41 +381,65 @@ class aws(object):
         selection = inquire.ask_list("Linux Distribution", owner_list)
         ownerid = owner_list[selection]['name']
 
-        print("Searching images (this can take a few minutes) ...")
-
-        ec2_client = boto3.client('ec2', region_name=self.aws_region)
-        images = ec2_client.describe_images(Owners=[ownerid], Filters=[
-                                            {
-                                                'Name': 'architecture',
-                                                'Values': [
-                                                    arch,
-                                                ]
-                                            },
-                                            {
-                                                'Name': 'root-device-type',
-                                                'Values': [
-                                                    root_dev,
-                                                ]
-                                            },
-                                            ])
-        for i in range(len(images['Images'])):
-            image_block = {}
-            image_block['name'] = images['Images'][i]['ImageId']
-            image_block['description'] = images['Images'][i]['Name']
-            image_block['date'] = images['Images'][i]['CreationDate']
-            image_block['arch'] = images['Images'][i]['Architecture']
-            image_list.append(image_block)
+        if arch:
+            arch_list = [arch]
+        elif select:
+            arch_list = ['x86_64', 'arm64']
+            selection = inquire.ask_list('Architecture', arch_list, ['Intel and AMD', 'Graviton'])
+            arch_list = [arch_list[selection]]
+        else:
+            arch_list = ['x86_64', 'arm64']
 
-        image_list = sorted(image_list, key=lambda d: d['description'])
+        image_list = []
+        for image_arch in arch_list:
+            image_list.extend(self.aws_market_images(ownerid, image_arch, root_dev))
 
         if select:
+            search = inquire.ask_text('Image name search (prefix or words, * for all)', recommendation='*')
+            image_list = market_index.search(image_list, search.strip('*'), field='description', limit=MARKET_SEARCH_LIMIT)
+            if not image_list:
+                raise AWSDriverError(f"no images match {search}")
             selection = inquire.ask_list('Select AMI', image_list, default=default)
             self.aws_market_ami = image_list[selection]
         else:
-            self.aws_market_ami = image_list
+            self.aws_market_ami = sorted(image_list, key=lambda d: d['description'])
 
         return self.aws_market_ami
 
+    def aws_market_images(self, owner: str, arch: str, root_dev: str) -> list[dict]:
+        """Get the available images of an owner from the market image index, querying only the months since the last update"""
+        def query(since):
+            image_list = []
+            start = datetime.strptime(since[:7], '%Y-%m') if since else market_index.cutoff()
+            months = []
+            month = datetime(start.year, start.month, 1)
+            while month <= datetime.now():
+                months.append(month.strftime('%Y-%m-*'))
+                month = datetime(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+            filters = [
+                {'Name': 'architecture', 'Values': [arch]},
+                {'Name': 'root-device-type', 'Values': [root_dev]},
+                {'Name': 'state', 'Values': ['available']},
+                {'Name': 'creation-date', 'Values': months},
+            ]
+            ec2_client = cloud_clients.aws('ec2', self.aws_region)
+            if ec2_client.can_paginate('describe_images'):
+                pages = ec2_client.get_paginator('describe_images').paginate(Owners=[owner], Filters=filters)
+            else:
+                pages = [ec2_client.describe_images(Owners=[owner], Filters=filters)]
+            for page in pages:
+                for image in page['Images']:
+                    image_block = {}
+                    image_block['name'] = image['ImageId']
+                    image_block['description'] = image.get('Name', image['ImageId'])
+                    image_block['date'] = image['CreationDate']
+                    image_block['arch'] = image['Architecture']
+                    image_list.append(image_block)
+            return image_list
+
+        return market_index().images(f"aws:{self.aws_region}:{owner}:{arch}:{root_dev}", query)
+
     def aws_get_ami_id(self, select=True, default=None, write=None) -> Union[dict, list[dict]]:
         """Get the Couchbase AMI to use"""
         inquire = ask()
@@ -393,29 +452,20 @@ class aws(object):
         if self.aws_ami_id:
             return self.aws_ami_id
 
-        ec2_client = boto3.client('ec2', region_name=self.aws_region)
-        images = ec2_client.describe_images(Owners=['self'])
-        for i in range(len(images['Images'])):
-            image_block = {}
-            image_block['name'] = images['Images'][i]['ImageId']
-            image_block['description'] = images['Images'][i]['Name']
-            image_block['date'] = images['Images'][i]['CreationDate']
-            image_block['arch'] = images['Images'][i]['Architecture']
-            if 'Tags' in images['Images'][i]:
-                item_release_tag = self.aws_get_tag('Release', images['Images'][i]['Tags'])
-                item_type_tag = self.aws_get_tag('Type', images['Images'][i]['Tags'])
-                item_version_tag = self.aws_get_tag('Version', images['Images'][i]['Tags'])
-                if item_type_tag:
-                    image_block['type'] = item_type_tag
-                if item_release_tag:
-                    image_block['release'] = item_release_tag
-                if item_version_tag:
-                    image_block['version'] = item_version_tag
-                    image_block['description'] = image_block['description'] + f" ({item_version_tag})"
-            if 'type' not in image_block or 'release' not in image_block:
-                continue
-            image_list.append(image_block)
         if select:
+            image_list = [image for image in image_index().current(self.image_scope) if image.get('stage') != 'base']
+            if image_list:
+                selection = inquire.ask_list('Select AMI', image_list, default=default)
+                if self.aws_image_exists(image_list[selection]['name']):
+                    self.aws_ami_id = image_list[selection]
+                    self.aws_ami_name = image_list[selection]['name']
+                    return self.aws_ami_id
+                print(f"AMI {image_list[selection]['name']} no longer exists, listing images again")
+
+        image_list = self.aws_list_images()
+
+        if select:
+            image_list = [image for image in image_list if image.get('stage') != 'base']
             selection = inquire.ask_list('Select AMI', image_list, default=default)
             self.aws_ami_id = image_list[selection]
             self.aws_ami_name = image_list[selection]['name']
@@ -424,6 +474,109 @@ class aws(object):
 
         return self.aws_ami_id
 
+    @property
+    def image_scope(self) -> str:
+        return f"aws:{self.aws_region}"
+
+    def aws_image_exists(self, ami: str) -> bool:
+        ec2_client = cloud_clients.aws('ec2', self.aws_region)
+        try:
+            images = ec2_client.describe_images(ImageIds=[ami])
+        except Exception as err:
+            self.logger.info("Can not describe AMI %s: %s" % (ami, err))
+            return False
+        return any(image.get('State') == 'available' for image in images['Images'])
+
+    def aws_image_block(self, image: dict) -> dict:
+        image_block = {}
+        image_block['name'] = image['ImageId']
+        image_block['description'] = image['Name']
+        image_block['date'] = image['CreationDate']
+        image_block['arch'] = image['Architecture']
+        if 'Tags' in image:
+            item_release_tag = self.aws_get_tag('Release', image['Tags'])
+            item_type_tag = self.aws_get_tag('Type', image['Tags'])
+            item_version_tag = self.aws_get_tag('Version', image['Tags'])
+            item_digest_tag = self.aws_get_tag('Digest', image['Tags'])
+            item_stage_tag = self.aws_get_tag('Stage', image['Tags'])
+            item_base_tag = self.aws_get_tag('Base', image['Tags'])
+            item_fsr_tag = self.aws_get_tag('FastRestore', image['Tags'])
+            if item_digest_tag:
+                image_block['digest'] = item_digest_tag
+            if item_stage_tag:
+                image_block['stage'] = item_stage_tag
+            if item_base_tag:
+                image_block['base'] = item_base_tag
+            if item_fsr_tag:
+                image_block['fsr'] = item_fsr_tag.split()
+            if item_type_tag:
+                image_block['type'] = item_type_tag
+            if item_release_tag:
+                image_block['release'] = item_release_tag
+            if item_version_tag:
+                image_block['version'] = item_version_tag
+                image_block['description'] = image_block['description'] + f" ({item_version_tag})"
+        return image_block
+
+    def aws_list_images(self) -> list[dict]:
+        image_list = []
+
+        ec2_client = cloud_clients.aws('ec2', self.aws_region)
+        images = ec2_client.describe_images(Owners=['self'])
+        for image in images['Images']:
+            image_block = self.aws_image_block(image)
+            if 'type' not in image_block or 'release' not in image_block:
+                continue
+            image_list.append(image_block)
+
+        image_index().refresh(self.image_scope, image_list)
+        return image_list
+
+    def aws_copy_ami(self, ami: str, region: str, status=None, cancelled=None) -> dict:
+        """Copy an AMI and its tags to another region and wait for the copy to become available, returns None if cancelled"""
+        source_client = cloud_clients.aws('ec2', self.aws_region)
+        target_client = cloud_clients.aws('ec2', region)
+
+        try:
+            images = target_client.describe_images(Owners=['self'], Filters=[{'Name': 'tag:Source', 'Values': [ami]}])
+            if images['Images']:
+                copy_id = images['Images'][0]['ImageId']
+                self.logger.info("Found copy %s of %s in %s" % (copy_id, ami, region))
+            else:
+                image = source_client.describe_images(ImageIds=[ami])['Images'][0]
+                result = target_client.copy_image(Name=image['Name'],
+                                                  Description=image.get('Description', image['Name']),
+                                                  SourceImageId=ami,
+                                                  SourceRegion=self.aws_region)
+                copy_id = result['ImageId']
+                # tags are copied here rather than with CopyImageTags, which older boto3 releases do not have
+                tags = [tag for tag in image.get('Tags', []) if not tag['Key'].startswith('aws:') and tag['Key'] != 'Source']
+                target_client.create_tags(Resources=[copy_id], Tags=tags + [{'Key': 'Source', 'Value': ami}])
+                self.logger.info("Copying %s to %s as %s" % (ami, region, copy_id))
+        except Exception as err:
+            raise AWSDriverError(f"can not copy AMI {ami} to {region}: {err}")
+
+        start_time = time.time()
+        while True:
+            if cancelled and cancelled():
+                self.logger.info("Stopped waiting for copy %s in %s" % (copy_id, region))
+                return None
+            try:
+                image = target_client.describe_images(ImageIds=[copy_id])['Images'][0]
+            except Exception as err:
+                raise AWSDriverError(f"can not get status of AMI {copy_id} in {region}: {err}")
+            if image['State'] == 'available':
+                break
+            if image['State'] in ('failed', 'error', 'invalid', 'deregistered'):
+                raise AWSDriverError(f"copy of AMI {ami} to {region} failed: {image.get('StateReason', {}).get('Message')}")
+            if status:
+                status(f"{copy_id} {image['State']} {int(time.time() - start_time)}s")
+            time.sleep(COPY_POLL_INTERVAL)
+
+        image_block = self.aws_image_block(image)
+        image_index().add(f"aws:{region}", image_block)
+        return image_block
+
     @prereq(requirements=('aws_get_ami_id',))
     def get_image(self):
         return self.aws_ami_id
@@ -432,15 +585,119 @@ class aws(object):
     def get_market_image(self):
         return self.aws_market_ami
 
-    def aws_remove_ami(self, ami: str):
+    def aws_ami_snapshots(self, ami: str) -> list:
+        ec2_client = cloud_clients.aws('ec2', self.aws_region)
+        try:
+            image = ec2_client.describe_images(ImageIds=[ami])['Images'][0]
+        except Exception as err:
+            raise AWSDriverError(f"can not get AMI {ami}: {err}")
+        return [device['Ebs']['SnapshotId'] for device in image.get('BlockDeviceMappings', []) if 'Ebs' in device and 'SnapshotId' in device['Ebs']]
+
+    def aws_get_fsr(self, ami: str) -> list[dict]:
+        """Get the fast snapshot restore state of the AMI snapshots in each availability zone"""
+        ec2_client = cloud_clients.aws('ec2', self.aws_region)
+        fsr_list = []
+
+        snapshots = self.aws_ami_snapshots(ami)
+        if not snapshots:
+            return fsr_list
+
+        try:
+            paginator = ec2_client.get_paginator('describe_fast_snapshot_restores')
+            for page in paginator.paginate(Filters=[{'Name': 'snapshot-id', 'Values': snapshots}]):
+                for item in page['FastSnapshotRestores']:
+                    fsr_list.append({
+                        'snapshot': item['SnapshotId'],
+                        'zone': item['AvailabilityZone'],
+                        'state': item['State'],
+                        'enabled': item.get('EnabledTime') or item.get('EnablingTime'),
+                    })
+        except Exception as err:
+            raise AWSDriverError(f"can not get fast snapshot restore state for {ami}: {err}")
+
+        return fsr_list
+
+    def aws_enable_fsr(self, ami: str, zones: list) -> list:
+        ec2_client = cloud_clients.aws('ec2', self.aws_region)
+
+        snapshots = self.aws_ami_snapshots(ami)
+        if not snapshots:
+            raise AWSDriverError(f"AMI {ami} has no EBS snapshots")
+
+        try:
+            result = ec2_client.enable_fast_snapshot_restores(AvailabilityZones=zones, SourceSnapshotIds=snapshots)
+        except Exception as err:
+            raise AWSDriverError(f"can not enable fast snapshot restore for {ami}: {err}")
+
+        self.aws_tag_fsr(ami)
+
+        for item in result.get('Unsuccessful', []):
+            for error in item.get('FastSnapshotRestoreStateErrors', []):
+                raise AWSDriverError(f"can not enable fast snapshot restore for {item['SnapshotId']} in {error['AvailabilityZone']}: {error['Error']['Message']}")
+
+        return snapshots
+
+    def aws_disable_fsr(self, ami: str, zones=None):
+        ec2_client = cloud_clients.aws('ec2', self.aws_region)
+
+        fsr_list = [item for item in self.aws_get_fsr(ami) if item['state'] not in ('disabling', 'disabled')]
+        if zones:
+            fsr_list = [item for item in fsr_list if item['zone'] in zones]
+        if not fsr_list:
+            return
+
+        try:
+            ec2_client.disable_fast_snapshot_restores(AvailabilityZones=sorted(set([item['zone'] for item in fsr_list])),
+                                                      SourceSnapshotIds=sorted(set([item['snapshot'] for item in fsr_list])))
+        except Exception as err:
+            raise AWSDriverError(f"can not disable fast snapshot restore for {ami}: {err}")
+
+        self.aws_tag_fsr(ami)
+
+    def aws_fsr_zones(self, ami: str) -> list:
+        """Availability zones where fast snapshot restore is enabled (or being enabled) for every snapshot of the AMI"""
+        snapshots = set(self.aws_ami_snapshots(ami))
+        zone_snapshots = {}
+
+        for item in self.aws_get_fsr(ami):
+            if item['state'] not in ('disabling', 'disabled'):
+                zone_snapshots.setdefault(item['zone'], set()).add(item['snapshot'])
+
+        return sorted([zone for zone in zone_snapshots if zone_snapshots[zone] >= snapshots])
+
+    def aws_tag_fsr(self, ami: str) -> list:
+        """Record the zones that have fast snapshot restore in the FastRestore tag"""
+        ec2_client = cloud_clients.aws('ec2', self.aws_region)
+        zones = self.aws_fsr_zones(ami)
+
+        try:
+            if zones:
+                ec2_client.create_tags(Resources=[ami], Tags=[{'Key': 'FastRestore', 'Value': ' '.join(zones)}])
+            else:
+                ec2_client.delete_tags(Resources=[ami], Tags=[{'Key': 'FastRestore'}])
+        except Exception as err:
+            raise AWSDriverError(f"can not tag fast snapshot restore zones for {ami}: {err}")
+
+        return zones
+
+    def aws_remove_ami(self, ami: str, confirm=True):
+        """Deregister an AMI and delete its EBS snapshots"""
         inquire = ask()
 
-        if inquire.ask_yn(f"Delete AMI {ami}", default=True):
-            ec2_client = boto3.client('ec2', region_name=self.aws_region)
+        if not confirm or inquire.ask_yn(f"Delete AMI {ami}", default=True):
+            ec2_client = cloud_clients.aws('ec2', self.aws_region)
+            self.aws_disable_fsr(ami)
+            snapshots = self.aws_ami_snapshots(ami)
             try:
                 ec2_client.deregister_image(ImageId=ami)
             except Exception as err:
                 raise AWSDriverError(f"can not remove AMI {ami}: {err}")
+            image_index().remove(self.image_scope, ami)
+            for snapshot in snapshots:
+                try:
+                    ec2_client.delete_snapshot(SnapshotId=snapshot)
+                except Exception as err:
+                    raise AWSDriverError(f"can not delete snapshot {snapshot} of AMI {ami}: {err}")
 
     def aws_get_region(self, default=None, write=None) -> str:
         """Get the AWS Region"""
@@ -454,23 +711,33 @@ class aws(object):
             self.aws_region = os.environ['AWS_REGION']
         elif 'AWS_DEFAULT_REGION' in os.environ:
             self.aws_region = os.environ['AWS_DEFAULT_REGION']
-        elif boto3.DEFAULT_SESSION:
-            self.aws_region = boto3.DEFAULT_SESSION.region_name
-        elif boto3.Session().region_name:
-            self.aws_region = boto3.Session().region_name
+        elif cloud_clients.aws_session().region_name:
+            self.aws_region = cloud_clients.aws_session().region_name
         else:
             self.aws_region = inquire.ask_text('AWS Region', default=default)
 
         return self.aws_region
 
     def aws_get_region_zones(self) -> list:
-        ec2_client = boto3.client('ec2', region_name=self.aws_region)
-        zone_list = ec2_client.describe_availability_zones()
-        for availability_zone in zone_list['AvailabilityZones']:
-            self.logger.info("Found availability zone %s" % availability_zone['ZoneName'])
-            self.aws_availability_zones.append(availability_zone['ZoneName'])
+        def query():
+            ec2_client = cloud_clients.aws('ec2', self.aws_region)
+            zone_list = ec2_client.describe_availability_zones()
+            return [availability_zone['ZoneName'] for availability_zone in zone_list['AvailabilityZones']]
+
+        for zone_name in self.aws_inventory('zone', 'zones', query):
+            self.logger.info("Found availability zone %s" % zone_name)
+            self.aws_availability_zones.append(zone_name)
         return self.aws_availability_zones
 
+    def aws_account(self) -> str:
+        if not self.aws_account_id:
+            self.aws_account_id = cloud_clients.aws('sts', self.aws_region).get_caller_identity()['Account']
+        return self.aws_account_id
+
+    def aws_inventory(self, kind: str, query_name: str, query, *params):
+        """Get the result of an inventory query from the cache, running the query if it is not cached"""
+        return inventory_cache().get(kind, ('aws', self.aws_account(), self.aws_region, query_name, *params), query)
+
     def aws_tag_exists(self, key, tags):
         for i in range(len(tags)):
             if tags[i]['Key'] == key:
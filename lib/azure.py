@@ -2,17 +2,25 @@
 ##
 
 import logging
-from azure.identity import AzureCliCredential
 from azure.mgmt.compute import ComputeManagementClient
 from azure.mgmt.network import NetworkManagementClient
 from azure.mgmt.resource.resources import ResourceManagementClient
 from azure.mgmt.resource.subscriptions import SubscriptionClient
 from typing import Union
 import os
+import re
+from concurrent.futures import ThreadPoolExecutor
 from lib.varfile import varfile
 from lib.ask import ask
 from lib.exceptions import AzureDriverError
 from lib.prereq import prereq
+from lib.imagecache import image_index
+from lib.clients import cloud_clients
+from lib.inventory import inventory_cache
+from lib.catalog import instance_catalog
+from lib.constants import MARKET_QUERY_WORKERS
+
+ARM64_SIZE = re.compile(r'^Standard_[A-Z]+[0-9]+[a-z]*p[a-z]*_v[0-9]+$')
 
 
 class azure(object):
@@ -111,7 +119,6 @@ class azure(object):
     def azure_get_machine_type(self, default=None, write=None) -> str:
         """Get Azure Machine Type"""
         inquire = ask()
-        size_list = []
 
         if write:
             self.azure_machine_type = write
@@ -120,25 +127,44 @@ class azure(object):
         if self.azure_machine_type:
             return self.azure_machine_type
 
-        credential = AzureCliCredential()
-        compute_client = ComputeManagementClient(credential, self.azure_subscription_id)
-        sizes = compute_client.virtual_machine_sizes.list(self.azure_location)
-        for group in list(sizes):
-            config_block = {}
-            config_block['name'] = group.name
-            config_block['cpu'] = int(group.number_of_cores)
-            config_block['mem'] = int(group.memory_in_mb)
-            size_list.append(config_block)
+        size_list = self.azure_instance_catalog().narrow(arch=self.azure_image_arch(), keep=default).options()
         selection = inquire.ask_machine_type('Azure Machine Type', size_list, default=default)
         self.azure_machine_type = size_list[selection]['name']
         return self.azure_machine_type
 
+    def azure_instance_catalog(self) -> instance_catalog:
+        """Catalog of the VM sizes available in the location, the size list does not include network bandwidth"""
+        def query():
+            rows = []
+            compute_client = cloud_clients.azure(ComputeManagementClient, self.azure_subscription_id)
+            for group in list(compute_client.virtual_machine_sizes.list(self.azure_location)):
+                rows.append({
+                    'name': group.name,
+                    'vcpu': int(group.number_of_cores),
+                    'mem': int(group.memory_in_mb) / 1024,
+                    'arch': 'arm64' if ARM64_SIZE.match(group.name) else 'x86_64',
+                    'net': None,
+                    'storage': 'ssd' if group.resource_disk_size_in_mb else 'managed',
+                    'hypervisor': 'hyperv',
+                    'burst': group.name.startswith('Standard_B'),
+                    'description': f"{group.number_of_cores} vCPU, {int(group.memory_in_mb) / 1024:g} GiB, max {group.max_data_disk_count} data disks",
+                })
+            return instance_catalog.from_rows(rows).to_dict()
+
+        return instance_catalog(self.azure_inventory('catalog', 'vm_sizes', query))
+
+    def azure_image_arch(self):
+        """Architecture of the selected image, None if an image has not been selected"""
+        if isinstance(self.azure_image_name, dict):
+            return self.azure_image_name.get('arch', 'x86_64')
+        if self.azure_image_sku:
+            return 'arm64' if 'arm64' in self.azure_image_sku else 'x86_64'
+        return None
+
     @prereq(requirements=('azure_get_location',))
     def azure_get_market_image(self, select=True, default=None, write=None) -> dict:
         """Get Azure Image Name"""
         inquire = ask()
-        offer_list = []
-        pruned_offer_list = []
         publisher_list = [
             {
                 "name": "Canonical",
@@ -181,33 +207,13 @@ class azure(object):
         if self.azure_market_image:
             return self.azure_market_image
 
-        credential = AzureCliCredential()
-        compute_client = ComputeManagementClient(credential, self.azure_subscription_id)
-
         selection = inquire.ask_list('Image Publisher', publisher_list)
         publisher = publisher_list[selection]['name']
 
-        offers = compute_client.virtual_machine_images.list_offers(self.azure_location, publisher)
-        for group in list(offers):
-            offer_block = {}
-            offer_block['name'] = group.name
-            offer_block['skus'] = []
-            offer_block['count'] = 0
-            offer_list.append(offer_block)
-
-        for n, offer in enumerate(offer_list):
-            offer_name = offer['name']
-            skus = compute_client.virtual_machine_images.list_skus(self.azure_location, publisher, offer_name)
-            for group in list(skus):
-                sku_name = group.name
-                versions = compute_client.virtual_machine_images.list(self.azure_location, publisher, offer_name, sku_name)
-                if len(list(versions)) > 0:
-                    offer_list[n]['skus'].append(sku_name)
-                    offer_list[n]['count'] = len(offer_list[n]['skus'])
-
-        for offer in offer_list:
-            if offer['count'] != 0:
-                pruned_offer_list.append(offer)
+        pruned_offer_list = self.azure_market_offers(publisher)
+
+        if not pruned_offer_list:
+            raise AzureDriverError(f"no images from {publisher} in {self.azure_location}")
 
         if select:
             selection = inquire.ask_list('Image Offer', pruned_offer_list)
@@ -222,6 +228,38 @@ class azure(object):
 
         return self.azure_market_image
 
+    def azure_market_offers(self, publisher: str) -> list[dict]:
+        """Get the offers of a publisher with the SKUs that have at least one image version in the location"""
+        def sku_has_version(offer_name, sku_name):
+            compute_client = cloud_clients.azure(ComputeManagementClient, self.azure_subscription_id)
+            return len(compute_client.virtual_machine_images.list(self.azure_location, publisher, offer_name, sku_name, top=1)) > 0
+
+        def offer_skus(offer_name):
+            compute_client = cloud_clients.azure(ComputeManagementClient, self.azure_subscription_id)
+            return [group.name for group in compute_client.virtual_machine_images.list_skus(self.azure_location, publisher, offer_name)]
+
+        def query():
+            offer_list = []
+            compute_client = cloud_clients.azure(ComputeManagementClient, self.azure_subscription_id)
+            offer_names = [group.name for group in compute_client.virtual_machine_images.list_offers(self.azure_location, publisher)]
+
+            with ThreadPoolExecutor(max_workers=MARKET_QUERY_WORKERS) as executor:
+                sku_lists = list(executor.map(offer_skus, offer_names))
+                sku_pairs = [(offer_name, sku_name) for offer_name, skus in zip(offer_names, sku_lists) for sku_name in skus]
+                available = list(executor.map(lambda pair: sku_has_version(*pair), sku_pairs))
+
+            for offer_name in offer_names:
+                offer_block = {}
+                offer_block['name'] = offer_name
+                offer_block['skus'] = [sku_name for (offer, sku_name), found in zip(sku_pairs, available) if offer == offer_name and found]
+                offer_block['count'] = len(offer_block['skus'])
+                if offer_block['count'] != 0:
+                    offer_list.append(offer_block)
+
+            return offer_list
+
+        return self.azure_inventory('catalog', 'market_offers', query, publisher)
+
     @prereq(requirements=('azure_get_market_image',))
     def azure_get_image_publisher(self, default=None, write=None) -> str:
         if write:
@@ -258,8 +296,43 @@ class azure(object):
         if self.azure_image_name:
             return self.azure_image_name
 
-        credential = AzureCliCredential()
-        compute_client = ComputeManagementClient(credential, self.azure_subscription_id)
+        if select:
+            image_list = [image for image in image_index().current(self.image_scope) if image.get('stage') != 'base']
+            if image_list:
+                selection = inquire.ask_list('Azure Image Name', image_list, default=default)
+                if self.azure_image_exists(image_list[selection]['name']):
+                    self.azure_image_name = image_list[selection]
+                    return self.azure_image_name
+                print(f"Image {image_list[selection]['name']} no longer exists, listing images again")
+
+        image_list = self.azure_list_images()
+
+        if select:
+            image_list = [image for image in image_list if image.get('stage') != 'base']
+            selection = inquire.ask_list('Azure Image Name', image_list, default=default)
+            self.azure_image_name = image_list[selection]
+        else:
+            self.azure_image_name = image_list
+
+        return self.azure_image_name
+
+    @property
+    def image_scope(self) -> str:
+        return f"azure:{self.azure_resource_group}"
+
+    def azure_image_exists(self, name: str) -> bool:
+        compute_client = cloud_clients.azure(ComputeManagementClient, self.azure_subscription_id)
+        try:
+            image = compute_client.images.get(self.azure_resource_group, name)
+        except Exception as err:
+            self.logger.info("Can not get image %s: %s" % (name, err))
+            return False
+        return image.provisioning_state == 'Succeeded'
+
+    def azure_list_images(self) -> list[dict]:
+        image_list = []
+
+        compute_client = cloud_clients.azure(ComputeManagementClient, self.azure_subscription_id)
         images = compute_client.images.list_by_resource_group(self.azure_resource_group)
         for group in list(images):
             image_block = {}
@@ -270,16 +343,20 @@ class azure(object):
                 image_block['release'] = group.tags['Release']
             if 'Version' in group.tags:
                 image_block['version'] = image_block['description'] = group.tags['Version']
+            if 'Arch' in group.tags:
+                image_block['arch'] = group.tags['Arch']
+            if 'Digest' in group.tags:
+                image_block['digest'] = group.tags['Digest']
+            if 'Stage' in group.tags:
+                image_block['stage'] = group.tags['Stage']
+            if 'Base' in group.tags:
+                image_block['base'] = group.tags['Base']
             if 'type' not in image_block or 'release' not in image_block:
                 continue
             image_list.append(image_block)
-        if select:
-            selection = inquire.ask_list('Azure Image Name', image_list, default=default)
-            self.azure_image_name = image_list[selection]
-        else:
-            self.azure_image_name = image_list
 
-        return self.azure_image_name
+        image_index().refresh(self.image_scope, image_list)
+        return image_list
 
     @prereq(requirements=('azure_get_image_name',))
     def get_image(self):
@@ -289,19 +366,22 @@ class azure(object):
     def get_market_image(self):
         return self.azure_market_image
 
-    def azure_delete_image(self, name: str):
+    def azure_delete_image(self, name: str, confirm=True):
+        """Delete a managed image and wait for the delete poller to complete"""
         inquire = ask()
 
-        if inquire.ask_yn(f"Delete image {name}", default=True):
-            credential = AzureCliCredential()
-            compute_client = ComputeManagementClient(credential, self.azure_subscription_id)
-            request = compute_client.images.begin_delete(self.azure_resource_group, name)
-            result = request.result()
+        if not confirm or inquire.ask_yn(f"Delete image {name}", default=True):
+            compute_client = cloud_clients.azure(ComputeManagementClient, self.azure_subscription_id)
+            try:
+                request = compute_client.images.begin_delete(self.azure_resource_group, name)
+                request.result()
+            except Exception as err:
+                raise AzureDriverError(f"can not delete image {name}: {err}")
+            image_index().remove(self.image_scope, name)
 
     def azure_get_nsg(self, default=None, write=None):
         """Get Azure Network Security Group"""
         inquire = ask()
-        nsg_list = []
 
         if write:
             self.azure_nsg = write
@@ -310,11 +390,12 @@ class azure(object):
         if self.azure_nsg:
             return self.azure_nsg
 
-        credential = AzureCliCredential()
-        network_client = NetworkManagementClient(credential, self.azure_subscription_id)
-        nsgs = network_client.network_security_groups.list(self.azure_resource_group)
-        for group in list(nsgs):
-            nsg_list.append(group.name)
+        def query():
+            network_client = cloud_clients.azure(NetworkManagementClient, self.azure_subscription_id)
+            nsgs = network_client.network_security_groups.list(self.azure_resource_group)
+            return [group.name for group in list(nsgs)]
+
+        nsg_list = self.azure_inventory('security', 'nsgs', query, self.azure_resource_group)
         selection = inquire.ask_list('Azure Network Security Group', nsg_list, default=default)
         self.azure_nsg = nsg_list[selection]
         return self.azure_nsg
@@ -344,12 +425,14 @@ class azure(object):
         if self.azure_subnet:
             return self.azure_subnet
 
-        credential = AzureCliCredential()
-        network_client = NetworkManagementClient(credential, self.azure_subscription_id)
-        subnets = network_client.subnets.list(self.azure_resource_group, self.azure_vnet)
-        for group in list(subnets):
+        def query():
+            network_client = cloud_clients.azure(NetworkManagementClient, self.azure_subscription_id)
+            subnets = network_client.subnets.list(self.azure_resource_group, self.azure_vnet)
+            return [group.name for group in list(subnets)]
+
+        for subnet_name in self.azure_inventory('network', 'subnets', query, self.azure_resource_group, self.azure_vnet):
             subnet_block = {}
-            subnet_block['name'] = group.name
+            subnet_block['name'] = subnet_name
             subnet_list.append(subnet_block)
         selection = inquire.ask_list('Azure Subnet', subnet_list, default=default)
         self.azure_subnet = subnet_list[selection]['name']
@@ -358,7 +441,6 @@ class azure(object):
     def azure_get_vnet(self, default=None, write=None) -> str:
         """Get Azure Virtual Network"""
         inquire = ask()
-        vnet_list = []
 
         if write:
             self.azure_vnet = write
@@ -367,11 +449,12 @@ class azure(object):
         if self.azure_vnet:
             return self.azure_vnet
 
-        credential = AzureCliCredential()
-        network_client = NetworkManagementClient(credential, self.azure_subscription_id)
-        vnetworks = network_client.virtual_networks.list(self.azure_resource_group)
-        for group in list(vnetworks):
-            vnet_list.append(group.name)
+        def query():
+            network_client = cloud_clients.azure(NetworkManagementClient, self.azure_subscription_id)
+            vnetworks = network_client.virtual_networks.list(self.azure_resource_group)
+            return [group.name for group in list(vnetworks)]
+
+        vnet_list = self.azure_inventory('network', 'vnets', query, self.azure_resource_group)
         selection = inquire.ask_list('Azure Virtual Network', vnet_list, default=default)
         self.azure_vnet = vnet_list[selection]
         return self.azure_vnet
@@ -389,12 +472,14 @@ class azure(object):
         if self.azure_location:
             return self.azure_location
 
-        credential = AzureCliCredential()
-        subscription_client = SubscriptionClient(credential)
-        locations = subscription_client.subscriptions.list_locations(self.azure_subscription_id)
-        for group in list(locations):
-            location_list.append(group.name)
-            location_name.append(group.display_name)
+        def query():
+            subscription_client = cloud_clients.azure(SubscriptionClient)
+            locations = subscription_client.subscriptions.list_locations(self.azure_subscription_id)
+            return [{'name': group.name, 'display_name': group.display_name} for group in list(locations)]
+
+        for group in self.azure_inventory('account', 'locations', query):
+            location_list.append(group['name'])
+            location_name.append(group['display_name'])
         selection = inquire.ask_list('Azure Location', location_list, location_name, default=default)
         self.azure_location = location_list[selection]
         return self.azure_location
@@ -416,12 +501,9 @@ class azure(object):
             self.azure_location = os.environ['AZURE_DEFAULT_REGION']
             return os.environ['AZURE_DEFAULT_REGION']
 
-        credential = AzureCliCredential()
-        resource_client = ResourceManagementClient(credential, self.azure_subscription_id)
-        resource_group = resource_client.resource_groups.list()
-        for group in list(resource_group):
-            if group.name == self.azure_resource_group:
-                location_list.append(group.location)
+        for group in self.azure_resource_groups():
+            if group['name'] == self.azure_resource_group:
+                location_list.append(group['location'])
         selection = inquire.ask_list('Azure Location', location_list, location_name, default=default)
         self.azure_location = location_list[selection]
         return self.azure_location
@@ -433,22 +515,36 @@ class azure(object):
         if len(self.azure_availability_zones) > 0:
             return self.azure_availability_zones
 
-        print("Fetching Azure zone information, this may take a few minutes...")
-        credential = AzureCliCredential()
-        compute_client = ComputeManagementClient(credential, self.azure_subscription_id)
-        zone_list = compute_client.resource_skus.list()
-        for group in list(zone_list):
-            if group.resource_type == 'virtualMachines' \
-                    and group.name == self.azure_machine_type \
-                    and group.locations[0].lower() == self.azure_location.lower():
-                for resource_location in group.location_info:
-                    for zone_number in resource_location.zones:
-                        self.azure_availability_zones.append(zone_number)
-                self.azure_availability_zones = sorted(self.azure_availability_zones)
-                for zone_number in self.azure_availability_zones:
-                    self.logger.info("Added Azure availability zone %s" % zone_number)
+        def query():
+            zones = []
+            print("Fetching Azure zone information, this may take a few minutes...")
+            compute_client = cloud_clients.azure(ComputeManagementClient, self.azure_subscription_id)
+            zone_list = compute_client.resource_skus.list()
+            for group in list(zone_list):
+                if group.resource_type == 'virtualMachines' \
+                        and group.name == self.azure_machine_type \
+                        and group.locations[0].lower() == self.azure_location.lower():
+                    for resource_location in group.location_info:
+                        for zone_number in resource_location.zones:
+                            zones.append(zone_number)
+            return zones
+
+        self.azure_availability_zones = sorted(self.azure_inventory('zone', 'zones', query, self.azure_machine_type))
+        for zone_number in self.azure_availability_zones:
+            self.logger.info("Added Azure availability zone %s" % zone_number)
         return self.azure_availability_zones
 
+    def azure_resource_groups(self) -> list[dict]:
+        def query():
+            resource_client = cloud_clients.azure(ResourceManagementClient, self.azure_subscription_id)
+            return [{'name': group.name, 'location': group.location} for group in list(resource_client.resource_groups.list())]
+
+        return self.azure_inventory('account', 'resource_groups', query)
+
+    def azure_inventory(self, kind: str, query_name: str, query, *params):
+        """Get the result of an inventory query from the cache, running the query if it is not cached"""
+        return inventory_cache().get(kind, ('azure', self.azure_subscription_id, self.azure_location, query_name, *params), query)
+
     def azure_get_resource_group(self, default=None, write=None) -> str:
         """Get Azure Resource Group"""
         inquire = ask()
@@ -465,11 +561,8 @@ class azure(object):
             self.azure_resource_group = os.environ['AZURE_RESOURCE_GROUP']
             return self.azure_resource_group
 
-        credential = AzureCliCredential()
-        resource_client = ResourceManagementClient(credential, self.azure_subscription_id)
-        groups = resource_client.resource_groups.list()
-        for group in list(groups):
-            group_list.append(group.name)
+        for group in self.azure_resource_groups():
+            group_list.append(group['name'])
         selection = inquire.ask_list('Azure Resource Group', group_list, default=default)
         self.azure_resource_group = group_list[selection]
         return self.azure_resource_group
@@ -487,16 +580,18 @@ class azure(object):
         if self.azure_subscription_id:
             return self.azure_subscription_id
 
+        def query():
+            subscription_client = cloud_clients.azure(SubscriptionClient)
+            return [{'id': group.subscription_id, 'name': group.display_name} for group in list(subscription_client.subscriptions.list())]
+
         try:
-            credential = AzureCliCredential()
-            subscription_client = SubscriptionClient(credential)
-            subscriptions = subscription_client.subscriptions.list()
+            subscriptions = self.azure_inventory('account', 'subscriptions', query)
         except Exception as err:
             raise AzureDriverError(f"Azure: unauthorized (use az login): {err}")
 
-        for group in list(subscriptions):
-            subscription_list.append(group.subscription_id)
-            subscription_name.append(group.display_name)
+        for group in subscriptions:
+            subscription_list.append(group['id'])
+            subscription_name.append(group['name'])
         selection = inquire.ask_list('Azure Subscription ID', subscription_list, subscription_name, default=default)
         self.azure_subscription_id = subscription_list[selection]
         self.logger.info("Azure Subscription ID = %s" % self.azure_subscription_id)
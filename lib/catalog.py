@@ -0,0 +1,134 @@
+##
+##
+
+import logging
+import operator
+import re
+from lib.exceptions import CatalogError
+from lib.constants import INSTANCE_FILTER, INSTANCE_SORT
+
+CATALOG_COLUMNS = ['name', 'vcpu', 'mem', 'arch', 'net', 'storage', 'hypervisor', 'burst', 'description']
+NUMERIC_COLUMNS = ['vcpu', 'mem', 'net']
+FILTER_TERM = re.compile(r'^([a-z]+)(?:/([a-z]+))?(>=|<=|!=|=|>|<)(.+)$')
+OPERATORS = {
+    '>=': operator.ge,
+    '<=': operator.le,
+    '!=': operator.ne,
+    '=': operator.eq,
+    '>': operator.gt,
+    '<': operator.lt,
+}
+
+
+class instance_catalog(object):
+    """Instance types of a cloud region stored as column arrays that can be filtered and sorted"""
+    type_filter = None
+    type_sort = None
+
+    def __init__(self, columns=None):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.columns = {column: [] for column in CATALOG_COLUMNS}
+        if columns:
+            for column in CATALOG_COLUMNS:
+                self.columns[column] = list(columns.get(column, []))
+
+    @classmethod
+    def set_filter(cls, type_filter=None, type_sort=None):
+        """Set the filter and sort order used to narrow instance type selection"""
+        cls.type_filter = type_filter
+        cls.type_sort = type_sort
+
+    @classmethod
+    def from_rows(cls, rows: list[dict]):
+        catalog = cls()
+        for row in rows:
+            for column in CATALOG_COLUMNS:
+                catalog.columns[column].append(row.get(column))
+        return catalog
+
+    def __len__(self):
+        return len(self.columns['name'])
+
+    def column(self, name: str, ratio=None) -> list:
+        if name not in self.columns:
+            raise CatalogError(f"unknown instance type attribute {name}, expecting one of {', '.join(CATALOG_COLUMNS)}")
+        if not ratio:
+            return self.columns[name]
+        divisor = self.column(ratio)
+        return [value / div if value is not None and div else None for value, div in zip(self.columns[name], divisor)]
+
+    def mask(self, term: str) -> list[bool]:
+        """Evaluate one predicate (e.g. vcpu>=16, mem/vcpu>=8, arch=arm64) against every row"""
+        match = FILTER_TERM.match(term)
+        if not match:
+            raise CatalogError(f"invalid instance type filter {term}, expecting attribute[/attribute]<op>value")
+        name, ratio, op, value = match.groups()
+        values = self.column(name, ratio)
+        compare = OPERATORS[op]
+
+        if name in NUMERIC_COLUMNS:
+            try:
+                value = float(value)
+            except ValueError:
+                raise CatalogError(f"invalid instance type filter {term}, {value} is not a number")
+            return [item is not None and compare(item, value) for item in values]
+
+        if op not in ('=', '!='):
+            raise CatalogError(f"invalid instance type filter {term}, {name} only supports = and !=")
+        return [compare(str(item).lower(), value.lower()) for item in values]
+
+    def select(self, rows: list[int]):
+        return instance_catalog({column: [self.columns[column][i] for i in rows] for column in CATALOG_COLUMNS})
+
+    def match(self, expression: str) -> list[bool]:
+        """Evaluate all the space separated predicates in the expression against every row"""
+        mask = [True] * len(self)
+        for term in expression.split() if expression else []:
+            mask = [selected and matched for selected, matched in zip(mask, self.mask(term))]
+        return mask
+
+    def filter(self, expression: str):
+        """Return the rows that match all the space separated predicates in the expression"""
+        return self.select([i for i, selected in enumerate(self.match(expression)) if selected])
+
+    def sort(self, keys: str):
+        """Sort by comma separated attributes, prefix an attribute with - for descending order"""
+        rows = list(range(len(self)))
+        for key in reversed(keys.split(',') if keys else []):
+            reverse = key.startswith('-')
+            values = self.column(key.lstrip('-'))
+            present = [i for i in rows if values[i] is not None]
+            missing = [i for i in rows if values[i] is None]
+            rows = sorted(present, key=lambda i: values[i], reverse=reverse) + missing
+        return self.select(rows)
+
+    def narrow(self, arch=None, keep=None):
+        """Apply the architecture and the configured (or default) filter, falling back to all types if nothing matches, and keeping the type named by keep (the previous selection)"""
+        catalog = self.filter(f"arch={arch}") if arch else self
+        expression = instance_catalog.type_filter if instance_catalog.type_filter else INSTANCE_FILTER
+
+        mask = catalog.match(expression)
+        if not any(mask):
+            print(f"No instance types match \"{expression}\", showing all instance types")
+            narrowed = catalog
+        else:
+            self.logger.info("Filter \"%s\" selected %d of %d instance types" % (expression, mask.count(True), len(catalog)))
+            narrowed = catalog.select([i for i, name in enumerate(catalog.columns['name']) if mask[i] or name == keep])
+
+        return narrowed.sort(instance_catalog.type_sort if instance_catalog.type_sort else INSTANCE_SORT)
+
+    def options(self) -> list[dict]:
+        """Rows in the format used by ask_machine_type (memory in MiB)"""
+        option_list = []
+        for i in range(len(self)):
+            config_block = {}
+            config_block['name'] = self.columns['name'][i]
+            config_block['cpu'] = int(self.columns['vcpu'][i])
+            config_block['mem'] = int(round(self.columns['mem'][i] * 1024))
+            if self.columns['description'][i]:
+                config_block['description'] = self.columns['description'][i]
+            option_list.append(config_block)
+        return option_list
+
+    def to_dict(self) -> dict:
+        return self.columns
@@ -11,6 +11,15 @@ import json
 from lib.ask import ask
 from lib.exceptions import CBReleaseManagerError
 
+RPM_ARCH = {
+    'x86_64': 'x86_64',
+    'arm64': 'aarch64',
+}
+APT_ARCH = {
+    'x86_64': 'amd64',
+    'arm64': 'arm64',
+}
+
 
 class cbrelease(object):
     VARIABLES = [
@@ -26,6 +35,7 @@ class cbrelease(object):
         self.cb_version = None
         self.cb_index_mem_type = None
         self.sgw_version = None
+        self.arch = 'x86_64'
 
     def set_os_name(self, name: str):
         self.os_name = name
@@ -37,6 +47,11 @@ class cbrelease(object):
     def set_os_ver(self, release: str):
         self.os_release = release
 
+    def set_arch(self, arch: str):
+        if arch not in RPM_ARCH:
+            raise CBReleaseManagerError(f"unsupported architecture {arch}")
+        self.arch = arch
+
     def get_cb_index_mem_setting(self, default=None, write=None):
         inquire = ask()
 
@@ -87,7 +102,7 @@ class cbrelease(object):
 
     def get_rpm(self):
         osrel = self.os_release
-        pkg_url = 'http://packages.couchbase.com/releases/couchbase-server/enterprise/rpm/' + osrel + '/x86_64/repodata/repomd.xml'
+        pkg_url = 'http://packages.couchbase.com/releases/couchbase-server/enterprise/rpm/' + osrel + '/' + RPM_ARCH[self.arch] + '/repodata/repomd.xml'
         filelist_url = None
         return_list = []
 
@@ -111,7 +126,7 @@ class cbrelease(object):
         if not filelist_url:
             raise Exception("Invalid response from server, can not get release list.")
 
-        list_url = 'http://packages.couchbase.com/releases/couchbase-server/enterprise/rpm/' + osrel + '/x86_64/' + filelist_url
+        list_url = 'http://packages.couchbase.com/releases/couchbase-server/enterprise/rpm/' + osrel + '/' + RPM_ARCH[self.arch] + '/' + filelist_url
 
         response = requests.get(list_url, verify=False, timeout=15)
 
@@ -137,7 +152,7 @@ class cbrelease(object):
 
     def get_apt(self):
         osrel = self.os_release
-        pkg_url = 'http://packages.couchbase.com/releases/couchbase-server/enterprise/deb/dists/' + osrel + '/' + osrel + '/main/binary-amd64/Packages.gz'
+        pkg_url = 'http://packages.couchbase.com/releases/couchbase-server/enterprise/deb/dists/' + osrel + '/' + osrel + '/main/binary-' + APT_ARCH[self.arch] + '/Packages.gz'
         return_list = []
 
         session = requests.Session()
@@ -186,10 +201,10 @@ class cbrelease(object):
         return self.sgw_version
 
     def get_sgw_rpm(self, version):
-        return f"http://packages.couchbase.com/releases/couchbase-sync-gateway/{version}/couchbase-sync-gateway-enterprise_{version}_x86_64.rpm"
+        return f"http://packages.couchbase.com/releases/couchbase-sync-gateway/{version}/couchbase-sync-gateway-enterprise_{version}_{RPM_ARCH[self.arch]}.rpm"
 
     def get_sgw_apt(self, version):
-        return f"http://packages.couchbase.com/releases/couchbase-sync-gateway/{version}/couchbase-sync-gateway-enterprise_{version}_x86_64.deb"
+        return f"http://packages.couchbase.com/releases/couchbase-sync-gateway/{version}/couchbase-sync-gateway-enterprise_{version}_{RPM_ARCH[self.arch]}.deb"
 
     def get_sgw_versions(self):
         sgw_git_release_url = 'https://api.github.com/repos/couchbase/sync_gateway/releases'
@@ -0,0 +1,94 @@
+##
+##
+
+import atexit
+import logging
+import threading
+import boto3
+from botocore.config import Config
+import googleapiclient.discovery
+from google.oauth2 import service_account
+from azure.identity import AzureCliCredential
+from pyVim.connect import SmartConnectNoSSL, Disconnect
+from lib.constants import CLIENT_POOL_SIZE
+
+
+class cloud_clients(object):
+    """Process-wide registry that creates each cloud API client or session once and shares it between threads"""
+    _clients = {}
+    _lock = threading.RLock()
+    _local = threading.local()
+    logger = logging.getLogger('cloud_clients')
+
+    @classmethod
+    def get(cls, key: tuple, factory):
+        with cls._lock:
+            if key not in cls._clients:
+                cls.logger.info("Creating client %s" % ':'.join([str(item) for item in key]))
+                cls._clients[key] = factory()
+            return cls._clients[key]
+
+    @classmethod
+    def aws_session(cls) -> boto3.session.Session:
+        return cls.get(('aws', 'session'), boto3.session.Session)
+
+    @classmethod
+    def aws(cls, service: str, region: str):
+        """Boto3 clients are thread safe, so one client per service and region is shared by all threads"""
+        config = Config(max_pool_connections=CLIENT_POOL_SIZE)
+        return cls.get(('aws', service, region), lambda: cls.aws_session().client(service, region_name=region, config=config))
+
+    @classmethod
+    def gcp_credentials(cls, account_file: str):
+        return cls.get(('gcp', 'credentials', account_file), lambda: service_account.Credentials.from_service_account_file(account_file))
+
+    @classmethod
+    def gcp(cls, service: str, version: str, account_file: str):
+        """Google API service objects are not thread safe, so each thread gets its own built from the static discovery document"""
+        credentials = cls.gcp_credentials(account_file)
+        if not hasattr(cls._local, 'gcp'):
+            cls._local.gcp = {}
+        key = (service, version, account_file)
+        if key not in cls._local.gcp:
+            cls._local.gcp[key] = googleapiclient.discovery.build(service, version,
+                                                                  credentials=credentials,
+                                                                  static_discovery=True,
+                                                                  cache_discovery=False)
+        return cls._local.gcp[key]
+
+    @classmethod
+    def azure_credential(cls) -> AzureCliCredential:
+        return cls.get(('azure', 'credential'), AzureCliCredential)
+
+    @classmethod
+    def azure(cls, client_class, subscription_id=None):
+        """Azure management clients are thread safe and cache their access token, so one client per subscription is shared"""
+        credential = cls.azure_credential()
+        if subscription_id:
+            return cls.get(('azure', client_class.__name__, subscription_id), lambda: client_class(credential, subscription_id))
+        return cls.get(('azure', client_class.__name__), lambda: client_class(credential))
+
+    @classmethod
+    def vmware(cls, hostname: str, username: str, password: str):
+        """Connect to vCenter once, reconnecting if the session has expired"""
+        key = ('vmware', hostname, username)
+        with cls._lock:
+            si = cls._clients.get(key)
+            if si:
+                try:
+                    if si.content.sessionManager.currentSession:
+                        return si
+                except Exception:
+                    pass
+                cls.logger.info("Session to %s expired, reconnecting" % hostname)
+                del cls._clients[key]
+            si = cls.get(key, lambda: SmartConnectNoSSL(host=hostname, user=username, pwd=password, port=443))
+            atexit.register(cls.vmware_disconnect, si)
+            return si
+
+    @staticmethod
+    def vmware_disconnect(si):
+        try:
+            Disconnect(si)
+        except Exception:
+            pass
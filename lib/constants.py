@@ -13,6 +13,42 @@ APP_CONFIG = 0x0011
 SGW_CONFIG = 0x0012
 STD_CONFIG = 0x0099
 
+FAST_DESTROY_PARALLELISM = 50
+PARALLELISM_DEFAULTS = {
+    'minimum': 10,
+    'per_node': 2,
+    'ceiling': 30,
+}
+THROTTLE_RETRIES = 3
+THROTTLE_DELAY = 30
+COPY_POLL_INTERVAL = 15
+FSR_HOURLY_COST = 0.75
+CLIENT_POOL_SIZE = 32
+INVENTORY_TTL = {
+    'account': 604800,
+    'zone': 604800,
+    'network': 86400,
+    'storage': 86400,
+    'security': 3600,
+    'catalog': 604800,
+}
+INSTANCE_FILTER = 'vcpu>=4 mem>=8 burst=false'
+INSTANCE_SORT = 'vcpu,mem,name'
+AWS_NETWORK_LEVELS = {
+    'Very Low': 0.05,
+    'Low': 0.3,
+    'Low to Moderate': 0.5,
+    'Moderate': 1.0,
+    'High': 10.0,
+}
+GCP_MAX_EGRESS_GBPS = 32
+IMAGE_INDEX_TTL = 3600
+MARKET_INDEX_TTL = 3600
+MARKET_INDEX_FULL_TTL = 604800
+MARKET_IMAGE_MAX_AGE = 730
+MARKET_SEARCH_LIMIT = 100
+MARKET_QUERY_WORKERS = 16
+
 CB_CFG_HEAD = """####
 variable "cluster_spec" {
   description = "Map of cluster nodes and services."
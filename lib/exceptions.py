@@ -12,8 +12,12 @@ class fatalError(Exception):
         frame = inspect.currentframe().f_back
         (filename, line, function, lines, index) = inspect.getframeinfo(frame)
         filename = os.path.basename(filename)
-        print("Error: {} in {} {} at line {}: {}".format(type(self).__name__, filename, function, line, message))
-        sys.exit(1)
+        self.message = "Error: {} in {} {} at line {}: {}".format(type(self).__name__, filename, function, line, message)
+        print(self.message)
+        # keep the message on the exit so a phase scheduler running this in a thread can report it
+        exit_error = SystemExit(1)
+        exit_error.message = self.message
+        raise exit_error
 
 
 class nonFatalError(Exception):
@@ -102,3 +106,26 @@ class TFGenError(fatalError):
 class CBReleaseManagerError(fatalError):
     pass
 
+
+class SchedulerError(fatalError):
+    pass
+
+
+class CatalogError(fatalError):
+    pass
+
+
+class PhaseCancelled(nonFatalError):
+    pass
+
+
+class ProcessRunnerError(nonFatalError):
+    pass
+
+
+class ProcessCancelled(nonFatalError):
+    pass
+
+
+class ProcessTimeout(nonFatalError):
+    pass
@@ -2,15 +2,22 @@
 ##
 
 import logging
-import googleapiclient.discovery
-from google.oauth2 import service_account
 import json
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import ThreadPoolExecutor
 from typing import Union
 from lib.varfile import varfile
 from lib.toolbox import toolbox
 from lib.ask import ask
 from lib.exceptions import *
 from lib.prereq import prereq
+from lib.imagecache import image_index, market_index
+from lib.clients import cloud_clients
+from lib.inventory import inventory_cache
+from lib.catalog import instance_catalog
+from lib.constants import GCP_MAX_EGRESS_GBPS, MARKET_SEARCH_LIMIT
+
+ARM64_MACHINE_FAMILIES = ('t2a', 'c4a')
 
 
 class gcp(object):
@@ -59,6 +66,10 @@ class gcp(object):
         except Exception as err:
             raise GCPDriverError(f"can not access GCP API: {err}")
 
+    def gcp_inventory(self, kind: str, query_name: str, query, *params):
+        """Get the result of an inventory query from the cache, running the query if it is not cached"""
+        return inventory_cache().get(kind, ('gcp', self.gcp_project, self.gcp_region, query_name, *params), query)
+
     def gcp_prep(self, select=True):
         try:
             self.get_gcp_region()
@@ -70,17 +81,20 @@ class gcp(object):
         """Collect GCP availability zones"""
         inquire = ask()
 
-        credentials = service_account.Credentials.from_service_account_file(self.gcp_account_file)
-        gcp_client = googleapiclient.discovery.build('compute', 'v1', credentials=credentials)
-        request = gcp_client.zones().list(project=self.gcp_project)
-        while request is not None:
-            response = request.execute()
-            for zone in response['items']:
-                if not zone['name'].startswith(self.gcp_region):
-                    continue
-                self.gcp_zone_list.append(zone['name'])
-            request = gcp_client.zones().list_next(previous_request=request, previous_response=response)
-        self.gcp_zone_list = sorted(self.gcp_zone_list)
+        def query():
+            zone_list = []
+            gcp_client = cloud_clients.gcp('compute', 'v1', self.gcp_account_file)
+            request = gcp_client.zones().list(project=self.gcp_project)
+            while request is not None:
+                response = request.execute()
+                for zone in response['items']:
+                    if not zone['name'].startswith(self.gcp_region):
+                        continue
+                    zone_list.append(zone['name'])
+                request = gcp_client.zones().list_next(previous_request=request, previous_response=response)
+            return zone_list
+
+        self.gcp_zone_list = sorted(self.gcp_inventory('zone', 'zones', query))
         for gcp_zone_name in self.gcp_zone_list:
             self.logger.info("Added GCP zone %s" % gcp_zone_name)
 
@@ -112,15 +126,20 @@ class gcp(object):
         if self.gcp_project:
             return self.gcp_project
 
-        credentials = service_account.Credentials.from_service_account_file(self.gcp_account_file)
-        gcp_client = googleapiclient.discovery.build('cloudresourcemanager', 'v1', credentials=credentials)
-        request = gcp_client.projects().list()
-        while request is not None:
-            response = request.execute()
-            for project in response.get('projects', []):
-                project_ids.append(project['projectId'])
-                project_names.append(project['name'])
-            request = gcp_client.projects().list_next(previous_request=request, previous_response=response)
+        def query():
+            project_list = []
+            gcp_client = cloud_clients.gcp('cloudresourcemanager', 'v1', self.gcp_account_file)
+            request = gcp_client.projects().list()
+            while request is not None:
+                response = request.execute()
+                for project in response.get('projects', []):
+                    project_list.append({'id': project['projectId'], 'name': project['name']})
+                request = gcp_client.projects().list_next(previous_request=request, previous_response=response)
+            return project_list
+
+        for project in self.gcp_inventory('account', 'projects', query, os.path.basename(self.gcp_account_file)):
+            project_ids.append(project['id'])
+            project_names.append(project['name'])
         if len(project_ids) == 0:
             self.logger.info("Insufficient permissions to list projects, attempting to get project ID from auth JSON")
             gcp_auth_json_project_id = self.gcp_get_project_id()
@@ -228,7 +247,6 @@ class gcp(object):
     def gcp_get_machine_type(self, default=None, write=None) -> str:
         """Get GCP machine type"""
         inquire = ask()
-        machine_type_list = []
 
         if write:
             self.gcp_machine_type = write
@@ -237,23 +255,56 @@ class gcp(object):
         if self.gcp_machine_type:
             return self.gcp_machine_type
 
-        credentials = service_account.Credentials.from_service_account_file(self.gcp_account_file)
-        gcp_client = googleapiclient.discovery.build('compute', 'v1', credentials=credentials)
-        request = gcp_client.machineTypes().list(project=self.gcp_project, zone=self.gcp_zone)
-        while request is not None:
-            response = request.execute()
-            for machine_type in response['items']:
-                config_block = {}
-                config_block['name'] = machine_type['name']
-                config_block['cpu'] = int(machine_type['guestCpus'])
-                config_block['mem'] = int(machine_type['memoryMb'])
-                config_block['description'] = machine_type['description']
-                machine_type_list.append(config_block)
-            request = gcp_client.machineTypes().list_next(previous_request=request, previous_response=response)
+        machine_type_list = self.gcp_instance_catalog().narrow(arch=self.gcp_image_arch(), keep=default).options()
         selection = inquire.ask_machine_type('GCP Machine Type', machine_type_list, default=default)
         self.gcp_machine_type = machine_type_list[selection]['name']
         return self.gcp_machine_type
 
+    def gcp_instance_catalog(self) -> instance_catalog:
+        """Catalog of the machine types available in the zone"""
+        def query():
+            rows = []
+            gcp_client = cloud_clients.gcp('compute', 'v1', self.gcp_account_file)
+            request = gcp_client.machineTypes().list(project=self.gcp_project, zone=self.gcp_zone)
+            while request is not None:
+                response = request.execute()
+                for machine_type in response['items']:
+                    rows.append(self.gcp_machine_row(machine_type))
+                request = gcp_client.machineTypes().list_next(previous_request=request, previous_response=response)
+            return instance_catalog.from_rows(rows).to_dict()
+
+        return instance_catalog(self.gcp_inventory('catalog', 'machine_types', query, self.gcp_zone))
+
+    def gcp_machine_row(self, machine_type: dict) -> dict:
+        """Normalize a machine type, the network value is the default per VM egress limit of 2 Gbps per vCPU"""
+        vcpu = int(machine_type['guestCpus'])
+        return {
+            'name': machine_type['name'],
+            'vcpu': vcpu,
+            'mem': int(machine_type['memoryMb']) / 1024,
+            'arch': self.gcp_machine_arch(machine_type),
+            'net': float(min(2 * vcpu, GCP_MAX_EGRESS_GBPS)),
+            'storage': 'pd',
+            'hypervisor': 'kvm',
+            'burst': machine_type.get('isSharedCpu', False),
+            'description': machine_type['description'],
+        }
+
+    def gcp_image_arch(self):
+        """Architecture of the selected image, None if an image has not been selected"""
+        for image in (self.gcp_cb_image, self.gcp_market_image):
+            if isinstance(image, dict) and image.get('arch'):
+                return image['arch']
+        return None
+
+    @staticmethod
+    def gcp_machine_arch(machine_type: dict) -> str:
+        if machine_type.get('architecture'):
+            return machine_type['architecture'].lower()
+        if machine_type['name'].split('-')[0] in ARM64_MACHINE_FAMILIES:
+            return 'arm64'
+        return 'x86_64'
+
     def gcp_get_market_image_name(self, select=True, default=None, write=None) -> dict:
         """Select GCP image"""
         inquire = ask()
@@ -279,28 +330,18 @@ class gcp(object):
         if self.gcp_market_image:
             return self.gcp_market_image
 
-        credentials = service_account.Credentials.from_service_account_file(self.gcp_account_file)
-        gcp_client = googleapiclient.discovery.build('compute', 'v1', credentials=credentials)
+        with ThreadPoolExecutor(max_workers=len(project_list)) as executor:
+            for images in executor.map(self.gcp_market_images, project_list):
+                image_list.extend(images)
 
-        for project in project_list:
-            request = gcp_client.images().list(project=project)
-            while request is not None:
-                response = request.execute()
-                if "items" in response:
-                    for image in response['items']:
-                        if 'deprecated' in image:
-                            if (image['deprecated']['state'] == "DEPRECATED") or (image['deprecated']['state'] == "OBSOLETE"):
-                                continue
-                        image_block = {}
-                        image_block['name'] = image['name']
-                        image_block['date'] = image['creationTimestamp']
-                        image_block['project'] = project
-                        image_list.append(image_block)
-                    request = gcp_client.images().list_next(previous_request=request, previous_response=response)
-                else:
-                    raise GCPDriverError("No images exist")
+        if not image_list:
+            raise GCPDriverError("No images exist")
 
         if select:
+            search = inquire.ask_text('Image name search (prefix or words, * for all)', recommendation='*')
+            image_list = market_index.search(image_list, search.strip('*'), limit=MARKET_SEARCH_LIMIT)
+            if not image_list:
+                raise GCPDriverError(f"no images match {search}")
             selection = inquire.ask_list('GCP Image', image_list, default=default)
             self.gcp_market_image = image_list[selection]
             self.gcp_image_project = image_list[selection]['project']
@@ -309,6 +350,31 @@ class gcp(object):
 
         return self.gcp_market_image
 
+    def gcp_market_images(self, project: str) -> list[dict]:
+        """Get the current images of a public image project from the market image index"""
+        def query(since):
+            image_list = []
+            # creationTimestamp has the offset of the region that created the image, so start a day early to cover any offset
+            start = datetime.fromisoformat(since.replace('Z', '+00:00')) - timedelta(days=1) if since else market_index.cutoff()
+            created = start.strftime('%Y-%m-%dT%H:%M:%S.000Z')
+            gcp_client = cloud_clients.gcp('compute', 'v1', self.gcp_account_file)
+            request = gcp_client.images().list(project=project, filter=f'creationTimestamp > "{created}"')
+            while request is not None:
+                response = request.execute()
+                for image in response.get('items', []):
+                    if image.get('deprecated', {}).get('state') in ("DEPRECATED", "OBSOLETE"):
+                        continue
+                    image_block = {}
+                    image_block['name'] = image['name']
+                    image_block['date'] = datetime.fromisoformat(image['creationTimestamp']).astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.000Z')
+                    image_block['project'] = project
+                    image_block['arch'] = image.get('architecture', 'X86_64').lower()
+                    image_list.append(image_block)
+                request = gcp_client.images().list_next(previous_request=request, previous_response=response)
+            return image_list
+
+        return market_index().images(f"gcp:{project}", query)
+
     @prereq(requirements=('gcp_get_market_image_name',))
     def gcp_get_image_project(self, default=None, write=None) -> str:
         if write:
@@ -329,8 +395,43 @@ class gcp(object):
         if self.gcp_cb_image:
             return self.gcp_cb_image
 
-        credentials = service_account.Credentials.from_service_account_file(self.gcp_account_file)
-        gcp_client = googleapiclient.discovery.build('compute', 'v1', credentials=credentials)
+        if select:
+            image_list = [image for image in image_index().current(self.image_scope) if image.get('stage') != 'base']
+            if image_list:
+                selection = inquire.ask_list('GCP Couchbase Image', image_list, default=default)
+                if self.gcp_image_exists(image_list[selection]['name']):
+                    self.gcp_cb_image = image_list[selection]
+                    return self.gcp_cb_image
+                print(f"Image {image_list[selection]['name']} no longer exists, listing images again")
+
+        image_list = self.gcp_list_cb_images()
+
+        if select:
+            image_list = [image for image in image_list if image.get('stage') != 'base']
+            selection = inquire.ask_list('GCP Couchbase Image', image_list, default=default)
+            self.gcp_cb_image = image_list[selection]
+        else:
+            self.gcp_cb_image = image_list
+
+        return self.gcp_cb_image
+
+    @property
+    def image_scope(self) -> str:
+        return f"gcp:{self.gcp_project}"
+
+    def gcp_image_exists(self, name: str) -> bool:
+        gcp_client = cloud_clients.gcp('compute', 'v1', self.gcp_account_file)
+        try:
+            image = gcp_client.images().get(project=self.gcp_project, image=name).execute()
+        except Exception as err:
+            self.logger.info("Can not get image %s: %s" % (name, err))
+            return False
+        return image.get('status') == 'READY'
+
+    def gcp_list_cb_images(self) -> list[dict]:
+        image_list = []
+
+        gcp_client = cloud_clients.gcp('compute', 'v1', self.gcp_account_file)
         request = gcp_client.images().list(project=self.gcp_project)
         while request is not None:
             response = request.execute()
@@ -339,6 +440,7 @@ class gcp(object):
                     image_block = {}
                     image_block['name'] = image['name']
                     image_block['date'] = image['creationTimestamp']
+                    image_block['arch'] = image.get('architecture', 'X86_64').lower()
                     if 'labels' in image:
                         if 'type' in image['labels']:
                             image_block['type'] = image['labels']['type']
@@ -346,19 +448,21 @@ class gcp(object):
                             image_block['release'] = image['labels']['release']
                         if 'version' in image['labels']:
                             image_block['version'] = image_block['description'] = image['labels']['version'].replace("_", ".")
+                        if 'digest' in image['labels']:
+                            image_block['digest'] = image['labels']['digest']
+                        if 'stage' in image['labels']:
+                            image_block['stage'] = image['labels']['stage']
+                        if 'base' in image['labels']:
+                            image_block['base'] = image['labels']['base']
                     if 'type' not in image_block or 'release' not in image_block:
                         continue
                     image_list.append(image_block)
                 request = gcp_client.images().list_next(previous_request=request, previous_response=response)
             else:
                 raise GCPDriverError("No images exist in this project")
-        if select:
-            selection = inquire.ask_list('GCP Couchbase Image', image_list, default=default)
-            self.gcp_cb_image = image_list[selection]
-        else:
-            self.gcp_cb_image = image_list
 
-        return self.gcp_cb_image
+        image_index().refresh(self.image_scope, image_list)
+        return image_list
 
     @prereq(requirements=('gcp_get_cb_image_name',))
     def get_image(self):
@@ -368,16 +472,20 @@ class gcp(object):
     def get_market_image(self):
         return self.gcp_market_image
 
-    def gcp_delete_cb_image(self, name: str):
+    def gcp_delete_cb_image(self, name: str, confirm=True):
+        """Delete an image and wait for the delete operation to complete"""
         inquire = ask()
 
-        if inquire.ask_yn(f"Delete image {name}", default=True):
-            credentials = service_account.Credentials.from_service_account_file(self.gcp_account_file)
-            gcp_client = googleapiclient.discovery.build('compute', 'v1', credentials=credentials)
+        if not confirm or inquire.ask_yn(f"Delete image {name}", default=True):
+            gcp_client = cloud_clients.gcp('compute', 'v1', self.gcp_account_file)
             request = gcp_client.images().delete(project=self.gcp_project, image=name)
             response = request.execute()
+            while response.get('status') != 'DONE':
+                request = gcp_client.globalOperations().wait(project=self.gcp_project, operation=response['name'])
+                response = request.execute()
             if 'error' in response:
                 raise GCPDriverError(f"can not delete {name}: {response['error']['errors'][0]['message']}")
+            image_index().remove(self.image_scope, name)
 
     @prereq(requirements=('gcp_get_subnet',))
     def gcp_get_availability_zone_list(self) -> list[dict]:
@@ -394,7 +502,6 @@ class gcp(object):
     def gcp_get_subnet(self, default=None, write=None) -> str:
         """Get GCP subnet"""
         inquire = ask()
-        subnet_list = []
 
         if write:
             self.gcp_subnet = write
@@ -403,14 +510,18 @@ class gcp(object):
         if self.gcp_subnet:
             return self.gcp_subnet
 
-        credentials = service_account.Credentials.from_service_account_file(self.gcp_account_file)
-        gcp_client = googleapiclient.discovery.build('compute', 'v1', credentials=credentials)
-        request = gcp_client.subnetworks().list(project=self.gcp_project, region=self.gcp_region)
-        while request is not None:
-            response = request.execute()
-            for subnet in response['items']:
-                subnet_list.append(subnet['name'])
-            request = gcp_client.subnetworks().list_next(previous_request=request, previous_response=response)
+        def query():
+            subnetworks = []
+            gcp_client = cloud_clients.gcp('compute', 'v1', self.gcp_account_file)
+            request = gcp_client.subnetworks().list(project=self.gcp_project, region=self.gcp_region)
+            while request is not None:
+                response = request.execute()
+                for subnet in response['items']:
+                    subnetworks.append(subnet['name'])
+                request = gcp_client.subnetworks().list_next(previous_request=request, previous_response=response)
+            return subnetworks
+
+        subnet_list = self.gcp_inventory('network', 'subnetworks', query)
         selection = inquire.ask_list('GCP Subnet', subnet_list, default=default)
         self.gcp_subnet = subnet_list[selection]
         return self.gcp_subnet
@@ -471,23 +582,28 @@ class gcp(object):
             self.gcp_region = os.environ['GCP_DEFAULT_REGION']
             return os.environ['GCP_DEFAULT_REGION']
 
+        def query():
+            regions = []
+            gcp_client = cloud_clients.gcp('compute', 'v1', self.gcp_account_file)
+            request = gcp_client.regions().list(project=self.gcp_project)
+            while request is not None:
+                response = request.execute()
+                for region in response['items']:
+                    regions.append(region['name'])
+                request = gcp_client.regions().list_next(previous_request=request, previous_response=response)
+            return regions
+
         region_list = []
         current_location = tb.get_country()
-        credentials = service_account.Credentials.from_service_account_file(self.gcp_account_file)
-        gcp_client = googleapiclient.discovery.build('compute', 'v1', credentials=credentials)
-        request = gcp_client.regions().list(project=self.gcp_project)
-        while request is not None:
-            response = request.execute()
-            for region in response['items']:
-                if current_location:
-                    if current_location.lower() == 'us':
-                        if not region['name'].startswith('us'):
-                            continue
-                    else:
-                        if region['name'].startswith('us'):
-                            continue
-                region_list.append(region['name'])
-            request = gcp_client.regions().list_next(previous_request=request, previous_response=response)
+        for region in self.gcp_inventory('account', 'regions', query):
+            if current_location:
+                if current_location.lower() == 'us':
+                    if not region.startswith('us'):
+                        continue
+                else:
+                    if region.startswith('us'):
+                        continue
+            region_list.append(region)
         selection = inquire.ask_list('GCP Region', region_list, default=default)
         self.gcp_region = region_list[selection]
         return self.gcp_region
@@ -0,0 +1,247 @@
+##
+##
+
+import logging
+import threading
+import subprocess
+import hashlib
+import json
+import re
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from lib.location import location
+from lib.inventory import inventory_cache
+from lib.constants import IMAGE_INDEX_TTL, MARKET_INDEX_TTL, MARKET_INDEX_FULL_TTL, MARKET_IMAGE_MAX_AGE
+
+VOLATILE_VARS = [
+    'build_password',
+    'build_password_encrypted',
+    'vsphere_password',
+    'gcp_account_file',
+]
+DIGEST_LENGTH = 32
+
+
+class image_digest(object):
+    """Digest of the inputs that determine the content of an image build"""
+    _repo_heads = {}
+    _lock = threading.Lock()
+
+    def __init__(self, var_file: str, packer_file: str, exclude=(), extra=None):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.var_file = var_file
+        self.packer_file = packer_file
+        self.exclude = exclude
+        self.extra = extra if extra else {}
+
+    def read_vars(self) -> dict:
+        variables = {}
+
+        with open(self.var_file, 'r') as var_file:
+            for line in var_file:
+                match = re.match(r'^\s*([A-Za-z0-9_]+)\s*=\s*(.*?)\s*$', line)
+                if match and match.group(1) not in VOLATILE_VARS and match.group(1) not in self.exclude:
+                    variables[match.group(1)] = match.group(2).strip('"')
+
+        variables.update(self.extra)
+        return variables
+
+    @classmethod
+    def repo_head(cls, repo: str):
+        """Get the commit at the head of a GitHub repo, returns None if it can not be determined"""
+        with cls._lock:
+            if repo not in cls._repo_heads:
+                try:
+                    result = subprocess.run(['git', 'ls-remote', f"https://github.com/{repo}", 'HEAD'], capture_output=True, timeout=30)
+                    output = result.stdout.decode('utf-8').split()
+                    cls._repo_heads[repo] = output[0] if result.returncode == 0 and output else None
+                except (OSError, subprocess.SubprocessError):
+                    cls._repo_heads[repo] = None
+            return cls._repo_heads[repo]
+
+    def compute(self) -> str:
+        digest = hashlib.sha256()
+        variables = self.read_vars()
+
+        for key in sorted(variables):
+            digest.update(f"{key}={variables[key]}\n".encode('utf-8'))
+
+        with open(self.packer_file, 'rb') as packer_file:
+            digest.update(packer_file.read())
+
+        if variables.get('host_prep_repo'):
+            head = image_digest.repo_head(variables['host_prep_repo'])
+            if head:
+                digest.update(head.encode('utf-8'))
+            else:
+                self.logger.info("Can not get head commit of %s" % variables['host_prep_repo'])
+
+        return digest.hexdigest()[:DIGEST_LENGTH]
+
+
+class image_index(object):
+    """Local index of Couchbase images by cloud scope (region, project, resource group or vCenter)"""
+    _lock = threading.Lock()
+    _refreshed = set()
+
+    def __init__(self):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.lc = location()
+        self.index_file = self.lc.image_index
+
+    def read(self) -> dict:
+        if not os.path.exists(self.index_file):
+            return {}
+
+        try:
+            with open(self.index_file, 'r') as index_file:
+                return json.load(index_file)
+        except (OSError, ValueError) as err:
+            self.logger.info("Can not read image index %s: %s" % (self.index_file, err))
+            return {}
+
+    def write(self, index: dict):
+        try:
+            with open(self.index_file, 'w') as index_file:
+                json.dump(index, index_file, indent=2, default=str)
+                index_file.write("\n")
+        except OSError as err:
+            self.logger.info("Can not write image index %s: %s" % (self.index_file, err))
+
+    def images(self, scope: str) -> list[dict]:
+        return self.read().get(scope, [])
+
+    def current(self, scope: str) -> list[dict]:
+        """Indexed images of a scope listed from the cloud within the TTL, empty if the scope has to be listed again"""
+        if inventory_cache.refresh and scope not in image_index._refreshed:
+            return []
+
+        index = self.read()
+        if time.time() - index.get('refreshed', {}).get(scope, 0) >= IMAGE_INDEX_TTL:
+            return []
+
+        return index.get(scope, [])
+
+    def find(self, scope: str, digest: str):
+        for image in self.images(scope):
+            if image.get('digest') == digest:
+                return image
+        return None
+
+    def refresh(self, scope: str, image_list: list[dict]):
+        with image_index._lock:
+            index = self.read()
+            index[scope] = image_list
+            index.setdefault('refreshed', {})[scope] = time.time()
+            self.write(index)
+            image_index._refreshed.add(scope)
+
+    def add(self, scope: str, image: dict):
+        with image_index._lock:
+            index = self.read()
+            image_list = [item for item in index.get(scope, []) if item.get('name') != image.get('name')]
+            image_list.append(image)
+            index[scope] = image_list
+            self.write(index)
+
+    def update(self, scope: str, name: str, values: dict):
+        with image_index._lock:
+            index = self.read()
+            for item in index.get(scope, []):
+                if item.get('name') == name:
+                    item.update(values)
+            self.write(index)
+
+    def remove(self, scope: str, name: str):
+        with image_index._lock:
+            index = self.read()
+            index[scope] = [item for item in index.get(scope, []) if item.get('name') != name]
+            self.write(index)
+
+
+class market_index(object):
+    """Local index of public (marketplace) images by owner and region, refreshed incrementally"""
+    _lock = threading.Lock()
+    _refreshed = set()
+
+    def __init__(self):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.lc = location()
+        self.index_file = self.lc.market_index
+
+    def read(self) -> dict:
+        if not os.path.exists(self.index_file):
+            return {}
+
+        try:
+            with open(self.index_file, 'r') as index_file:
+                return json.load(index_file)
+        except (OSError, ValueError) as err:
+            self.logger.info("Can not read market image index %s: %s" % (self.index_file, err))
+            return {}
+
+    def write(self, index: dict):
+        try:
+            os.makedirs(os.path.dirname(self.index_file), exist_ok=True)
+            # replace the file so a reader without the lock never sees a partly written index
+            temp_fd, temp_name = tempfile.mkstemp(dir=os.path.dirname(self.index_file), suffix='.tmp')
+            with os.fdopen(temp_fd, 'w') as index_file:
+                json.dump(index, index_file)
+            os.replace(temp_name, self.index_file)
+        except OSError as err:
+            self.logger.info("Can not write market image index %s: %s" % (self.index_file, err))
+
+    @staticmethod
+    def cutoff() -> datetime:
+        """Images older than this are not indexed"""
+        return datetime.now(timezone.utc) - timedelta(days=MARKET_IMAGE_MAX_AGE)
+
+    def images(self, scope: str, query) -> list[dict]:
+        """Get the indexed images of a scope, where query(since) returns the images created after since (UTC ISO date or None for all)"""
+        now = time.time()
+        entry = self.read().get(scope)
+        full_refresh = inventory_cache.refresh and scope not in market_index._refreshed
+
+        if entry and not full_refresh and now - entry['full'] < MARKET_INDEX_FULL_TTL:
+            if now - entry['time'] < MARKET_INDEX_TTL:
+                return entry['images']
+            self.logger.info("Updating market image index %s from %s" % (scope, entry['newest']))
+            images = {image['name']: image for image in entry['images']}
+            for image in query(entry['newest']):
+                images[image['name']] = image
+            image_list = list(images.values())
+            full_time = entry['full']
+        else:
+            self.logger.info("Building market image index %s" % scope)
+            image_list = query(None)
+            full_time = now
+
+        newest = max([image['date'] for image in image_list], default=None)
+        with market_index._lock:
+            index = self.read()
+            index[scope] = {'time': now, 'full': full_time, 'newest': newest, 'images': image_list}
+            self.write(index)
+            market_index._refreshed.add(scope)
+
+        return image_list
+
+    @staticmethod
+    def search(image_list: list[dict], text: str, field='name', limit=None) -> list[dict]:
+        """Images whose field contains every word of the text, names that start with the first word first and newest first within each group"""
+        words = text.lower().split() if text else []
+        prefix = []
+        substring = []
+
+        for image in image_list:
+            value = image.get(field, '').lower()
+            if not all(word in value for word in words):
+                continue
+            if words and value.startswith(words[0]):
+                prefix.append(image)
+            else:
+                substring.append(image)
+
+        ranked = sorted(prefix, key=lambda item: item['date'], reverse=True) + sorted(substring, key=lambda item: item['date'], reverse=True)
+        return ranked[:limit] if limit else ranked
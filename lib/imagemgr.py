@@ -1,6 +1,8 @@
 ##
 ##
 
+import os
+import re
 from datetime import datetime
 from lib.exceptions import *
 from lib.ask import ask
@@ -14,6 +16,9 @@ from lib.varfile import varfile
 from lib.cbrelmgr import cbrelease
 from lib.ssh import ssh
 from lib.toolbox import toolbox
+from lib.scheduler import phase_scheduler
+from lib.imagecache import image_digest, image_index
+from lib.constants import FSR_HOURLY_COST
 from lib import invoke
 
 
@@ -24,10 +29,20 @@ class image_manager(object):
         self.args = parameters
         self.lc = location()
         self.packer_template_file = 'linux.pkrvars.template'
-        self.lc.set_cloud(self.cloud)
+        if self.cloud == 'all':
+            if not parameters.list and not parameters.prune:
+                raise ImageMgmtError("cloud all is only supported when listing or pruning images")
+        else:
+            self.lc.set_cloud(self.cloud)
+
+    @property
+    def clouds(self) -> list[str]:
+        return list(self.lc.cloud_list) if self.cloud == 'all' else [self.cloud]
 
     def list_images(self):
-        if self.cloud == 'aws':
+        if self.cloud == 'all':
+            self.list_all()
+        elif self.cloud == 'aws':
             self.aws_list()
         elif self.cloud == 'gcp':
             self.gcp_list()
@@ -50,40 +65,282 @@ class image_manager(object):
         else:
             raise ImageMgmtError(f"unknown cloud {self.cloud}")
 
-    def build_images(self):
+    def list_all(self):
+        inquire = ask()
+
+        for cloud, (driver, image_list) in self.query_images().items():
+            print("")
+            inquire.ask_list(f"{cloud.upper()} Image List", image_list, list_only=True)
+
+    def prune_images(self):
+        """Delete images superseded by the newest builds of each OS release and Couchbase version"""
+        inquire = ask()
+
+        if self.args.keep < 1:
+            raise ImageMgmtError("at least one image of each version must be kept (--keep)")
+
+        candidates = []
+        for cloud, (driver, image_list) in self.query_images().items():
+            for image in self.prune_candidates(image_list, self.args.keep):
+                candidates.append((cloud, driver, image))
+
+        if not candidates:
+            print(f"No images older than the newest {self.args.keep} of each version")
+            return
+
+        print("")
+        print("Cloud   Image                                     OS                Version")
+        for cloud, driver, image in candidates:
+            print(f"{cloud:<8}{image['name']:<42}{image['type'] + ' ' + image['release']:<18}{image.get('version', '')}")
+
+        if not inquire.ask_yn(f"Delete {len(candidates)} image(s)", default=False):
+            return
+
+        scheduler = phase_scheduler('image prune', workers=self.args.workers, fail_fast=False)
+        for cloud, driver, image in candidates:
+            scheduler.add_phase(f"{cloud}:{image['name']}", self.delete_phase, driver, image['name'])
+
+        print("")
+        if not scheduler.run():
+            raise ImageMgmtError("one or more image deletes failed")
+
+    @staticmethod
+    def image_time(image: dict) -> float:
+        """Creation time of an image, falling back to the timestamp in the image name"""
+        if image.get('datetime'):
+            return image['datetime'].timestamp()
+        match = re.search(r'(\d{4}-\d{2}-\d{2}-\d{4})$', image['name'])
+        if match:
+            return datetime.strptime(match.group(1), '%Y-%m-%d-%H%M').timestamp()
+        return 0.0
+
+    def prune_candidates(self, image_list: list[dict], keep: int) -> list[dict]:
+        """Images with at least keep newer builds of the same OS release, version, stage and architecture"""
+        groups = {}
+        retained = set()
+        candidates = []
+
+        for image in image_list:
+            key = (image['type'], image['release'], image.get('version'), image.get('stage') == 'base', image.get('arch', 'x86_64'))
+            groups.setdefault(key, []).append(image)
+
+        for group in groups.values():
+            group = sorted(group, key=self.image_time, reverse=True)
+            retained.update([image['name'] for image in group[:keep]])
+            candidates.extend(group[keep:])
+
+        in_use = set([image['base'] for image in image_list if image['name'] in retained and image.get('base')])
+        return [image for image in candidates if image['name'] not in in_use]
+
+    def query_images(self) -> dict:
+        """Initialize the driver for each cloud, then get the image lists from all clouds concurrently"""
+        results = {}
+        drivers = {}
+
+        for cloud in self.clouds:
+            print(f"Initializing {cloud}")
+            drivers[cloud] = self.get_driver(cloud)
+
+        if len(drivers) == 1:
+            cloud, driver = next(iter(drivers.items()))
+            results[cloud] = (driver, self.cloud_images(driver))
+            return results
+
+        scheduler = phase_scheduler('image list', fail_fast=False)
+        for cloud, driver in drivers.items():
+            scheduler.add_phase(cloud, self.list_phase, driver, results)
+
+        print("")
+        if not scheduler.run():
+            raise ImageMgmtError("can not get images from one or more clouds")
+
+        return {cloud: results[cloud] for cloud in drivers}
+
+    def list_phase(self, phase, driver, results: dict) -> str:
+        image_list = self.cloud_images(driver)
+        results[phase.name] = (driver, image_list)
+        return f"{len(image_list)} images"
+
+    def delete_phase(self, phase, driver, name: str) -> str:
+        if isinstance(driver, aws):
+            driver.aws_remove_ami(name, confirm=False)
+        elif isinstance(driver, gcp):
+            driver.gcp_delete_cb_image(name, confirm=False)
+        elif isinstance(driver, azure):
+            driver.azure_delete_image(name, confirm=False)
+        elif isinstance(driver, vmware):
+            driver.vmware_delete_template(name, confirm=False)
+        else:
+            raise ImageMgmtError(f"unknown driver {driver.__class__.__name__}")
+        return "deleted"
+
+    def cloud_images(self, driver) -> list[dict]:
+        if isinstance(driver, aws):
+            return self._aws_list(_driver=driver)
+        elif isinstance(driver, gcp):
+            return self._gcp_list(_driver=driver)
+        elif isinstance(driver, azure):
+            return self._azure_list(_driver=driver)
+        elif isinstance(driver, vmware):
+            return self._vmware_list(_driver=driver)
+        else:
+            raise ImageMgmtError(f"unknown driver {driver.__class__.__name__}")
+
+    def replicate_images(self):
+        if not self.args.regions:
+            raise ImageMgmtError("replicate requires one or more target regions (--regions)")
+
+        if self.cloud == 'aws':
+            self.aws_replicate(image=self.args.image)
+        elif self.cloud == 'gcp':
+            print("GCP images are global resources and can be used in any region, no copy is required")
+        elif self.cloud == 'azure':
+            raise ImageMgmtError("image replication is not supported for azure, deployments use managed images which can only be replicated as shared image gallery versions")
+        elif self.cloud == 'vmware':
+            raise ImageMgmtError("image replication is not supported for vmware")
+        else:
+            raise ImageMgmtError(f"unknown cloud {self.cloud}")
+
+    def fast_restore(self):
         if self.cloud == 'aws':
+            self.aws_fast_restore(image=self.args.image)
+        elif self.cloud in ('gcp', 'azure', 'vmware'):
+            raise ImageMgmtError(f"fast snapshot restore is an AWS feature, {self.cloud} images have no equivalent setting")
+        else:
+            raise ImageMgmtError(f"unknown cloud {self.cloud}")
+
+    def get_driver(self, cloud: str):
+        if cloud == 'aws':
             driver = aws()
             driver.aws_init()
-        elif self.cloud == 'gcp':
+        elif cloud == 'gcp':
             driver = gcp()
             driver.gcp_init()
             driver.gcp_prep(select=False)
-        elif self.cloud == 'azure':
+        elif cloud == 'azure':
             driver = azure()
             driver.azure_init()
             driver.azure_prep()
-        elif self.cloud == 'vmware':
+        elif cloud == 'vmware':
             driver = vmware()
             driver.vmware_init()
         else:
-            raise ImageMgmtError(f"unknown cloud {self.cloud}")
-
+            raise ImageMgmtError(f"unknown cloud {cloud}")
+        return driver
+
+    def driver_images(self, driver) -> list[dict]:
+        if isinstance(driver, aws):
+            return driver.aws_list_images()
+        elif isinstance(driver, gcp):
+            return driver.gcp_list_cb_images()
+        elif isinstance(driver, azure):
+            return driver.azure_list_images()
+        elif isinstance(driver, vmware):
+            return driver.vmware_list_templates()
+        else:
+            raise ImageMgmtError(f"unknown driver {driver.__class__.__name__}")
+
+    def image_exists(self, driver, name: str) -> bool:
+        if isinstance(driver, aws):
+            return driver.aws_image_exists(name)
+        elif isinstance(driver, gcp):
+            return driver.gcp_image_exists(name)
+        elif isinstance(driver, azure):
+            return driver.azure_image_exists(name)
+        elif isinstance(driver, vmware):
+            return driver.vmware_template_exists(name)
+        else:
+            raise ImageMgmtError(f"unknown driver {driver.__class__.__name__}")
+
+    def find_image(self, driver, digest: str):
+        """Find an image built from the same inputs, checking the local index before the cloud API"""
+        index = image_index()
+
+        if self.args.rebuild:
+            return None
+
+        for image in index.current(driver.image_scope):
+            if image.get('digest') != digest:
+                continue
+            if self.image_exists(driver, image['name']):
+                return image
+            index.remove(driver.image_scope, image['name'])
+            break
+
+        self.driver_images(driver)
+        return index.find(driver.image_scope, digest)
+
+    def record_image(self, driver, artifacts: list, linux_type: str, linux_release: str, cb_version: str, digest: str, stage=None, base=None):
+        if not artifacts or not artifacts[0].image_id:
+            return
+        image = {
+            'name': artifacts[0].image_id,
+            'description': cb_version,
+            'type': linux_type,
+            'release': linux_release,
+            'version': cb_version,
+            'digest': digest,
+            'arch': self.args.arch,
+        }
+        if stage:
+            image['stage'] = stage
+        if base:
+            image['base'] = base
+        image_index().add(driver.image_scope, image)
+
+    @staticmethod
+    def notify(message: str, phase=None):
+        if phase:
+            phase.update(message)
+        else:
+            print(message)
+
+    def base_digest(self, var_file: str, hcl_file: str) -> str:
+        return image_digest(var_file, hcl_file, exclude=('cb_version',), extra={'build_stage': 'base'}).compute()
+
+    def layer_digest(self, var_file: str, layer_file: str, base: str) -> str:
+        return image_digest(var_file, layer_file, extra={'base_image': base}).compute()
+
+    def build_base(self, driver, packer_dir, log_dir, var_file, hcl_file, build_info, phase=None) -> str:
+        """Get or build the OS base image for a (cloud, os, release)"""
+        os_name, os_release, cb_version = build_info
+        digest = self.base_digest(var_file, hcl_file)
+
+        image = self.find_image(driver, digest)
+        if image:
+            self.notify(f"Using base image {image['name']}", phase)
+            return image['name']
+
+        self.notify(f"Building {os_name} {os_release} base image", phase)
+        pr = invoke.packer_run(working_dir=packer_dir, log_dir=log_dir, phase=phase)
+        artifacts = pr.build(var_file, hcl_file, variables={'build_digest': digest, 'build_stage': 'base'})
+        if not artifacts or not artifacts[0].image_id:
+            raise ImageMgmtError(f"base image build for {os_name} {os_release} did not return an image")
+        self.record_image(driver, artifacts, os_name, os_release, 'base', digest, stage='base')
+        return artifacts[0].image_id
+
+    def build_layer(self, driver, packer_dir, log_dir, var_file, layer_file, base, build_info, phase=None) -> list:
+        """Build the Couchbase layer on top of a base image"""
+        os_name, os_release, cb_version = build_info
+        digest = self.layer_digest(var_file, layer_file, base)
+
+        image = self.find_image(driver, digest)
+        if image:
+            self.notify(f"Image {image['name']} was built from the same inputs, skipping build", phase)
+            return [image['name']]
+
+        self.notify(f"Building Couchbase {cb_version} layer on {base}", phase)
+        pr = invoke.packer_run(working_dir=packer_dir, log_dir=log_dir, phase=phase)
+        artifacts = pr.build(var_file, layer_file, variables={'build_digest': digest, 'base_image': base})
+        self.record_image(driver, artifacts, os_name, os_release, cb_version, digest, stage='couchbase', base=base)
+        return [image_id for artifact in artifacts for image_id in artifact.image_ids]
+
+    def write_var_file(self, driver, v: varfile, c: cbrelease, packer_dir: str, var_file: str):
         t = template()
-        v = varfile()
-        c = cbrelease()
         s = ssh()
         b = toolbox()
         build_variables = []
-
-        v.set_cloud(self.cloud)
-        linux_type = v.get_linux_type()
-        linux_release = v.get_linux_release()
-        c.set_os_name(linux_type)
-        c.set_os_ver(linux_release)
-
-        var_file = self.lc.packer_dir + '/' + v.get_var_file()
-        hcl_file = self.lc.packer_dir + '/' + v.get_hcl_file()
-        template_file = self.lc.packer_dir + '/' + self.packer_template_file
+        template_file = packer_dir + '/' + self.packer_template_file
 
         try:
             t.read_file(template_file)
@@ -104,23 +361,209 @@ class image_manager(object):
             pass_variables = t.process_vars(driver, requested_vars, driver.VARIABLES)
             build_variables = build_variables + pass_variables
         except Exception as err:
-            ImageMgmtError(f"can not process packer template {template_file}: {err}")
-
-        print("Writing packer variables")
+            raise ImageMgmtError(f"can not process packer template {template_file}: {err}")
 
         try:
             t.process_template(build_variables)
             t.write_file(var_file)
         except Exception as err:
-            ImageMgmtError(f"can not write packer variables {var_file}: {err}")
+            raise ImageMgmtError(f"can not write packer variables {var_file}: {err}")
+
+    def check_arch(self, cloud: str):
+        if self.args.arch != 'x86_64' and cloud not in ('aws', 'gcp'):
+            raise ImageMgmtError(f"{self.args.arch} images are not supported for {cloud}")
+
+    def build_images(self):
+        if self.args.matrix:
+            return self.build_matrix()
+
+        self.check_arch(self.cloud)
+        driver = self.get_driver(self.cloud)
+        v = varfile()
+        c = cbrelease()
+
+        v.set_cloud(self.cloud)
+        v.set_arch(self.args.arch)
+        c.set_arch(self.args.arch)
+        linux_type = v.get_linux_type()
+        linux_release = v.get_linux_release()
+        c.set_os_name(linux_type)
+        c.set_os_ver(linux_release)
+
+        var_file = self.lc.packer_dir + '/' + v.get_var_file()
+        hcl_file = self.lc.packer_dir + '/' + v.get_hcl_file()
+
+        print("Writing packer variables")
+        self.write_var_file(driver, v, c, self.lc.packer_dir, var_file)
+
+        if self.args.layered:
+            layer_file = self.lc.packer_dir + '/' + v.get_layer_file()
+            build_info = (linux_type, linux_release, c.cb_version)
+            try:
+                base = self.build_base(driver, self.lc.packer_dir, self.lc.packer_dir, var_file, hcl_file, build_info)
+                image_list = self.build_layer(driver, self.lc.packer_dir, self.lc.packer_dir, var_file, layer_file, base, build_info)
+            except ImageMgmtError:
+                raise
+            except Exception as err:
+                raise ImageMgmtError(f"can not build image: {err}")
+            print(f"Image {', '.join(image_list)}")
+            return
+
+        digest = image_digest(var_file, hcl_file).compute()
+        image = self.find_image(driver, digest)
+        if image:
+            print(f"Image {image['name']} was built from the same inputs, skipping build (use --rebuild to build anyway)")
+            return
 
         print("Building image")
 
         try:
             pr = invoke.packer_run(working_dir=self.lc.packer_dir)
-            pr.build(var_file, hcl_file)
+            artifacts = pr.build(var_file, hcl_file, variables={'build_digest': digest})
         except Exception as err:
-            ImageMgmtError(f"can not build image: {err}")
+            raise ImageMgmtError(f"can not build image: {err}")
+
+        self.record_image(driver, artifacts, linux_type, linux_release, c.cb_version, digest)
+        for artifact in artifacts:
+            print(f"Created image {', '.join(artifact.image_ids)}")
+
+    def expand_matrix(self, specs: list) -> list[tuple]:
+        """Expand cloud:os:release:cb_version specs, where os and release may be omitted or all"""
+        builds = []
+
+        for spec in specs:
+            fields = spec.split(':')
+            if len(fields) > 4 or fields[0] not in self.lc.cloud_list:
+                raise ImageMgmtError(f"invalid build spec {spec}, expecting cloud[:os[:release[:cb_version]]]")
+            fields = fields + ['all'] * (3 - len(fields)) + ['latest'] * (4 - max(len(fields), 3))
+            cloud, os_name, os_release, cb_version = fields
+
+            v = varfile()
+            v.set_cloud(cloud)
+            os_list = v.get_all_os() if os_name == 'all' else [os_name]
+            for os_item in os_list:
+                v.set_os_name(os_item)
+                release_list = v.get_all_version() if os_release == 'all' else [os_release]
+                for release in release_list:
+                    build = (cloud, os_item, release, cb_version)
+                    if build not in builds:
+                        builds.append(build)
+
+        return builds
+
+    def build_matrix(self):
+        drivers = {}
+        scheduler = phase_scheduler('image build', workers=self.args.workers, fail_fast=False)
+
+        builds = self.expand_matrix(self.args.matrix)
+        print(f"Preparing {len(builds)} image build(s)")
+
+        for cloud, os_name, os_release, cb_version in builds:
+            if cloud not in drivers:
+                self.check_arch(cloud)
+                print(f"Initializing {cloud}")
+                drivers[cloud] = self.get_driver(cloud)
+
+            v = varfile()
+            c = cbrelease()
+            v.set_cloud(cloud)
+            v.set_os_name(os_name)
+            v.set_os_ver(os_release)
+            v.set_arch(self.args.arch)
+            c.set_os_name(os_name)
+            c.set_os_ver(os_release)
+            c.set_arch(self.args.arch)
+
+            if not v.get_hcl_file():
+                raise ImageMgmtError(f"{os_name} {os_release} is not available for {cloud}")
+
+            if cb_version == 'latest':
+                versions_list = c.get_versions()
+                if not versions_list:
+                    raise ImageMgmtError(f"can not get Couchbase versions for {os_name} {os_release}")
+                cb_version = sorted(versions_list, reverse=True)[0]
+            c.get_cb_version(write=cb_version)
+
+            build_name = f"{cloud}-{os_name}-{os_release}-{cb_version}" + (f"-{self.args.arch}" if self.args.arch != 'x86_64' else "")
+            packer_dir = self.lc.get_packer(cloud)
+            build_dir = packer_dir + '/build/' + build_name
+            var_file = build_dir + '/' + v.get_var_file()
+            hcl_file = packer_dir + '/' + v.get_hcl_file()
+
+            try:
+                os.makedirs(build_dir, exist_ok=True)
+            except OSError as err:
+                raise ImageMgmtError(f"can not create build directory {build_dir}: {err}")
+
+            self.write_var_file(drivers[cloud], v, c, packer_dir, var_file)
+
+            if self.args.layered:
+                self.add_layer_phases(scheduler, drivers[cloud], packer_dir, build_name, build_dir, var_file, hcl_file,
+                                      packer_dir + '/' + v.get_layer_file(), (os_name, os_release, cb_version))
+                continue
+
+            digest = image_digest(var_file, hcl_file).compute()
+            image = self.find_image(drivers[cloud], digest)
+            if image:
+                print(f"Image {image['name']} matches {build_name}, skipping build")
+                continue
+
+            scheduler.add_phase(build_name, self.build_phase, drivers[cloud], packer_dir, build_dir, var_file, hcl_file,
+                                (os_name, os_release, cb_version, digest), log_dir=build_dir, log_name='build.log')
+
+        if not scheduler.phases:
+            print("All images are up to date")
+            return
+
+        print("")
+        if not scheduler.run():
+            raise ImageMgmtError("one or more image builds failed (see build logs for details)")
+
+    def add_layer_phases(self, scheduler, driver, packer_dir, build_name, build_dir, var_file, hcl_file, layer_file, build_info):
+        """Schedule a Couchbase layer build and the shared base image build it depends on"""
+        os_name, os_release, cb_version = build_info
+        base_name = f"{driver.image_scope.split(':')[0]}-{os_name}-{os_release}-base" + (f"-{self.args.arch}" if self.args.arch != 'x86_64' else "")
+        depends = ()
+
+        base = self.find_image(driver, self.base_digest(var_file, hcl_file))
+        if base:
+            image = self.find_image(driver, self.layer_digest(var_file, layer_file, base['name']))
+            if image:
+                print(f"Image {image['name']} matches {build_name}, skipping build")
+                return
+        elif base_name in scheduler.phases:
+            depends = (base_name,)
+        else:
+            base_dir = packer_dir + '/build/' + base_name
+            try:
+                os.makedirs(base_dir, exist_ok=True)
+            except OSError as err:
+                raise ImageMgmtError(f"can not create build directory {base_dir}: {err}")
+            scheduler.add_phase(base_name, self.base_phase, driver, packer_dir, base_dir, var_file, hcl_file, build_info,
+                                log_dir=base_dir, log_name='build.log')
+            depends = (base_name,)
+
+        scheduler.add_phase(build_name, self.layer_phase, driver, packer_dir, build_dir, var_file, hcl_file, layer_file, build_info,
+                            depends=depends, log_dir=build_dir, log_name='build.log')
+
+    def base_phase(self, phase, driver, packer_dir, build_dir, var_file, hcl_file, build_info):
+        return self.build_base(driver, packer_dir, build_dir, var_file, hcl_file, build_info, phase=phase)
+
+    def layer_phase(self, phase, driver, packer_dir, build_dir, var_file, hcl_file, layer_file, build_info):
+        digest = self.base_digest(var_file, hcl_file)
+        # the base phase has just built or checked the base image, use the most recently indexed one
+        candidates = [image for image in image_index().images(driver.image_scope) if image.get('digest') == digest]
+        base = next((image for image in reversed(candidates) if self.image_exists(driver, image['name'])), None)
+        if not base:
+            raise ImageMgmtError(f"base image for {build_info[0]} {build_info[1]} not found")
+        return self.build_layer(driver, packer_dir, build_dir, var_file, layer_file, base['name'], build_info, phase=phase)
+
+    def build_phase(self, phase, driver, packer_dir, build_dir, var_file, hcl_file, build_info):
+        os_name, os_release, cb_version, digest = build_info
+        pr = invoke.packer_run(working_dir=packer_dir, log_dir=build_dir, phase=phase)
+        artifacts = pr.build(var_file, hcl_file, variables={'build_digest': digest})
+        self.record_image(driver, artifacts, os_name, os_release, cb_version, digest)
+        return [image_id for artifact in artifacts for image_id in artifact.image_ids]
 
     def _aws_list(self, _driver=None) -> list[dict]:
         if not _driver:
@@ -157,6 +600,75 @@ class image_manager(object):
         else:
             driver.aws_remove_ami(image)
 
+    def aws_replicate(self, image=None):
+        inquire = ask()
+        driver = aws()
+        driver.aws_init()
+
+        if not image:
+            image_list = self._aws_list(_driver=driver)
+            selection = inquire.ask_list('AMI', image_list)
+            image = image_list[selection]['name']
+
+        regions = [region for region in self.args.regions if region != driver.aws_region]
+        if not regions:
+            print(f"Image {image} is already in {driver.aws_region}")
+            return
+
+        scheduler = phase_scheduler('image replication', workers=len(regions), fail_fast=False)
+        for region in regions:
+            scheduler.add_phase(region, self.aws_copy_phase, driver, image)
+
+        print(f"Copying {image} from {driver.aws_region} to {', '.join(regions)}")
+        if not scheduler.run():
+            raise ImageMgmtError("one or more image copies failed")
+
+    def aws_copy_phase(self, phase, driver, image):
+        image_block = driver.aws_copy_ami(image, phase.name, status=phase.update, cancelled=lambda: phase.cancelled)
+        if not image_block:
+            raise PhaseCancelled(f"copy to {phase.name} cancelled")
+        return image_block['name']
+
+    def aws_fast_restore(self, image=None):
+        inquire = ask()
+        driver = aws()
+        driver.aws_init()
+
+        if not image:
+            image_list = self._aws_list(_driver=driver)
+            selection = inquire.ask_list('AMI', image_list)
+            image = image_list[selection]['name']
+
+        if self.args.fsr == 'enable':
+            if not self.args.zones:
+                raise ImageMgmtError("enabling fast snapshot restore requires one or more availability zones (--zones)")
+            try:
+                snapshots = driver.aws_enable_fsr(image, self.args.zones)
+            finally:
+                image_index().update(driver.image_scope, image, {'fsr': driver.aws_fsr_zones(image), 'fsr_enabled': datetime.now().isoformat(timespec='seconds')})
+            hourly_cost = len(snapshots) * len(self.args.zones) * FSR_HOURLY_COST
+            print(f"Enabled fast snapshot restore for {image} in {', '.join(self.args.zones)}")
+            print(f"Estimated cost ${hourly_cost:.2f} per hour (${hourly_cost * 24 * 30:.2f} per month) until disabled")
+        elif self.args.fsr == 'disable':
+            driver.aws_disable_fsr(image, self.args.zones)
+            image_index().update(driver.image_scope, image, {'fsr': driver.aws_fsr_zones(image)})
+            print(f"Disabled fast snapshot restore for {image}" + (f" in {', '.join(self.args.zones)}" if self.args.zones else ""))
+        else:
+            fsr_list = driver.aws_get_fsr(image)
+            if not fsr_list:
+                print(f"Fast snapshot restore is not enabled for {image}")
+                return
+            total_cost = 0.0
+            print("Snapshot                Zone             State      Hours  Cost")
+            for item in fsr_list:
+                hours = 0.0
+                if item['enabled'] and item['state'] in ('enabling', 'optimizing', 'enabled'):
+                    hours = (datetime.now(item['enabled'].tzinfo) - item['enabled']).total_seconds() / 3600
+                cost = hours * FSR_HOURLY_COST
+                total_cost += cost
+                print(f"{item['snapshot']:<24}{item['zone']:<17}{item['state']:<11}{hours:>5.0f}  ${cost:.2f}")
+            print(f"Estimated cost to date ${total_cost:.2f}")
+
     def _gcp_list(self, _driver=None) -> list[dict]:
         if not _driver:
             driver = gcp()
@@ -0,0 +1,78 @@
+##
+##
+
+import logging
+import threading
+import json
+import time
+import os
+import tempfile
+from lib.location import location
+from lib.constants import INVENTORY_TTL
+
+
+class inventory_cache(object):
+    """On-disk cache of slow changing cloud inventory lookups, keyed by cloud, account, region and query"""
+    _lock = threading.Lock()
+    _refreshed = set()
+    refresh = False
+
+    def __init__(self):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.lc = location()
+        self.cache_file = self.lc.inventory_cache
+
+    @classmethod
+    def set_refresh(cls, refresh: bool):
+        """Query the cloud again for each lookup the first time it is used in this process"""
+        cls.refresh = refresh
+
+    def read(self) -> dict:
+        if not os.path.exists(self.cache_file):
+            return {}
+
+        try:
+            with open(self.cache_file, 'r') as cache_file:
+                return json.load(cache_file)
+        except (OSError, ValueError) as err:
+            self.logger.info("Can not read inventory cache %s: %s" % (self.cache_file, err))
+            return {}
+
+    def write(self, cache: dict):
+        try:
+            os.makedirs(os.path.dirname(self.cache_file), exist_ok=True)
+            # replace the file so a reader without the lock never sees a partly written cache
+            temp_fd, temp_name = tempfile.mkstemp(dir=os.path.dirname(self.cache_file), suffix='.tmp')
+            with os.fdopen(temp_fd, 'w') as cache_file:
+                json.dump(cache, cache_file, indent=2)
+                cache_file.write("\n")
+            os.replace(temp_name, self.cache_file)
+        except OSError as err:
+            self.logger.info("Can not write inventory cache %s: %s" % (self.cache_file, err))
+
+    @staticmethod
+    def expired(entry: dict, now: float) -> bool:
+        return now - entry.get('time', 0) >= INVENTORY_TTL.get(entry.get('kind'), 0)
+
+    def get(self, kind: str, key: tuple, query):
+        """Get the cached result of query, calling it if there is no entry or the entry is older than the TTL for its kind"""
+        name = ':'.join([str(item) for item in key])
+        now = time.time()
+
+        if not inventory_cache.refresh or name in inventory_cache._refreshed:
+            entry = self.read().get(name)
+            if entry and not self.expired(entry, now):
+                self.logger.info("Using cached %s" % name)
+                return entry['data']
+
+        data = query()
+        if not data:
+            return data
+
+        with inventory_cache._lock:
+            cache = {item: entry for item, entry in self.read().items() if not self.expired(entry, now)}
+            cache[name] = {'kind': kind, 'time': now, 'data': data}
+            self.write(cache)
+            inventory_cache._refreshed.add(name)
+
+        return data
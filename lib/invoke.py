@@ -1,162 +1,268 @@
 ##
 ##
 
-import distutils.spawn
-import subprocess
 import time
-import re
 import json
+import os
+import re
+import threading
 from datetime import datetime
 from lib.exceptions import *
-from lib.output import spinner
 from lib.logfile import log_file
+from lib.runner import async_runner, run_handle
+from lib.tfstate import tf_state, output_cache, config_fingerprint, saved_plan
+from lib.tfconfig import tf_config
+from lib.tfevents import tf_event, resource_timer
+from lib.packerevents import packer_event, build_timer
+from lib.constants import PARALLELISM_DEFAULTS, THROTTLE_RETRIES, THROTTLE_DELAY
 
 
 class packer_run(object):
 
-    def __init__(self, working_dir=None):
-        _logger = log_file(self.__class__.__name__, path=working_dir, filename='build.log')
+    def __init__(self, working_dir=None, timeout=None, log_dir=None, phase=None):
+        log_dir = log_dir if log_dir else working_dir
+        _logger = log_file(f"{self.__class__.__name__}:{log_dir}", path=log_dir, filename='build.log')
         self.logger = _logger.logger
         self.working_dir = working_dir
+        self.timeout = timeout
+        self.phase = phase
+        self.runner = None
+        self.artifacts = []
+        self.timer = None
+        self.timing_file = log_dir + '/timing.log' if log_dir else 'timing.log'
         self.check_binary()
 
+    def notify(self, message: str):
+        if self.phase:
+            self.logger.info(message)
+            self.phase.update(message)
+        else:
+            print(message)
+
     def check_binary(self) -> bool:
-        if not distutils.spawn.find_executable("packer"):
+        try:
+            self.runner = async_runner('packer', working_dir=self.working_dir)
+        except ProcessRunnerError:
             raise PackerRunError("can not find packer executable")
 
+        self.logger.info("Using packer version %s" % self.runner.version)
         return True
 
-    def fix_text(self, data: str) -> str:
-        data = data.replace('%!(PACKER_COMMA)', ',')
-        data = data.replace('\t', ' ')
-        data = data.replace('\\n', '')
-        data = data.replace('\n', '')
-        return data
-
-    def parse_output(self, line: bytes) -> dict:
-        message: dict = {
-            'timestamp': None,
-            'target': None,
-            'type': None,
-            'content': None,
-            'message': None
-        }
-        line_string = line.decode("utf-8")
-        line_string = line_string.rstrip()
-        self.logger.info(line_string)
-        line_contents: list = line_string.split(",")
+    def write_timing(self):
+        if not self.timer or not self.timer.steps:
+            return
 
-        message['timestamp'] = line_contents[0]
-        message['target'] = line_contents[1] if len(line_contents) > 1 else None
-        message['type'] = line_contents[2] if len(line_contents) > 2 else None
-        message['content'] = self.fix_text(line_contents[3]) if len(line_contents) > 3 else None
-        message['message'] = self.fix_text(line_contents[4]) if len(line_contents) > 4 else None
+        lines = [f"packer build at {datetime.now().strftime('%D %I:%M:%S %p')}"] + self.timer.table()
+        for line in lines:
+            self.logger.info(line)
 
-        return message
+        try:
+            with open(self.timing_file, 'w') as timing_file:
+                timing_file.write("\n".join(lines) + "\n")
+        except OSError as err:
+            self.logger.info("Can not write timing file %s: %s" % (self.timing_file, err))
 
     def _packer(self, *args: str):
-        error_string: str = ''
-        packer_cmd = [
-            'packer',
-            '-machine-readable',
-            *args
-        ]
-
-        p = subprocess.Popen(packer_cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, cwd=self.working_dir, bufsize=1)
-
-        sp = spinner()
-        sp.start()
-        while True:
-            line = p.stdout.readline()
-            if not line:
-                break
-            message = self.parse_output(line)
-            if message['type'] == 'error':
-                error_string += message['content']
-
-        sp.stop()
-        p.communicate()
-        if p.returncode != 0:
-            raise PackerRunError(f"error: {error_string}")
-
-    def build(self, var_file: str, packer_file: str):
+        timer = build_timer()
+        handle = run_handle()
+        self.timer = timer
+
+        def process_line(line: str, stream: str):
+            self.logger.info(line.rstrip())
+            event = packer_event.parse(line)
+            if not event:
+                return
+            timer.add(event)
+            if event.step and self.phase:
+                self.phase.update(event.step[1][:60])
+
+        if self.phase:
+            self.phase.add_child(handle)
+        try:
+            returncode = self.runner.run('-machine-readable', *args,
+                                         line_callback=process_line,
+                                         timeout=self.timeout,
+                                         spin=not self.phase,
+                                         status=lambda: timer.last_step[:72] if timer.last_step else "please wait",
+                                         handle=handle)
+        except ProcessCancelled:
+            timer.finish_all('cancelled')
+            self.write_timing()
+            self.logger.info("Command packer %s cancelled" % args[0])
+            if self.phase:
+                raise PhaseCancelled(f"packer {args[0]} cancelled")
+            raise PackerRunError(f"packer {args[0]} cancelled")
+        except ProcessTimeout as err:
+            timer.finish_all('failed')
+            self.write_timing()
+            raise PackerRunError(f"error: {err}")
+        finally:
+            if self.phase:
+                self.phase.remove_child(handle)
+
+        timer.finish_all('complete' if returncode == 0 else 'failed')
+        self.write_timing()
+        self.artifacts = timer.artifact_list
+
+        if returncode != 0:
+            if timer.errors:
+                raise PackerRunError(f"error: {timer.errors[0]}")
+            raise PackerRunError(f"packer exited with code {returncode}")
+
+    def build(self, var_file: str, packer_file: str, variables=None) -> list:
         cmd = []
 
         cmd.append('build')
         cmd.append('-var-file')
         cmd.append(var_file)
+        for key, value in (variables or {}).items():
+            cmd.append('-var')
+            cmd.append(f"{key}={value}")
         cmd.append(packer_file)
 
-        print("Beginning packer build (this can take several minutes)")
+        self.notify("Beginning packer build (this can take several minutes)")
         start_time = time.perf_counter()
         self._packer(*cmd)
         end_time = time.perf_counter()
         run_time = time.strftime("%H hours %M minutes %S seconds.", time.gmtime(end_time - start_time))
-        print(f"Image creation complete in {run_time}.")
+        self.notify(f"Image creation complete in {run_time}.")
+        if not self.phase:
+            for line in self.timer.table():
+                print(line)
+        return self.artifacts
 
 
 class tf_run(object):
+    init_lock = threading.Lock()
 
-    def __init__(self, working_dir=None):
-        _logger = log_file(self.__class__.__name__, path=working_dir)
+    def __init__(self, working_dir=None, phase=None, timeout=None):
+        _logger = log_file(f"{self.__class__.__name__}:{working_dir}", path=working_dir)
         self.logger = _logger.logger
         self.working_dir = working_dir
+        self.phase = phase
+        self.timeout = timeout
+        self.runner = None
         self.deployment_data = None
+        self.json_ui = False
+        self.timer = None
+        self.returncode = None
+        self.plan_file = working_dir + '/cloudmgr.tfplan' if working_dir else 'cloudmgr.tfplan'
+        self.timing_file = working_dir + '/timing.log' if working_dir else 'timing.log'
         self.check_binary()
 
+    def notify(self, message: str):
+        if self.phase:
+            self.logger.info(message)
+            self.phase.update(message)
+        else:
+            print(message)
+
     def check_binary(self) -> bool:
-        if not distutils.spawn.find_executable("terraform"):
-            raise PackerRunError("can not find terraform executable")
+        try:
+            self.runner = async_runner('terraform', working_dir=self.working_dir, env=tf_config().environment())
+        except ProcessRunnerError:
+            raise TerraformRunError("can not find terraform executable")
 
+        self.logger.info("Using terraform version %s" % self.runner.version)
+        self.json_ui = self.version_tuple >= (0, 15, 3)
         return True
 
-    def _terraform(self, *args: str, json_output=False, ignore_error=False):
-        command_output = ''
-        tf_cmd = [
-            'terraform',
-            *args
-        ]
-
-        p = subprocess.Popen(tf_cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, cwd=self.working_dir, bufsize=1)
-
-        sp = spinner()
-        sp.start()
-        while True:
-            line = p.stdout.readline()
-            if not line:
-                break
-            line_string = line.decode("utf-8")
-            escape_char = re.compile(r'\x1B(?:[@-Z\\-_]|\[[0-?]*[ -/]*[@-~])')
-            line_string = escape_char.sub('', line_string)
-            if json_output:
-                command_output += line_string
+    @property
+    def version_tuple(self) -> tuple:
+        try:
+            return tuple(int(n) for n in self.runner.version.split('-')[0].split('.'))
+        except (AttributeError, ValueError):
+            return 0, 0, 0
+
+    def _terraform(self, *args: str, json_output=False, json_events=False, ignore_error=False, exit_codes=(0,)):
+        output_lines = []
+        handle = run_handle()
+        timer = resource_timer() if json_events else None
+        self.timer = timer
+
+        def process_line(line: str, stream: str):
+            if json_output and stream == 'stdout':
+                output_lines.append(line)
+                return
+            event = tf_event.parse(line) if timer and stream == 'stdout' else None
+            if event:
+                timer.add(event)
+                self.logger.info(event.message)
+                if event.is_error and event.detail:
+                    self.logger.info(event.detail)
+                if self.phase:
+                    self.phase.update(timer.status_line())
             else:
-                line_string = line_string.rstrip()
-                self.logger.info(line_string)
-
-        sp.stop()
-        p.communicate()
-        if p.returncode != 0:
+                self.logger.info(line.rstrip())
+
+        if self.phase:
+            self.phase.add_child(handle)
+        try:
+            returncode = self.runner.run(*args,
+                                         line_callback=process_line,
+                                         timeout=self.timeout,
+                                         spin=not self.phase,
+                                         status=timer.status_line if timer else None,
+                                         handle=handle)
+        except ProcessCancelled:
+            self.logger.info("Command terraform %s cancelled" % args[0])
+            if self.phase:
+                raise PhaseCancelled(f"terraform {args[0]} cancelled")
+            raise TerraformRunError(f"terraform {args[0]} cancelled")
+        except ProcessTimeout as err:
+            self.logger.info(str(err))
+            raise TerraformRunError(f"environment deployment error: {err}")
+        finally:
+            if self.phase:
+                self.phase.remove_child(handle)
+
+        self.returncode = returncode
+        if returncode not in exit_codes:
             if ignore_error:
                 return False
             else:
-                raise TerraformRunError(f"environment deployment error (see log file for details)")
+                raise TerraformRunError(self.error_message())
 
-        if len(command_output) > 0:
+        if len(output_lines) > 0:
             try:
-                self.deployment_data = json.loads(command_output)
+                self.deployment_data = json.loads("\n".join(output_lines))
             except json.decoder.JSONDecodeError as err:
                 raise TerraformRunError(f"can not capture deployment output: {err}")
 
         return True
 
-    def _command(self, cmd: list, json_output=False, quiet=False, ignore_error=False):
+    def error_message(self) -> str:
+        if self.timer and self.timer.errors:
+            return f"environment deployment error: {self.timer.errors[0].summary} (see log file for details)"
+        return "environment deployment error (see log file for details)"
+
+    def failed_addresses(self) -> list:
+        """Get the resource addresses that failed in the last apply"""
+        addresses = []
+
+        if not self.timer:
+            return addresses
+
+        for event in self.timer.errors:
+            if event.address and event.address not in addresses:
+                addresses.append(event.address)
+        for address, step, seconds, status in self.timer.steps:
+            if status == 'failed' and address not in addresses:
+                addresses.append(address)
+
+        return addresses
+
+    def _command(self, cmd: list, json_output=False, json_events=False, quiet=False, ignore_error=False, exit_codes=(0,)):
         now = datetime.now()
         time_string = now.strftime("%D %I:%M:%S %p")
         self.logger.info(f" --- start {cmd[0]} at {time_string}")
 
         start_time = time.perf_counter()
-        result = self._terraform(*cmd, json_output=json_output, ignore_error=ignore_error)
+        try:
+            result = self._terraform(*cmd, json_output=json_output, json_events=json_events, ignore_error=ignore_error, exit_codes=exit_codes)
+        finally:
+            if json_events:
+                self.write_timing(cmd[0])
         end_time = time.perf_counter()
         run_time = time.strftime("%H hours %M minutes %S seconds.", time.gmtime(end_time - start_time))
 
@@ -164,31 +270,215 @@ class tf_run(object):
         time_string = now.strftime("%D %I:%M:%S %p")
         self.logger.info(f" --- end {cmd[0]} at {time_string}")
 
-        if not quiet:
+        if self.phase:
+            self.logger.info(f"Step complete in {run_time}.")
+        elif not quiet:
             print(f"Step complete in {run_time}.")
 
         return result
 
-    def init(self):
+    def write_timing(self, command: str):
+        if not self.timer or not self.timer.steps:
+            return
+
+        lines = [f"terraform {command} at {datetime.now().strftime('%D %I:%M:%S %p')}"] + self.timer.table()
+        for line in lines:
+            self.logger.info(line)
+
+        try:
+            with open(self.timing_file, 'w') as timing_file:
+                timing_file.write("\n".join(lines) + "\n")
+        except OSError as err:
+            self.logger.info("Can not write timing file %s: %s" % (self.timing_file, err))
+
+    def init(self, force=False):
         cmd = []
+        fingerprint = config_fingerprint(self.working_dir, self.runner.version)
+
+        if not force and fingerprint.check('init'):
+            self.logger.info("Configuration unchanged, skipping init")
+            return
 
         cmd.append('init')
         cmd.append('-input=false')
 
-        print("Initializing environment")
-        self._command(cmd)
+        self.notify("Initializing environment")
+        # the shared plugin cache does not support concurrent installs
+        with tf_run.init_lock:
+            self._command(cmd)
+        fingerprint.record('init')
 
-    def apply(self):
+    def plan_key(self) -> dict:
+        return {
+            'config': config_fingerprint(self.working_dir, self.runner.version).compute(),
+            'state': tf_state(self.working_dir).fingerprint(),
+        }
+
+    def plan(self, refresh=False) -> bool:
+        """Save a plan to apply, returns False if there are no changes to make"""
         cmd = []
+        plan_record = saved_plan(self.working_dir, self.plan_file)
+        plan_key = self.plan_key()
+
+        if not refresh and tf_state(self.working_dir).is_local():
+            if plan_record.get(plan_key):
+                self.logger.info("Inputs unchanged, reusing saved plan")
+                return True
+
+        plan_record.invalidate()
+
+        cmd.append('plan')
+        cmd.append('-input=false')
+        cmd.append('-detailed-exitcode')
+        cmd.append('-out=' + self.plan_file)
+        if self.json_ui:
+            cmd.append('-json')
+
+        self.notify("Planning environment")
+        self._command(cmd, json_events=self.json_ui, exit_codes=(0, 2))
+
+        changes = self.returncode == 2
+        plan_record.put(plan_key, changes)
+        return changes
+
+    def node_count(self) -> int:
+        count = 0
+
+        for file_name in ('cluster.tf', 'app.tf', 'sgw.tf', 'nodes.tf'):
+            spec_file = self.working_dir + '/' + file_name
+            if not os.path.exists(spec_file):
+                continue
+            with open(spec_file, 'r') as node_file:
+                count += len(re.findall(r'^\s*node_number\s*=', node_file.read(), re.MULTILINE))
+
+        return count
+
+    def parallelism_limits(self) -> dict:
+        """Merge the parallelism sections of the cloud locals.json and then the environment copies, nearest last"""
+        policy = dict(PARALLELISM_DEFAULTS)
+        locals_dirs = []
+
+        directory = os.path.abspath(self.working_dir)
+        while True:
+            locals_dirs.insert(0, directory)
+            if os.path.basename(directory) == 'terraform' or os.path.dirname(directory) == directory:
+                break
+            directory = os.path.dirname(directory)
+
+        for locals_dir in locals_dirs:
+            if not os.path.exists(locals_dir + '/locals.json'):
+                continue
+            try:
+                with open(locals_dir + '/locals.json', 'r') as locals_file:
+                    policy.update(json.load(locals_file).get('parallelism', {}))
+            except (OSError, ValueError):
+                pass
+
+        return policy
+
+    def parallelism_policy(self) -> int:
+        """Size parallelism to launch all nodes in one wave, within the cloud ceiling set in locals.json"""
+        policy = self.parallelism_limits()
+        nodes = self.node_count()
+        parallelism = max(policy['minimum'], nodes * policy['per_node'])
+        parallelism = min(parallelism, policy['ceiling'])
+        self.logger.info("Using parallelism %d for %d node(s)" % (parallelism, nodes))
+        return parallelism
+
+    def apply(self, plan_file=None, retries=0, parallelism=None):
+        attempt = 0
+        parallelism = parallelism if parallelism else self.parallelism_policy()
+
+        self.notify("Deploying environment")
+        output_cache(self.working_dir).invalidate()
+
+        while True:
+            cmd = []
+
+            cmd.append('apply')
+            cmd.append('-input=false')
+            cmd.append('-auto-approve')
+            cmd.append(f"-parallelism={parallelism}")
+            if self.json_ui:
+                cmd.append('-json')
+            if plan_file:
+                cmd.append(plan_file)
+
+            try:
+                result = self._command(cmd, json_events=self.json_ui, ignore_error=True)
+            finally:
+                if plan_file:
+                    saved_plan(self.working_dir, plan_file).invalidate()
+
+            if result:
+                break
+
+            if self.timer and self.timer.throttled and parallelism > 1 and attempt < THROTTLE_RETRIES:
+                attempt += 1
+                parallelism = max(1, parallelism // 2)
+                self.notify(f"Cloud API is throttling requests, retrying with parallelism {parallelism}")
+                time.sleep(THROTTLE_DELAY * attempt)
+                plan_file = None
+                continue
+
+            if retries > 0:
+                self.retry_failed(retries)
+                return
+
+            raise TerraformRunError(self.error_message())
+
+        self.output(quiet=True)
+
+    def retry_failed(self, retries: int):
+        addresses = self.failed_addresses()
+        if not addresses:
+            raise TerraformRunError(self.error_message())
+        self.notify(f"Apply failed for {len(addresses)} resource(s), retrying")
+        self.repair(addresses, retries=retries - 1)
+
+    def repair(self, addresses=None, retries=0) -> bool:
+        """Replace failed or tainted resources and their dependents, then apply any remaining changes"""
+        cmd = []
+        state = tf_state(self.working_dir)
+
+        if not self.json_ui:
+            raise TerraformRunError(f"terraform version {self.runner.version} does not support targeted repair")
+
+        if addresses is None:
+            addresses = state.tainted()
+        if not addresses:
+            return False
+
+        in_state = [instance['address'] for instance in state.instances() if instance['mode'] == 'managed']
 
         cmd.append('apply')
         cmd.append('-input=false')
         cmd.append('-auto-approve')
+        cmd.append(f"-parallelism={self.parallelism_policy()}")
+        cmd.append('-json')
+        for address in addresses:
+            if address in in_state:
+                cmd.append('-replace=' + address)
+        for address in addresses + state.dependents(addresses):
+            cmd.append('-target=' + address)
+
+        self.logger.info("Repairing %s" % ', '.join(addresses))
+        self.notify(f"Repairing {len(addresses)} resource(s)")
+        output_cache(self.working_dir).invalidate()
+        saved_plan(self.working_dir, self.plan_file).invalidate()
+
+        if not self._command(cmd, json_events=True, ignore_error=retries > 0):
+            self.retry_failed(retries)
+            return True
+
+        if self.plan(refresh=True):
+            self.apply(self.plan_file)
+        else:
+            self.output(quiet=True)
 
-        print("Deploying environment")
-        self._command(cmd)
+        return True
 
-    def destroy(self, refresh=True, ignore_error=False):
+    def destroy(self, refresh=True, ignore_error=False, parallelism=None):
         cmd = []
 
         cmd.append('destroy')
@@ -198,27 +488,88 @@ class tf_run(object):
             cmd.append('-refresh=false')
         else:
             ignore_error = True
-
-        print("Removing environment")
-        if not self._command(cmd, ignore_error=ignore_error):
-            print("First destroy attempt failed, retrying without refresh ...")
+        cmd.append(f"-parallelism={parallelism if parallelism else self.parallelism_policy()}")
+        if self.json_ui:
+            cmd.append('-json')
+
+        self.notify("Removing environment")
+        output_cache(self.working_dir).invalidate()
+        saved_plan(self.working_dir, self.plan_file).invalidate()
+        if not self._command(cmd, json_events=self.json_ui, ignore_error=ignore_error):
+            self.notify("First destroy attempt failed, retrying without refresh ...")
             self.destroy(refresh=False, ignore_error=False)
 
-    def validate(self):
+    def state_rm(self, resource_type: str):
+        """Remove all resources of a type from state so destroy does not evaluate them"""
+        cmd = []
+        addresses = []
+
+        for instance in tf_state(self.working_dir).instances():
+            if instance['type'] == resource_type and instance['mode'] == 'managed' and instance['resource'] not in addresses:
+                addresses.append(instance['resource'])
+
+        if not addresses:
+            return
+
+        cmd.append('state')
+        cmd.append('rm')
+        cmd.extend(addresses)
+
+        self.notify(f"Removing {resource_type} resources from state")
+        self._command(cmd, quiet=True)
+
+    def mirror(self, mirror_dir: str):
+        cmd = []
+
+        cmd.append('providers')
+        cmd.append('mirror')
+        cmd.append(mirror_dir)
+
+        self.notify("Mirroring providers")
+        self._command(cmd)
+
+    def validate(self, force=False):
         cmd = []
+        fingerprint = config_fingerprint(self.working_dir, self.runner.version)
+
+        if not force and fingerprint.check('validate'):
+            self.logger.info("Configuration unchanged, skipping validate")
+            return True
 
         cmd.append('validate')
 
-        return self._command(cmd, ignore_error=True, quiet=True)
+        if self._command(cmd, ignore_error=True, quiet=True):
+            fingerprint.record('validate')
+            return True
+
+        fingerprint.invalidate()
+        return False
 
     def output(self, quiet=False):
         cmd = []
 
+        if not quiet:
+            self.notify("Getting environment information")
+
+        state = tf_state(self.working_dir)
+        env_data = state.outputs()
+        if env_data is not None:
+            self.deployment_data = env_data
+            return self.deployment_data
+
+        cache = output_cache(self.working_dir)
+        fingerprint = state.fingerprint()
+        env_data = cache.get(fingerprint)
+        if env_data is not None:
+            self.deployment_data = env_data
+            return self.deployment_data
+
         cmd.append('output')
         cmd.append('-json')
 
-        if not quiet:
-            print("Getting environment information")
+        self.deployment_data = None
         self._command(cmd, json_output=True, quiet=quiet)
+        if self.deployment_data is not None:
+            cache.put(fingerprint, self.deployment_data)
 
         return self.deployment_data
@@ -0,0 +1,78 @@
+##
+##
+
+import logging
+import threading
+import json
+import os
+from datetime import datetime
+
+DEPLOY_STEPS = ['init', 'validate', 'apply']
+
+
+class deploy_journal(object):
+    """Record the deploy steps completed for each phase of an environment until the deploy completes"""
+    _lock = threading.Lock()
+
+    def __init__(self, env_dir):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.journal_file = env_dir + '/deploy.journal'
+
+    def read(self) -> dict:
+        if not os.path.exists(self.journal_file):
+            return {}
+
+        try:
+            with open(self.journal_file, 'r') as journal_file:
+                return json.load(journal_file)
+        except (OSError, ValueError) as err:
+            self.logger.info("Can not read journal %s: %s" % (self.journal_file, err))
+            return {}
+
+    def write(self, journal: dict):
+        try:
+            with open(self.journal_file, 'w') as journal_file:
+                json.dump(journal, journal_file, indent=2)
+                journal_file.write("\n")
+        except OSError as err:
+            self.logger.info("Can not write journal %s: %s" % (self.journal_file, err))
+
+    def resume(self, name: str, working_dir: str, fingerprint: str) -> list:
+        """Get the steps of the phase completed by an interrupted deploy with the same configuration, starting a new entry otherwise"""
+        with deploy_journal._lock:
+            journal = self.read()
+            entry = journal.get(name, {})
+            if entry.get('working_dir') == working_dir and entry.get('fingerprint') == fingerprint:
+                return [step for step in DEPLOY_STEPS if step in entry.get('steps', {})]
+            journal[name] = {
+                'working_dir': working_dir,
+                'fingerprint': fingerprint,
+                'steps': {},
+            }
+            self.write(journal)
+            return []
+
+    def record(self, name: str, step: str):
+        with deploy_journal._lock:
+            journal = self.read()
+            entry = journal.setdefault(name, {'working_dir': None, 'fingerprint': None, 'steps': {}})
+            entry['steps'][step] = datetime.now().isoformat(timespec='seconds')
+            self.write(journal)
+
+    def remove(self, working_dir: str):
+        with deploy_journal._lock:
+            journal = self.read()
+            entries = [name for name in journal if journal[name].get('working_dir') == working_dir]
+            if not entries:
+                return
+            for name in entries:
+                del journal[name]
+            self.write(journal)
+
+    def clear(self):
+        with deploy_journal._lock:
+            if os.path.exists(self.journal_file):
+                try:
+                    os.remove(self.journal_file)
+                except OSError as err:
+                    self.logger.info("Can not remove journal %s: %s" % (self.journal_file, err))
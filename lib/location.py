@@ -71,6 +71,38 @@ class location(object):
     def package_dir(self):
         return self._package_dir
 
+    @property
+    def image_index(self):
+        return self._package_dir + '/image_index.json'
+
+    @property
+    def config_dir(self):
+        return os.environ['HOME'] + '/.config/imagemgr'
+
+    @property
+    def inventory_cache(self):
+        return self.config_dir + '/inventory_cache.json'
+
+    @property
+    def market_index(self):
+        return self.config_dir + '/market_index.json'
+
+    @property
+    def tf_config_dir(self):
+        return self._package_dir + '/.terraform.d'
+
+    @property
+    def tf_cli_config(self):
+        return self.tf_config_dir + '/terraformrc'
+
+    @property
+    def tf_plugin_cache(self):
+        return self.tf_config_dir + '/plugin-cache'
+
+    @property
+    def tf_provider_mirror(self):
+        return self.tf_config_dir + '/providers'
+
     @property
     def aws_home(self):
         return self.get_home('aws')
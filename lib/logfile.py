@@ -46,7 +46,10 @@ class log_file(object):
             else:
                 self._logger.setLevel(logging.CRITICAL)
 
-            self._logger.addHandler(self.handler)
+            if not any(isinstance(h, logging.FileHandler) and h.baseFilename == self.handler.baseFilename for h in self._logger.handlers):
+                self._logger.addHandler(self.handler)
+            else:
+                self.handler.close()
             self.debug = True
         except Exception as err:
             print(f"warning: can not initialize logging: {err}")
@@ -8,20 +8,33 @@ import time
 import sys
 
 
-class spinner(object):
+class progress_display(object):
 
-    def __init__(self):
+    def __init__(self, scheduler):
+        self.scheduler = scheduler
         self.run_flag = multiprocessing.Value('i')
         self.run_flag.value = 0
         self.sequence = ['-', '\\', '|', '/']
         self.char_cycle = cycle(self.sequence)
         self.run_thread = threading.Thread(target=self.run, args=(self.run_flag,))
 
+    def status_line(self) -> str:
+        items = []
+        for phase in self.scheduler.all_phases():
+            if phase.status == 'running':
+                elapsed = time.strftime("%M:%S", time.gmtime(phase.elapsed))
+                message = f" {phase.message}" if phase.message else ""
+                items.append(f"{phase.name}:{message} {elapsed}")
+            else:
+                items.append(f"{phase.name}: {phase.status}")
+        return " | ".join(items)
+
     def run(self, run_flag):
         end_char = '\r'
 
         while run_flag.value == 1:
-            print(f" please wait {next(self.char_cycle)}", end=end_char)
+            sys.stdout.write("\033[K")
+            print(f" {next(self.char_cycle)} {self.status_line()}", end=end_char)
             time.sleep(0.5)
 
     def start(self):
@@ -0,0 +1,147 @@
+##
+##
+
+import re
+import time
+
+STEP_MESSAGE = re.compile(r'^==> ([^:]+): (.*)$')
+
+
+class packer_event(object):
+    """Packer machine readable output line (timestamp,target,type,data...)"""
+
+    def __init__(self, timestamp, target: str, message_type: str, data: list):
+        self.timestamp = timestamp
+        self.target = target
+        self.type = message_type
+        self.data = data
+
+    @staticmethod
+    def unescape(text: str) -> str:
+        return text.replace('%!(PACKER_COMMA)', ',').replace('\\n', '\n').replace('\\r', '\r')
+
+    @classmethod
+    def parse(cls, line: str):
+        """Parse a line of packer -machine-readable output, returns None if the line is not in that format"""
+        fields = line.rstrip('\r\n').split(',')
+        if len(fields) < 3 or not fields[0].isdigit():
+            return None
+        return cls(int(fields[0]), fields[1], fields[2], [cls.unescape(field) for field in fields[3:]])
+
+    @property
+    def ui_type(self) -> str:
+        if self.type == 'ui' and self.data:
+            return self.data[0]
+        return None
+
+    @property
+    def text(self) -> str:
+        if self.type == 'ui':
+            return ' '.join(self.data[1:]).strip()
+        return ' '.join(self.data).strip()
+
+    @property
+    def step(self):
+        """Return the (build, description) of a build step message, None for other output"""
+        if self.ui_type != 'say':
+            return None
+        match = STEP_MESSAGE.match(self.text)
+        if not match:
+            return None
+        return match.group(1), match.group(2).strip()
+
+    @property
+    def is_error(self) -> bool:
+        return self.type == 'error' or self.ui_type == 'error'
+
+    @property
+    def is_artifact(self) -> bool:
+        return self.type == 'artifact' and len(self.data) >= 2
+
+
+class packer_artifact(object):
+    """Artifact reported by a packer builder"""
+
+    def __init__(self, build: str, index: str):
+        self.build = build
+        self.index = index
+        self.builder_id = None
+        self.id = None
+        self.string = None
+        self.files = []
+
+    def add(self, event: packer_event):
+        key = event.data[1]
+        values = event.data[2:]
+        if key == 'builder-id' and values:
+            self.builder_id = values[0]
+        elif key == 'id' and values:
+            self.id = ','.join(values)
+        elif key == 'string' and values:
+            self.string = ','.join(values)
+        elif key == 'file' and len(values) > 1:
+            self.files.append(values[1])
+
+    @property
+    def image_ids(self) -> list:
+        """Image names from the artifact ID (region:ami-id, resource IDs and plain names)"""
+        if not self.id:
+            return []
+        return [item.split(':')[-1].split('/')[-1] for item in self.id.split(',') if item]
+
+    @property
+    def image_id(self) -> str:
+        image_ids = self.image_ids
+        return image_ids[0] if image_ids else None
+
+
+class build_timer(object):
+    """Track build steps, artifacts and errors from the packer event stream"""
+
+    def __init__(self):
+        self.running = {}
+        self.steps = []
+        self.artifacts = {}
+        self.errors = []
+        self.last_step = None
+
+    def add(self, event: packer_event):
+        now = event.timestamp if event.timestamp else time.time()
+
+        if event.step:
+            build, description = event.step
+            self.finish(build, now)
+            self.running[build] = (description, now)
+            self.last_step = f"{build}: {description}"
+        elif event.is_artifact:
+            key = (event.target, event.data[0])
+            if key not in self.artifacts:
+                self.artifacts[key] = packer_artifact(*key)
+            self.artifacts[key].add(event)
+        elif event.is_error and event.text:
+            self.errors.append(event.text)
+
+    def finish(self, build: str, now: float, status='complete'):
+        if build not in self.running:
+            return
+        description, start_time = self.running.pop(build)
+        self.steps.append((build, description, now - start_time, status))
+
+    def finish_all(self, status='complete'):
+        now = time.time()
+        for build in list(self.running):
+            self.finish(build, now, status)
+
+    @property
+    def artifact_list(self) -> list:
+        return [artifact for artifact in self.artifacts.values() if artifact.id]
+
+    def table(self) -> list:
+        lines = []
+        if not self.steps:
+            return lines
+        step_width = min(max([len(step[1]) for step in self.steps] + [4]), 72)
+        lines.append("Step".ljust(step_width) + "  " + "Status".ljust(8) + "  Time")
+        for build, description, seconds, status in sorted(self.steps, key=lambda item: item[2], reverse=True):
+            lines.append(description[:step_width].ljust(step_width) + "  " + status.ljust(8) + f"  {seconds:.0f}s")
+        return lines
@@ -16,12 +16,15 @@ from lib.cbrelmgr import cbrelease
 from lib.ssh import ssh
 from lib.toolbox import toolbox
 from lib.invoke import tf_run
+from lib.tfstate import tf_state, config_fingerprint
+from lib.scheduler import phase_scheduler
+from lib.journal import deploy_journal, DEPLOY_STEPS
 from lib.envmgr import envmgr
 from lib.clustermgr import clustermgr
 from lib.netmgr import network_manager
 from lib.ask import ask
 from lib.tfparser import tfgen
-from lib.constants import CLUSTER_CONFIG, APP_CONFIG, SGW_CONFIG, STD_CONFIG
+from lib.constants import CLUSTER_CONFIG, APP_CONFIG, SGW_CONFIG, STD_CONFIG, FAST_DESTROY_PARALLELISM
 
 
 class run_manager(object):
@@ -38,6 +41,10 @@ class run_manager(object):
         self.env.set_cloud(self.cloud)
         self.env.set_env(self.args.dev, self.args.test, self.args.prod, self.args.app, self.args.sgw, all_opt=self.args.all, standalone_opt=self.args.standalone)
         self.nm = network_manager(self.args)
+        self.env_outputs = {}
+        self.skip_phases = []
+        self.force_phases = []
+        self.force_steps = []
 
     def build_env(self):
         inquire = ask()
@@ -84,6 +91,9 @@ class run_manager(object):
         try:
             if self.args.standalone:
                 selected_image = driver.get_market_image()
+                if selected_image.get('arch') in ('x86_64', 'arm64'):
+                    v.set_arch(selected_image['arch'])
+                    c.set_arch(selected_image['arch'])
                 t.do_not_reuse('aws_market_name',
                                'gcp_market_image',
                                'gcp_image_project',
@@ -100,6 +110,9 @@ class run_manager(object):
                 v.set_os_ver(linux_release)
                 c.set_os_name(linux_type)
                 c.set_os_ver(linux_release)
+                if selected_image.get('arch') in ('x86_64', 'arm64'):
+                    v.set_arch(selected_image['arch'])
+                    c.set_arch(selected_image['arch'])
                 t.do_not_reuse('os_image_user', 'ami_id', 'gcp_cb_image', 'azure_image_name', 'vsphere_template')
         except Exception as err:
             raise RunMgmtError(f"can not get image for deployment: {err}")
@@ -208,42 +221,24 @@ class run_manager(object):
 
         print("")
         print("Beginning environment deploy process")
+        print("")
 
-        try:
-            print("")
-            print(f"{env_text} node deployment phase ...")
-            tf = tf_run(working_dir=self.env.env_dir)
-            tf.init()
-            if not tf.validate():
-                raise RunMgmtError("Environment is not configured, please use create mode to try again.")
-            tf.apply()
-        except Exception as err:
-            raise RunMgmtError(f"can not deploy environment: {err}")
+        scheduler = phase_scheduler(env_text)
+        scheduler.add_phase('cluster', self.deploy_phase, self.env.env_dir, log_dir=self.env.env_dir)
 
         if self.env.app_env_dir and os.path.exists(self.env.app_env_dir + '/variables.tf'):
-            try:
-                print("")
-                print(f"{env_text} app deployment phase ...")
-                tf = tf_run(working_dir=self.env.app_env_dir)
-                tf.init()
-                if not tf.validate():
-                    raise RunMgmtError("Environment is not configured, please use create mode to try again.")
-                tf.apply()
-            except Exception as err:
-                raise RunMgmtError(f"can not deploy environment: {err}")
+            scheduler.add_phase('app', self.deploy_phase, self.env.app_env_dir, log_dir=self.env.app_env_dir)
 
         if self.env.sgw_env_dir and os.path.exists(self.env.sgw_env_dir + '/variables.tf'):
-            try:
-                print("")
-                print(f"{env_text} sync gateway deployment phase ...")
-                self.create_cluster_var_file(self.env.env_dir, self.env.sgw_env_dir)
-                tf = tf_run(working_dir=self.env.sgw_env_dir)
-                tf.init()
-                if not tf.validate():
-                    raise RunMgmtError("Environment is not configured, please use create mode to try again.")
-                tf.apply()
-            except Exception as err:
-                raise RunMgmtError(f"can not deploy environment: {err}")
+            scheduler.add_phase('sgw', self.deploy_sgw_phase, self.env.sgw_env_dir, depends=['cluster'], log_dir=self.env.sgw_env_dir)
+
+        if self.args.from_phase:
+            self.set_from_phase(self.args.from_phase, list(scheduler.phases))
+
+        if not scheduler.run():
+            raise RunMgmtError("can not deploy environment (see phase logs for details)")
+
+        deploy_journal(self.env.env_dir).clear()
 
         print("")
         print("Deployment complete.")
@@ -251,6 +246,62 @@ class run_manager(object):
 
         self.list_env()
 
+    def set_from_phase(self, from_phase: str, phase_names: list):
+        """Parse --from-phase as phase, step or phase:step where the step is one of init, validate and apply"""
+        phase_name, _, step = from_phase.partition(':')
+        if not step and phase_name in DEPLOY_STEPS:
+            phase_name, step = None, phase_name
+
+        if phase_name and phase_name not in phase_names:
+            raise RunMgmtError(f"unknown phase {phase_name}, environment phases are {', '.join(phase_names)}")
+        if step and step not in DEPLOY_STEPS:
+            raise RunMgmtError(f"unknown step {step}, deploy steps are {', '.join(DEPLOY_STEPS)}")
+
+        position = phase_names.index(phase_name) if phase_name else 0
+        self.skip_phases = phase_names[:position]
+        self.force_phases = phase_names[position:]
+        self.force_steps = DEPLOY_STEPS[DEPLOY_STEPS.index(step):] if step else []
+
+    def deploy_phase(self, phase, working_dir):
+        journal = deploy_journal(self.env.env_dir)
+
+        if phase.name in self.skip_phases:
+            phase.skip("Skipped")
+            return
+
+        tf = tf_run(working_dir=working_dir, phase=phase)
+        fingerprint = config_fingerprint(working_dir, tf.runner.version).compute()
+        completed = journal.resume(phase.name, working_dir, fingerprint)
+        force_steps = []
+
+        if phase.name in self.force_phases:
+            force_steps = self.force_steps if self.force_steps else DEPLOY_STEPS
+            completed = [step for step in DEPLOY_STEPS if step not in force_steps]
+
+        if all(step in completed for step in DEPLOY_STEPS):
+            phase.skip("Completed by the interrupted deploy")
+            return
+
+        if 'init' not in completed:
+            tf.init(force=self.args.force_init or 'init' in self.force_steps)
+            journal.record(phase.name, 'init')
+        if 'validate' not in completed:
+            if not tf.validate(force=self.args.force_init or 'validate' in self.force_steps):
+                raise RunMgmtError("Environment is not configured, please use create mode to try again.")
+            journal.record(phase.name, 'validate')
+        if tf.plan(refresh=self.args.refresh or 'apply' in force_steps):
+            tf.apply(tf.plan_file, retries=self.args.retry)
+        else:
+            tf.notify("No changes")
+            tf.output(quiet=True)
+        journal.record(phase.name, 'apply')
+        self.env_outputs[working_dir] = tf.deployment_data
+
+    def deploy_sgw_phase(self, phase, working_dir):
+        if phase.name not in self.skip_phases:
+            self.create_cluster_var_file(self.env.env_dir, working_dir)
+        self.deploy_phase(phase, working_dir)
+
     def destroy_env(self):
         inquire = ask()
         self.env.create_env(create=False)
@@ -259,28 +310,90 @@ class run_manager(object):
 
         print(f"Cloud: {self.cloud} :: Environment {env_text}")
 
-        try:
-            if inquire.ask_yn(f"Remove instances for {env_text}", default=False):
-                tf = tf_run(working_dir=self.env.env_dir)
-                if not tf.validate():
-                    tf.init()
-                tf.destroy()
-        except Exception as err:
-            raise RunMgmtError(f"can not destroy environment: {err}")
+        scheduler = phase_scheduler(env_text)
+
+        if self.args.fast:
+            if not inquire.ask_yn(f"Remove all instances for {env_text} (fast mode)", default=False):
+                return
+            scheduler.add_phase(env_text, self.fast_destroy_phase, self.env.env_dir, log_dir=self.env.env_dir)
+        elif inquire.ask_yn(f"Remove instances for {env_text}", default=False):
+            scheduler.add_phase(env_text, self.destroy_phase, self.env.env_dir, log_dir=self.env.env_dir)
 
         for app_env in self.env.all_app_dirs():
-            try:
-                app_env_dir = self.env.env_dir + '/' + app_env
-                if not os.path.exists(app_env_dir + '/variables.tf'):
-                    print(f"Skipping incomplete environment {app_env}")
-                    continue
-                if inquire.ask_yn(f"Remove instances for {app_env}", default=False):
-                    tf = tf_run(working_dir=app_env_dir)
-                    if not tf.validate():
-                        tf.init()
-                    tf.destroy()
-            except Exception as err:
-                raise RunMgmtError(f"can not destroy environment: {err}")
+            app_env_dir = self.env.env_dir + '/' + app_env
+            if not os.path.exists(app_env_dir + '/variables.tf'):
+                print(f"Skipping incomplete environment {app_env}")
+                continue
+            if self.args.fast:
+                scheduler.add_phase(app_env, self.fast_destroy_phase, app_env_dir, log_dir=app_env_dir)
+            elif inquire.ask_yn(f"Remove instances for {app_env}", default=False):
+                scheduler.add_phase(app_env, self.destroy_phase, app_env_dir, log_dir=app_env_dir)
+
+        if len(scheduler.phases) == 0:
+            return
+
+        print("")
+        if not scheduler.run():
+            raise RunMgmtError("can not destroy environment (see phase logs for details)")
+
+    def destroy_phase(self, phase, working_dir):
+        deploy_journal(self.env.env_dir).remove(working_dir)
+        tf = tf_run(working_dir=working_dir, phase=phase)
+        if not tf.validate(force=self.args.force_init):
+            tf.init(force=True)
+        tf.destroy()
+
+    def mirror_providers(self):
+        self.env.create_env(create=False)
+        mirror_dir = self.lc.tf_provider_mirror
+        env_dirs = [self.env.env_dir]
+
+        for app_env in self.env.all_app_dirs():
+            env_dirs.append(self.env.env_dir + '/' + app_env)
+
+        for env_dir in env_dirs:
+            if not os.path.exists(env_dir + '/variables.tf'):
+                print(f"Skipping incomplete environment {os.path.basename(env_dir)}")
+                continue
+            print(f"Mirroring providers for {env_dir} to {mirror_dir}")
+            tf = tf_run(working_dir=env_dir)
+            tf.mirror(mirror_dir)
+
+    def repair_env(self):
+        self.env.create_env(create=False)
+        env_text = self.env.get_env
+        env_text = env_text.replace(':', '-')
+
+        print(f"Cloud: {self.cloud} :: Environment {env_text}")
+
+        scheduler = phase_scheduler(env_text)
+        scheduler.add_phase(env_text, self.repair_phase, self.env.env_dir, log_dir=self.env.env_dir)
+
+        for app_env in self.env.all_app_dirs():
+            app_env_dir = self.env.env_dir + '/' + app_env
+            if os.path.exists(app_env_dir + '/variables.tf'):
+                scheduler.add_phase(app_env, self.repair_phase, app_env_dir, log_dir=app_env_dir)
+
+        print("")
+        if not scheduler.run():
+            raise RunMgmtError("can not repair environment (see phase logs for details)")
+
+        print("")
+        self.list_env()
+
+    def repair_phase(self, phase, working_dir):
+        tf = tf_run(working_dir=working_dir, phase=phase)
+        tf.init(force=self.args.force_init)
+        if not tf.repair(retries=self.args.retry):
+            phase.skip("No failed resources")
+
+    def fast_destroy_phase(self, phase, working_dir):
+        deploy_journal(self.env.env_dir).remove(working_dir)
+        tf = tf_run(working_dir=working_dir, phase=phase)
+        if not tf.validate(force=self.args.force_init):
+            tf.init(force=True)
+        tf.state_rm('null_resource')
+        tf.destroy(refresh=False, parallelism=min(FAST_DESTROY_PARALLELISM, tf.parallelism_limits()['ceiling']))
 
     def list_env(self):
         self.env.create_env(create=False)
@@ -290,8 +403,7 @@ class run_manager(object):
         print(f"Cloud: {self.cloud} :: Environment {env_text}")
 
         try:
-            tf = tf_run(working_dir=self.env.env_dir)
-            env_data = tf.output(quiet=True)
+            env_data = self.get_env_outputs(self.env.env_dir)
             if env_data:
                 print("Couchbase cluster:")
             for item in env_data:
@@ -304,8 +416,7 @@ class run_manager(object):
         for app_env in self.env.all_app_dirs():
             try:
                 app_env_dir = self.env.env_dir + '/' + app_env
-                tf = tf_run(working_dir=app_env_dir)
-                env_data = tf.output(quiet=True)
+                env_data = self.get_env_outputs(app_env_dir)
                 if env_data:
                     print(f"{app_env} node(s):")
                 for item in env_data:
@@ -321,8 +432,7 @@ class run_manager(object):
             for environment in self.env.all_env_dirs(cloud):
                 app_envs = []
                 env_dir = self.lc.package_dir + '/' + cloud + '/terraform/' + environment
-                tf = tf_run(working_dir=env_dir)
-                env_data = tf.output(quiet=True)
+                env_data = self.get_env_outputs(env_dir)
                 if env_data:
                     running = 'yes'
                 else:
@@ -330,8 +440,7 @@ class run_manager(object):
                 for app_env in self.env.all_app_dirs(working_dir=env_dir):
                     app_envs.append(app_env)
                     env_dir = self.lc.package_dir + '/' + cloud + '/terraform/' + environment + '/' + app_env
-                    tf = tf_run(working_dir=env_dir)
-                    env_data = tf.output(quiet=True)
+                    env_data = self.get_env_outputs(env_dir)
                     if env_data:
                         app_envs.append('yes')
                     else:
@@ -341,13 +450,22 @@ class run_manager(object):
                     print(f" {item[0]} active: {item[1].ljust(3)}", end='')
                 print("")
 
+    def get_env_outputs(self, env_dir):
+        if self.env_outputs.get(env_dir) is not None:
+            return self.env_outputs[env_dir]
+        state = tf_state(env_dir)
+        env_data = state.outputs()
+        if env_data is None:
+            tf = tf_run(working_dir=env_dir)
+            env_data = tf.output(quiet=True)
+        return env_data
+
     def create_cluster_var_file(self, env_dir, out_dir):
         var_filename = out_dir + '/cb_cluster.tf'
         try:
             var_file = tfgen(var_filename)
             var_file.open_file()
-            tf = tf_run(working_dir=env_dir)
-            env_data = tf.output(quiet=True)
+            env_data = self.get_env_outputs(env_dir)
             if not env_data:
                 raise RunMgmtError("cluster was not created")
             for item in env_data:
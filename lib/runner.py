@@ -0,0 +1,222 @@
+##
+##
+
+import asyncio
+import atexit
+import logging
+import os
+import signal
+import threading
+import subprocess
+import shutil
+import json
+import re
+import sys
+from itertools import cycle
+from lib.exceptions import ProcessRunnerError, ProcessCancelled, ProcessTimeout
+
+ANSI_ESCAPE = re.compile(r'\x1B(?:[@-Z\\-_]|\[[0-?]*[ -/]*[@-~])')
+LINE_LIMIT = 16 * 1024 * 1024
+STOP_TIMEOUT = 30
+
+
+class process_loop(object):
+    """Process-wide event loop that runs all child processes from one background thread"""
+    _loop = None
+    _thread = None
+    _lock = threading.Lock()
+    _processes = set()
+
+    @classmethod
+    def get(cls) -> asyncio.AbstractEventLoop:
+        with cls._lock:
+            if not cls._loop:
+                cls._loop = asyncio.new_event_loop()
+                cls._thread = threading.Thread(target=cls._loop.run_forever, name='process_loop', daemon=True)
+                cls._thread.start()
+                atexit.register(cls.terminate_all)
+        return cls._loop
+
+    @classmethod
+    def add(cls, process):
+        cls._processes.add(process)
+
+    @classmethod
+    def remove(cls, process):
+        cls._processes.discard(process)
+
+    @classmethod
+    def terminate_all(cls):
+        for process in list(cls._processes):
+            signal_group(process, signal.SIGTERM)
+
+
+def signal_group(process, sig):
+    try:
+        os.killpg(process.pid, sig)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+class binary_cache(object):
+    """Resolve and version probe executables once per process"""
+    _paths = {}
+    _versions = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def find(cls, name: str) -> str:
+        with cls._lock:
+            if name not in cls._paths:
+                cls._paths[name] = shutil.which(name)
+        if not cls._paths[name]:
+            raise ProcessRunnerError(f"can not find {name} executable")
+        return cls._paths[name]
+
+    @classmethod
+    def version(cls, name: str) -> str:
+        path = cls.find(name)
+        with cls._lock:
+            if name not in cls._versions:
+                cls._versions[name] = cls.probe_version(path)
+        return cls._versions[name]
+
+    @staticmethod
+    def probe_version(path: str) -> str:
+        try:
+            result = subprocess.run([path, 'version', '-json'], capture_output=True, timeout=60)
+            if result.returncode == 0:
+                version_data = json.loads(result.stdout)
+                for key in ('terraform_version', 'version'):
+                    if key in version_data:
+                        return version_data[key].lstrip('v')
+        except (OSError, ValueError, subprocess.SubprocessError):
+            pass
+
+        try:
+            result = subprocess.run([path, 'version'], capture_output=True, timeout=60)
+            match = re.search(r'v?([0-9]+\.[0-9]+\.[0-9]+)', result.stdout.decode('utf-8', errors='replace'))
+            if match:
+                return match.group(1)
+        except (OSError, subprocess.SubprocessError):
+            pass
+
+        return None
+
+
+class run_handle(object):
+    """Cancel a running command from another thread"""
+
+    def __init__(self):
+        self.loop = None
+        self.task = None
+        self.cancelled = False
+
+    def attach(self, loop, task):
+        self.loop = loop
+        self.task = task
+
+    def terminate(self):
+        self.cancelled = True
+        if self.loop and self.task:
+            self.loop.call_soon_threadsafe(self.task.cancel)
+
+
+class async_runner(object):
+
+    def __init__(self, binary: str, working_dir=None, env=None):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.binary = binary
+        self.path = binary_cache.find(binary)
+        self.working_dir = working_dir
+        self.env = env
+
+    @property
+    def version(self) -> str:
+        return binary_cache.version(self.binary)
+
+    async def spinner(self, status=None):
+        char_cycle = cycle(['-', '\\', '|', '/'])
+        while True:
+            if status:
+                sys.stdout.write("\033[K")
+                print(f" {next(char_cycle)} {status()}", end='\r')
+            else:
+                print(f" please wait {next(char_cycle)}", end='\r')
+            await asyncio.sleep(0.5)
+
+    async def stream(self, reader, stream_name: str, line_callback):
+        while True:
+            try:
+                line = await reader.readline()
+            except ValueError:
+                line = await reader.read(LINE_LIMIT)
+            if not line:
+                break
+            line_string = ANSI_ESCAPE.sub('', line.decode('utf-8', errors='replace')).rstrip('\r\n')
+            if line_callback:
+                line_callback(line_string, stream_name)
+
+    async def stop(self, process):
+        signal_group(process, signal.SIGTERM)
+        try:
+            await asyncio.wait_for(process.wait(), STOP_TIMEOUT)
+        except asyncio.TimeoutError:
+            signal_group(process, signal.SIGKILL)
+            await process.wait()
+
+    async def run_async(self, *args: str, line_callback=None, timeout=None, spin=False, status=None, handle=None) -> int:
+        command = ' '.join([self.binary, *args])
+        spin_task = None
+
+        if handle:
+            handle.attach(asyncio.get_running_loop(), asyncio.current_task())
+            if handle.cancelled:
+                raise ProcessCancelled(f"{command} cancelled")
+
+        self.logger.info("Running %s in %s" % (command, self.working_dir))
+        try:
+            process = await asyncio.create_subprocess_exec(self.path, *args,
+                                                           stdout=asyncio.subprocess.PIPE,
+                                                           stderr=asyncio.subprocess.PIPE,
+                                                           cwd=self.working_dir,
+                                                           env=self.env,
+                                                           start_new_session=True,
+                                                           limit=LINE_LIMIT)
+        except asyncio.CancelledError:
+            raise ProcessCancelled(f"{command} cancelled")
+        except OSError as err:
+            raise ProcessRunnerError(f"can not run {command}: {err}")
+
+        process_loop.add(process)
+        if spin:
+            spin_task = asyncio.ensure_future(self.spinner(status))
+        try:
+            await asyncio.wait_for(asyncio.gather(self.stream(process.stdout, 'stdout', line_callback),
+                                                  self.stream(process.stderr, 'stderr', line_callback),
+                                                  process.wait()),
+                                   timeout)
+        except asyncio.TimeoutError:
+            await self.stop(process)
+            raise ProcessTimeout(f"{command} did not complete in {timeout} seconds")
+        except asyncio.CancelledError:
+            await self.stop(process)
+            raise ProcessCancelled(f"{command} cancelled")
+        finally:
+            process_loop.remove(process)
+            if spin_task:
+                spin_task.cancel()
+                sys.stdout.write("\033[K")
+
+        return process.returncode
+
+    def run(self, *args: str, line_callback=None, timeout=None, spin=False, status=None, handle=None) -> int:
+        """Run a command on the shared event loop and wait for it to exit"""
+        future = asyncio.run_coroutine_threadsafe(self.run_async(*args,
+                                                                 line_callback=line_callback,
+                                                                 timeout=timeout,
+                                                                 spin=spin,
+                                                                 status=status,
+                                                                 handle=handle),
+                                                  process_loop.get())
+        return future.result()
@@ -0,0 +1,195 @@
+##
+##
+
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from lib.exceptions import SchedulerError, PhaseCancelled
+from lib.output import progress_display
+
+
+class phase(object):
+
+    def __init__(self, name, func, args=(), depends=(), log_dir=None, log_name='deploy.log'):
+        self.name = name
+        self.func = func
+        self.args = args
+        self.depends = list(depends)
+        self.log_dir = log_dir
+        self.log_name = log_name
+        self.result = None
+        self.status = 'waiting'
+        self.message = None
+        self.error = None
+        self.start_time = None
+        self.end_time = None
+        self.skipped = False
+        self.cancel_flag = threading.Event()
+        self.children = []
+        self.lock = threading.Lock()
+
+    def update(self, message: str):
+        self.message = message
+
+    def skip(self, message: str):
+        self.skipped = True
+        self.message = message
+
+    def add_child(self, process):
+        with self.lock:
+            if self.cancel_flag.is_set():
+                process.terminate()
+            self.children.append(process)
+
+    def remove_child(self, process):
+        with self.lock:
+            if process in self.children:
+                self.children.remove(process)
+
+    def cancel(self):
+        with self.lock:
+            self.cancel_flag.set()
+            for process in self.children:
+                try:
+                    process.terminate()
+                except Exception:
+                    pass
+
+    @property
+    def cancelled(self) -> bool:
+        return self.cancel_flag.is_set()
+
+    @property
+    def error_text(self) -> str:
+        if self.error is None:
+            return None
+        text = getattr(self.error, 'message', None) or str(self.error)
+        return text if text else self.error.__class__.__name__
+
+    def log_error(self):
+        """Append the error to the phase log, which otherwise only has the output of the commands the phase ran"""
+        if not self.log_dir:
+            return
+        try:
+            with open(self.log_dir + '/' + self.log_name, 'a') as log_file:
+                log_file.write(f"{time.strftime('%Y-%m-%d %H:%M:%S')} phase {self.name} failed: {self.error_text}\n")
+        except OSError:
+            pass
+
+    @property
+    def elapsed(self) -> float:
+        if not self.start_time:
+            return 0.0
+        end_time = self.end_time if self.end_time else time.perf_counter()
+        return end_time - self.start_time
+
+    def run(self):
+        self.start_time = time.perf_counter()
+        try:
+            return self.func(self, *self.args)
+        finally:
+            self.end_time = time.perf_counter()
+
+
+class phase_scheduler(object):
+
+    def __init__(self, name=None, workers=None, fail_fast=True):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.name = name
+        self.workers = workers
+        self.fail_fast = fail_fast
+        self.phases = {}
+        self.failed = False
+
+    def add_phase(self, name: str, func, *args, depends=(), log_dir=None, log_name='deploy.log'):
+        """Add a phase that calls func(phase, *args) once all the phases it depends on are complete"""
+        if name in self.phases:
+            raise SchedulerError(f"phase {name} already defined")
+        for dependency in depends:
+            if dependency not in self.phases:
+                raise SchedulerError(f"phase {name} depends on unknown phase {dependency}")
+        self.phases[name] = phase(name, func, args=args, depends=depends, log_dir=log_dir, log_name=log_name)
+
+    def all_phases(self):
+        for name in self.phases:
+            yield self.phases[name]
+
+    def ready(self, item: phase) -> bool:
+        return all(self.phases[dependency].status in ('complete', 'skipped') for dependency in item.depends)
+
+    def blocked(self, item: phase) -> bool:
+        return any(self.phases[dependency].status in ('failed', 'cancelled') for dependency in item.depends)
+
+    def cancel_all(self, running: dict):
+        for item in running.values():
+            item.cancel()
+
+    def run(self) -> bool:
+        """Run all phases, starting each one as soon as its dependencies complete"""
+        pending = dict(self.phases)
+        running = {}
+        display = progress_display(self)
+
+        workers = self.workers if self.workers else len(self.phases)
+
+        display.start()
+        executor = ThreadPoolExecutor(max_workers=max(workers, 1))
+        try:
+            while pending or running:
+                for name, item in list(pending.items()):
+                    if (self.failed and self.fail_fast) or self.blocked(item):
+                        item.status = 'cancelled'
+                        del pending[name]
+                    elif len(running) >= workers:
+                        continue
+                    elif self.ready(item):
+                        self.logger.info("Starting phase %s" % name)
+                        item.status = 'running'
+                        running[executor.submit(item.run)] = item
+                        del pending[name]
+
+                if not running:
+                    break
+
+                done, not_done = wait(list(running.keys()), return_when=FIRST_COMPLETED)
+                for future in done:
+                    item = running.pop(future)
+                    try:
+                        item.result = future.result()
+                        item.status = 'skipped' if item.skipped else 'complete'
+                    except PhaseCancelled:
+                        item.status = 'cancelled'
+                    except BaseException as err:
+                        item.status = 'failed'
+                        item.error = err
+                        item.log_error()
+                        self.failed = True
+                        self.logger.info("Phase %s failed: %s" % (item.name, item.error_text))
+                        if self.fail_fast:
+                            self.cancel_all(running)
+                    self.logger.info("Phase %s %s" % (item.name, item.status))
+        except BaseException:
+            self.failed = True
+            self.cancel_all(running)
+            raise
+        finally:
+            executor.shutdown(wait=True)
+            display.stop()
+
+        self.summary()
+        return not self.failed
+
+    def summary(self):
+        name_width = max([len(name) for name in self.phases] + [5])
+        print("Phase".ljust(name_width) + "  " + "Status".ljust(10) + "  Time")
+        for item in self.all_phases():
+            run_time = time.strftime("%H:%M:%S", time.gmtime(item.elapsed))
+            line = item.name.ljust(name_width) + "  " + item.status.ljust(10) + "  " + run_time
+            if item.status == 'failed':
+                line = line + "  " + item.error_text
+                if item.log_dir:
+                    line = line + f" (see {item.log_dir}/{item.log_name})"
+            elif item.result and isinstance(item.result, (str, list)):
+                line = line + "  " + (item.result if isinstance(item.result, str) else ', '.join(item.result))
+            print(line)
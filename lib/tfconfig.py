@@ -0,0 +1,149 @@
+##
+##
+
+import logging
+import threading
+import os
+import re
+from lib.location import location
+from lib.exceptions import *
+
+
+class tf_config(object):
+    """Shared terraform CLI configuration with a provider plugin cache and an optional filesystem mirror"""
+    _lock = threading.Lock()
+
+    def __init__(self):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.lc = location()
+        self.config_file = self.lc.tf_cli_config
+        self.cache_dir = self.lc.tf_plugin_cache
+        self.mirror_dir = self.lc.tf_provider_mirror
+
+    def mirrored_providers(self) -> list:
+        """List provider addresses (host/namespace/type) available in the filesystem mirror"""
+        providers = []
+
+        if not os.path.isdir(self.mirror_dir):
+            return providers
+
+        for hostname in sorted(os.listdir(self.mirror_dir)):
+            host_dir = self.mirror_dir + '/' + hostname
+            if not os.path.isdir(host_dir):
+                continue
+            for namespace in sorted(os.listdir(host_dir)):
+                namespace_dir = host_dir + '/' + namespace
+                if not os.path.isdir(namespace_dir):
+                    continue
+                for provider_type in sorted(os.listdir(namespace_dir)):
+                    if os.path.isdir(namespace_dir + '/' + provider_type):
+                        providers.append(f"{hostname}/{namespace}/{provider_type}")
+
+        return providers
+
+    def cached_providers(self) -> list:
+        """List provider versions present in the plugin cache"""
+        providers = []
+
+        if not os.path.isdir(self.cache_dir):
+            return providers
+
+        for root, dirs, files in os.walk(self.cache_dir):
+            relative = os.path.relpath(root, self.cache_dir).split(os.sep)
+            if len(relative) == 5:
+                providers.append(f"{'/'.join(relative[0:3])} {relative[3]} {relative[4]}")
+                dirs.clear()
+
+        return sorted(providers)
+
+    def list_providers(self):
+        print(f"Plugin cache: {self.cache_dir}")
+        for provider in self.cached_providers():
+            print(f" {provider}")
+        print(f"Provider mirror: {self.mirror_dir}")
+        for provider in self.mirrored_providers():
+            print(f" {provider}")
+
+    def user_config_file(self):
+        """The CLI config terraform would use without cloudmgr (TF_CLI_CONFIG_FILE or ~/.terraformrc), None if there is none"""
+        config_file = os.environ.get('TF_CLI_CONFIG_FILE')
+
+        if not config_file:
+            if os.name == 'nt':
+                config_file = os.path.join(os.environ.get('APPDATA', ''), 'terraform.rc')
+            else:
+                config_file = os.path.expanduser('~/.terraformrc')
+
+        if not os.path.isfile(config_file) or os.path.abspath(config_file) == os.path.abspath(self.config_file):
+            return None
+
+        return config_file
+
+    def user_config(self) -> str:
+        config_file = self.user_config_file()
+
+        if not config_file:
+            return ""
+
+        try:
+            with open(config_file, 'r') as user_file:
+                return user_file.read()
+        except OSError as err:
+            raise TerraformRunError(f"can not read terraform CLI config {config_file}: {err}")
+
+    def config_text(self) -> str:
+        """The user CLI config (credentials, plugin cache and provider installation) with the shared cache and mirror added where it does not set them"""
+        user_text = self.user_config()
+        providers = self.mirrored_providers()
+        provider_list = ', '.join([f'"{provider}"' for provider in providers])
+        lines = [user_text.rstrip("\n")] if user_text.strip() else []
+
+        if re.search(r'^\s*plugin_cache_dir\s*=', user_text, re.MULTILINE):
+            self.logger.info("Using the plugin cache directory set in %s" % self.user_config_file())
+        else:
+            lines.append(f'plugin_cache_dir = "{self.cache_dir}"')
+
+        if re.search(r'^\s*provider_installation\s*\{', user_text, re.MULTILINE):
+            self.logger.info("Using the provider installation methods set in %s" % self.user_config_file())
+        elif providers:
+            lines.extend([
+                'provider_installation {',
+                '  filesystem_mirror {',
+                f'    path    = "{self.mirror_dir}"',
+                f'    include = [{provider_list}]',
+                '  }',
+                '  direct {',
+                f'    exclude = [{provider_list}]',
+                '  }',
+                '}',
+            ])
+
+        return "\n".join(lines) + "\n"
+
+    def write(self):
+        """Create the cache directory and update the CLI config file if its contents changed"""
+        config_text = self.config_text()
+
+        with tf_config._lock:
+            try:
+                os.makedirs(self.cache_dir, exist_ok=True)
+                if os.path.exists(self.config_file):
+                    with open(self.config_file, 'r') as config_file:
+                        if config_file.read() == config_text:
+                            return
+                # the user config can hold registry credentials
+                with open(os.open(self.config_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'w') as config_file:
+                    config_file.write(config_text)
+            except OSError as err:
+                raise TerraformRunError(f"can not write terraform CLI config {self.config_file}: {err}")
+
+        self.logger.info("Wrote terraform CLI config %s" % self.config_file)
+
+    def environment(self) -> dict:
+        """Environment for terraform child processes, using the user CLI config merged with the shared cache and mirror"""
+        env = dict(os.environ)
+
+        self.write()
+        env['TF_CLI_CONFIG_FILE'] = self.config_file
+
+        return env
@@ -0,0 +1,148 @@
+##
+##
+
+import json
+import re
+import time
+
+THROTTLE_ERRORS = re.compile(r'RequestLimitExceeded|Throttling|ThrottlingException|Rate exceeded|rateLimitExceeded|'
+                             r'userRateLimitExceeded|TooManyRequests|429 Too Many|RetryableError.*throttl', re.IGNORECASE)
+
+
+class tf_event(object):
+    """Terraform machine readable UI message"""
+
+    def __init__(self, data: dict):
+        self.data = data
+        self.level = data.get('@level')
+        self.message = data.get('@message', '')
+        self.timestamp = data.get('@timestamp')
+        self.type = data.get('type')
+        self.hook = data.get('hook', {})
+        self.diagnostic = data.get('diagnostic', {})
+        self.changes = data.get('changes', {})
+
+    @classmethod
+    def parse(cls, line: str):
+        """Parse a line of terraform -json output, returns None if the line is not a UI message"""
+        if not line.startswith('{'):
+            return None
+        try:
+            data = json.loads(line)
+        except ValueError:
+            return None
+        if not isinstance(data, dict) or 'type' not in data:
+            return None
+        return cls(data)
+
+    @property
+    def address(self) -> str:
+        resource = self.hook.get('resource', {})
+        if resource:
+            return resource.get('addr')
+        return self.diagnostic.get('address')
+
+    @property
+    def action(self) -> str:
+        return self.hook.get('action')
+
+    @property
+    def provisioner(self) -> str:
+        return self.hook.get('provisioner')
+
+    @property
+    def output(self) -> str:
+        return self.hook.get('output')
+
+    @property
+    def elapsed(self):
+        return self.hook.get('elapsed_seconds')
+
+    @property
+    def severity(self) -> str:
+        return self.diagnostic.get('severity')
+
+    @property
+    def summary(self) -> str:
+        return self.diagnostic.get('summary')
+
+    @property
+    def detail(self) -> str:
+        return self.diagnostic.get('detail')
+
+    @property
+    def is_error(self) -> bool:
+        return self.type == 'diagnostic' and self.severity == 'error'
+
+    @property
+    def is_throttle(self) -> bool:
+        return self.is_error and THROTTLE_ERRORS.search(f"{self.summary} {self.detail}") is not None
+
+
+class resource_timer(object):
+    """Track the apply and provisioner steps of each resource from the event stream"""
+
+    def __init__(self):
+        self.running = {}
+        self.steps = []
+        self.planned = None
+        self.applied = 0
+        self.diagnostics = []
+
+    def add(self, event: tf_event):
+        now = time.perf_counter()
+
+        if event.type == 'apply_start':
+            self.running[(event.address, event.action)] = now
+        elif event.type in ('apply_complete', 'apply_errored'):
+            if event.type == 'apply_complete':
+                self.applied += 1
+            self.finish(event.address, event.action, event, now)
+        elif event.type == 'provision_start':
+            self.running[(event.address, event.provisioner)] = now
+        elif event.type in ('provision_complete', 'provision_errored'):
+            self.finish(event.address, event.provisioner, event, now)
+        elif event.type == 'change_summary' and event.changes.get('operation') == 'plan':
+            self.planned = event.changes.get('add', 0) + event.changes.get('change', 0) + event.changes.get('remove', 0)
+        elif event.type == 'diagnostic':
+            self.diagnostics.append(event)
+
+    def finish(self, address: str, step: str, event: tf_event, now: float):
+        start_time = self.running.pop((address, step), None)
+        if event.elapsed is not None:
+            seconds = float(event.elapsed)
+        elif start_time is not None:
+            seconds = now - start_time
+        else:
+            seconds = 0.0
+        status = 'failed' if event.type.endswith('_errored') else 'complete'
+        self.steps.append((address, step, seconds, status))
+
+    @property
+    def errors(self) -> list:
+        return [event for event in self.diagnostics if event.is_error]
+
+    @property
+    def throttled(self) -> bool:
+        return any(event.is_throttle for event in self.diagnostics)
+
+    def status_line(self) -> str:
+        total = f"/{self.planned}" if self.planned is not None else ""
+        line = f"{self.applied}{total} resources complete"
+        if self.running:
+            (address, step), start_time = min(self.running.items(), key=lambda item: item[1])
+            elapsed = time.strftime("%M:%S", time.gmtime(time.perf_counter() - start_time))
+            more = f" (+{len(self.running) - 1})" if len(self.running) > 1 else ""
+            line = line + f", {step} {address} {elapsed}{more}"
+        return line
+
+    def table(self) -> list:
+        lines = []
+        if not self.steps:
+            return lines
+        address_width = max([len(step[0]) for step in self.steps] + [8])
+        step_width = max([len(step[1]) for step in self.steps] + [4])
+        lines.append("Resource".ljust(address_width) + "  " + "Step".ljust(step_width) + "  " + "Status".ljust(8) + "  Time")
+        for address, step, seconds, status in sorted(self.steps, key=lambda item: item[2], reverse=True):
+            lines.append(address.ljust(address_width) + "  " + step.ljust(step_width) + "  " + status.ljust(8) + f"  {seconds:.0f}s")
+        return lines
@@ -0,0 +1,358 @@
+##
+##
+
+import logging
+import json
+import hashlib
+import os
+import re
+
+
+class tf_state(object):
+    SUPPORTED_VERSIONS = [4]
+
+    def __init__(self, working_dir):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.working_dir = working_dir
+        self.state_file = working_dir + '/terraform.tfstate'
+        self.backend_file = working_dir + '/.terraform/terraform.tfstate'
+        self.workspace_file = working_dir + '/.terraform/environment'
+        self.state_data = None
+
+    def is_local(self) -> bool:
+        """Check that the root uses the default workspace of a local backend"""
+        if os.path.exists(self.workspace_file):
+            try:
+                with open(self.workspace_file, 'r') as ws_file:
+                    workspace = ws_file.read().strip()
+            except OSError:
+                return False
+            if workspace and workspace != 'default':
+                self.logger.info("Workspace %s is selected in %s" % (workspace, self.working_dir))
+                return False
+
+        if not os.path.exists(self.backend_file):
+            return True
+
+        try:
+            with open(self.backend_file, 'r') as backend_file:
+                backend_data = json.load(backend_file)
+        except (OSError, ValueError):
+            return False
+
+        backend = backend_data.get('backend')
+        if backend and backend.get('type', 'local') != 'local':
+            self.logger.info("Backend type %s configured in %s" % (backend.get('type'), self.working_dir))
+            return False
+
+        return True
+
+    def read(self):
+        """Read the local state file, returns None if the state can not be read in-process"""
+        if not self.is_local():
+            return None
+
+        if not os.path.exists(self.state_file):
+            self.state_data = {}
+            return self.state_data
+
+        try:
+            with open(self.state_file, 'r') as state_file:
+                state_data = json.load(state_file)
+        except (OSError, ValueError) as err:
+            self.logger.info("Can not read state file %s: %s" % (self.state_file, err))
+            return None
+
+        if state_data.get('version') not in tf_state.SUPPORTED_VERSIONS:
+            self.logger.info("Unsupported state format version %s in %s" % (state_data.get('version'), self.state_file))
+            return None
+
+        self.state_data = state_data
+        return self.state_data
+
+    def fingerprint(self) -> dict:
+        """Identify the local state by file size, modification time and serial, returns an empty fingerprint for remote or workspace state"""
+        serial = None
+
+        if not self.is_local() or not os.path.exists(self.state_file):
+            return {}
+
+        try:
+            with open(self.state_file, 'r') as state_file:
+                serial = json.load(state_file).get('serial')
+        except (OSError, ValueError):
+            pass
+
+        file_stat = os.stat(self.state_file)
+        return {
+            'file': os.path.basename(self.state_file),
+            'size': file_stat.st_size,
+            'mtime': file_stat.st_mtime_ns,
+            'serial': serial,
+        }
+
+    def outputs(self):
+        """Get root module outputs in the format of terraform output -json"""
+        env_data = {}
+
+        if self.read() is None:
+            return None
+
+        for name, output in self.state_data.get('outputs', {}).items():
+            env_data[name] = {
+                'sensitive': output.get('sensitive', False),
+                'type': output.get('type'),
+                'value': output.get('value'),
+            }
+
+        return env_data
+
+    @staticmethod
+    def split_address(address: str) -> tuple:
+        """Split a resource instance address into the resource address and instance key"""
+        match = re.match(r'^(.*)\[([^\[\]]*)\]$', address)
+        if not match:
+            return address, None
+        key = match.group(2)
+        return match.group(1), json.loads(key) if key.startswith('"') else int(key)
+
+    def instances(self) -> list:
+        """List the resource instances in state with their address, status and dependencies"""
+        instance_list = []
+
+        if not self.read():
+            return instance_list
+
+        for resource in self.state_data.get('resources', []):
+            resource_address = f"{resource['type']}.{resource['name']}"
+            if resource.get('mode') == 'data':
+                resource_address = 'data.' + resource_address
+            if resource.get('module'):
+                resource_address = resource['module'] + '.' + resource_address
+            for instance in resource.get('instances', []):
+                key = instance.get('index_key')
+                if key is None:
+                    address = resource_address
+                elif isinstance(key, str):
+                    address = f"{resource_address}[{json.dumps(key)}]"
+                else:
+                    address = f"{resource_address}[{key}]"
+                instance_list.append({
+                    'address': address,
+                    'resource': resource_address,
+                    'type': resource['type'],
+                    'key': key,
+                    'mode': resource.get('mode', 'managed'),
+                    'status': instance.get('status'),
+                    'dependencies': instance.get('dependencies', []),
+                })
+
+        return instance_list
+
+    def tainted(self) -> list:
+        return [instance['address'] for instance in self.instances() if instance['status'] == 'tainted']
+
+    def dependents(self, addresses: list) -> list:
+        """Find the instances that depend on the addresses, directly or indirectly, with the same key or no key"""
+        instance_list = self.instances()
+        found = []
+        frontier = [self.split_address(address) for address in addresses]
+
+        while frontier:
+            resource, key = frontier.pop()
+            for instance in instance_list:
+                if instance['address'] in addresses or instance['address'] in found:
+                    continue
+                if resource not in instance['dependencies']:
+                    continue
+                if instance['key'] is not None and instance['key'] != key:
+                    continue
+                found.append(instance['address'])
+                frontier.append((instance['resource'], instance['key'] if instance['key'] is not None else key))
+
+        return found
+
+
+class output_cache(object):
+
+    def __init__(self, working_dir):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.cache_file = working_dir + '/outputs.json'
+
+    def get(self, fingerprint: dict):
+        if not fingerprint or not os.path.exists(self.cache_file):
+            return None
+
+        try:
+            with open(self.cache_file, 'r') as cache_file:
+                cache_data = json.load(cache_file)
+        except (OSError, ValueError):
+            return None
+
+        if cache_data.get('fingerprint') != fingerprint:
+            self.logger.info("Output cache %s is stale" % self.cache_file)
+            return None
+
+        return cache_data.get('outputs')
+
+    def put(self, fingerprint: dict, outputs: dict):
+        if not fingerprint:
+            return
+
+        cache_data = {
+            'fingerprint': fingerprint,
+            'outputs': outputs,
+        }
+
+        try:
+            with open(self.cache_file, 'w') as cache_file:
+                json.dump(cache_data, cache_file, indent=2)
+                cache_file.write("\n")
+        except OSError as err:
+            self.logger.info("Can not write output cache %s: %s" % (self.cache_file, err))
+
+    def invalidate(self):
+        if os.path.exists(self.cache_file):
+            try:
+                os.remove(self.cache_file)
+            except OSError as err:
+                self.logger.info("Can not remove output cache %s: %s" % (self.cache_file, err))
+
+
+class config_fingerprint(object):
+    """Record the configuration hash after successful init and validate runs"""
+
+    def __init__(self, working_dir, version=None):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.working_dir = working_dir
+        self.version = version
+        self.record_file = working_dir + '/.terraform/cloudmgr.json'
+
+    def config_files(self) -> list:
+        file_list = []
+
+        for file_name in sorted(os.listdir(self.working_dir)):
+            if file_name.endswith('.tf') or file_name.endswith('.tf.json') or file_name == '.terraform.lock.hcl':
+                file_list.append(file_name)
+
+        return file_list
+
+    def compute(self) -> str:
+        digest = hashlib.sha256()
+        digest.update(str(self.version).encode('utf-8'))
+
+        for file_name in self.config_files():
+            digest.update(file_name.encode('utf-8'))
+            with open(self.working_dir + '/' + file_name, 'rb') as config_file:
+                digest.update(config_file.read())
+
+        return digest.hexdigest()
+
+    def read(self) -> dict:
+        if not os.path.exists(self.record_file):
+            return {}
+
+        try:
+            with open(self.record_file, 'r') as record_file:
+                return json.load(record_file)
+        except (OSError, ValueError):
+            return {}
+
+    def check(self, step: str) -> bool:
+        """Check if the step has completed against the current configuration"""
+        record = self.read()
+
+        try:
+            current = self.compute()
+        except OSError:
+            return False
+
+        if record.get('fingerprint') != current:
+            return False
+
+        return step in record.get('steps', [])
+
+    def record(self, step: str):
+        record = self.read()
+
+        try:
+            current = self.compute()
+        except OSError as err:
+            self.logger.info("Can not compute configuration fingerprint in %s: %s" % (self.working_dir, err))
+            return
+
+        if record.get('fingerprint') != current:
+            record = {
+                'fingerprint': current,
+                'steps': [],
+            }
+
+        if step not in record['steps']:
+            record['steps'].append(step)
+
+        try:
+            os.makedirs(os.path.dirname(self.record_file), exist_ok=True)
+            with open(self.record_file, 'w') as record_file:
+                json.dump(record, record_file, indent=2)
+                record_file.write("\n")
+        except OSError as err:
+            self.logger.info("Can not write configuration fingerprint %s: %s" % (self.record_file, err))
+
+    def invalidate(self):
+        if os.path.exists(self.record_file):
+            try:
+                os.remove(self.record_file)
+            except OSError as err:
+                self.logger.info("Can not remove configuration fingerprint %s: %s" % (self.record_file, err))
+
+
+class saved_plan(object):
+    """Track a saved plan file and the inputs it was created from"""
+
+    def __init__(self, working_dir, plan_file):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.plan_file = plan_file
+        self.record_file = working_dir + '/.terraform/cloudmgr-plan.json'
+
+    def get(self, key: dict):
+        """Check for a saved plan with changes for the key, returns None if the plan has to be created again"""
+        if not os.path.exists(self.record_file):
+            return None
+
+        try:
+            with open(self.record_file, 'r') as record_file:
+                record = json.load(record_file)
+        except (OSError, ValueError):
+            return None
+
+        if record.get('key') != key:
+            self.logger.info("Saved plan %s is stale" % self.plan_file)
+            return None
+
+        # a plan without changes is not reused, so drift made outside terraform is found by the next plan
+        if not record.get('changes') or not os.path.exists(self.plan_file):
+            return None
+
+        return True
+
+    def put(self, key: dict, changes: bool):
+        record = {
+            'key': key,
+            'changes': changes,
+        }
+
+        try:
+            os.makedirs(os.path.dirname(self.record_file), exist_ok=True)
+            with open(self.record_file, 'w') as record_file:
+                json.dump(record, record_file, indent=2)
+                record_file.write("\n")
+        except OSError as err:
+            self.logger.info("Can not write plan record %s: %s" % (self.record_file, err))
+
+    def invalidate(self):
+        for file_name in (self.record_file, self.plan_file):
+            if os.path.exists(file_name):
+                try:
+                    os.remove(file_name)
+                except OSError as err:
+                    self.logger.info("Can not remove %s: %s" % (file_name, err))
@@ -127,7 +127,7 @@ class toolbox(object):
     def check_image_name_format(self, name):
         try:
             name_fields = name.split('-')
-            if name_fields[2] == 'couchbase' and len(name_fields) == 7:
+            if name_fields[2] in ('couchbase', 'base') and len(name_fields) == 7:
                 return True
         except IndexError:
             pass
@@ -21,6 +21,7 @@ class varfile(object):
         ('OS_ISO_CHECKSUM', 'os_iso_checksum', 'get_iso_checksum', None),
         ('VMWARE_OS_TYPE', 'vm_guest_os_type', 'get_vmware_guest_type', None),
         ('OS_SW_URL', 'os_sw_url', 'get_sw_url', None),
+        ('OS_ARCH', 'os_arch', 'get_arch', None),
     ]
 
     def __init__(self):
@@ -38,6 +39,7 @@ class varfile(object):
         self.os_type = 'linux'
         self.os_name = None
         self.os_ver = None
+        self.arch = 'x86_64'
         self.cloud = None
         self.image_owner = None
         self.image_user = None
@@ -51,6 +53,7 @@ class varfile(object):
         self.vmware_guest_type = None
         self.var_file = None
         self.hcl_file = None
+        self.layer_file = None
 
         self.lc = location()
 
@@ -84,6 +87,14 @@ class varfile(object):
     def set_os_ver(self, release: str):
         self.os_ver = release
 
+    def set_arch(self, arch: str):
+        self.arch = arch
+
+    def get_arch(self, write=None):
+        if write:
+            self.arch = write
+        return self.arch
+
     def set_cloud(self, cloud: str):
         self.cloud = cloud
 
@@ -274,11 +285,25 @@ class varfile(object):
         self.hcl_file = self.get_os_var('hcl')
         return self.hcl_file
 
+    def get_layer_file(self, write=None):
+        if write:
+            self.layer_file = write
+            return self.layer_file
+
+        self.layer_file = self.get_os_var('layer')
+        return self.layer_file
+
     def get_os_var(self, key: str) -> str:
         try:
             for i in range(len(self.active_packer_vars[self.os_type][self.os_name])):
                 if self.active_packer_vars[self.os_type][self.os_name][i]['version'] == self.os_ver:
-                    return self.active_packer_vars[self.os_type][self.os_name][i][key]
+                    os_vars = self.active_packer_vars[self.os_type][self.os_name][i]
+                    if self.arch != 'x86_64':
+                        if self.arch not in os_vars:
+                            raise VarFileError(f"{self.os_name} {self.os_ver} is not available for {self.arch} on {self.cloud}")
+                        if key in os_vars[self.arch]:
+                            return os_vars[self.arch][key]
+                    return os_vars[key]
         except KeyError:
             raise VarFileError(f"value {key} not in {self.cloud} packer variables for {self.os_name} {self.os_type}")
 
@@ -7,14 +7,18 @@ import random
 import string
 import os
 import json
+import re
 from typing import Union
-from pyVim.connect import SmartConnectNoSSL
+from pyVim.task import WaitForTask
 from pyVmomi import vim, vmodl
 from lib.varfile import varfile
 from lib.exceptions import VMwareDriverError
 from lib.ask import ask
 from lib.toolbox import toolbox
 from lib.prereq import prereq
+from lib.imagecache import image_index
+from lib.clients import cloud_clients
+from lib.inventory import inventory_cache
 
 
 class vmware(object):
@@ -131,7 +135,6 @@ class vmware(object):
 
     def vmware_get_template(self, select=True, default=None, write=None) -> Union[dict, list[dict]]:
         inquire = ask()
-        tb = toolbox()
 
         if write:
             self.vmware_template = write
@@ -140,12 +143,48 @@ class vmware(object):
         if self.vmware_template:
             return self.vmware_template
 
+        if select:
+            templates = [image for image in image_index().current(self.image_scope) if image.get('stage') != 'base']
+            if templates:
+                selection = inquire.ask_list('Select template', templates, default=default)
+                if self.vmware_template_exists(templates[selection]['name']):
+                    self.vmware_template = templates[selection]
+                    return self.vmware_template
+                print(f"Template {templates[selection]['name']} no longer exists, listing templates again")
+
+        templates = self.vmware_list_templates()
+
+        if select:
+            templates = [image for image in templates if image.get('stage') != 'base']
+            selection = inquire.ask_list('Select template', templates, default=default)
+            self.vmware_template = templates[selection]
+        else:
+            self.vmware_template = templates
+
+        return self.vmware_template
+
+    @property
+    def image_scope(self) -> str:
+        return f"vmware:{self.vmware_hostname}"
+
+    def vmware_template_exists(self, name: str) -> bool:
+        try:
+            si = cloud_clients.vmware(self.vmware_hostname, self.vmware_username, self.vmware_password)
+            content = si.RetrieveContent()
+            container = content.viewManager.CreateContainerView(content.rootFolder, [vim.VirtualMachine], True)
+            found = any(managed_object_ref.config.template and managed_object_ref.name == name for managed_object_ref in container.view)
+            container.Destroy()
+        except Exception as err:
+            self.logger.info("Can not find template %s: %s" % (name, err))
+            return False
+        return found
+
+    def vmware_list_templates(self) -> list[dict]:
+        tb = toolbox()
         templates = []
+
         try:
-            si = SmartConnectNoSSL(host=self.vmware_hostname,
-                                   user=self.vmware_username,
-                                   pwd=self.vmware_password,
-                                   port=443)
+            si = cloud_clients.vmware(self.vmware_hostname, self.vmware_username, self.vmware_password)
             content = si.RetrieveContent()
             container = content.viewManager.CreateContainerView(content.rootFolder, [vim.VirtualMachine], True)
             for managed_object_ref in container.view:
@@ -156,39 +195,41 @@ class vmware(object):
                     if tb.check_image_name_format(image_block['name']):
                         image_block['type'] = tb.get_linux_type_from_image_name(image_block['name'])
                         image_block['release'] = tb.get_linux_release_from_image_name(image_block['name'])
+                        notes = managed_object_ref.config.annotation or ''
+                        for key, pattern in (('digest', r'Digest ([0-9a-f]+)'), ('stage', r'Stage (\w+)'), ('base', r'Base (\S+)')):
+                            match = re.search(pattern, notes)
+                            if match:
+                                image_block[key] = match.group(1)
                         templates.append(image_block)
             container.Destroy()
-            if select:
-                selection = inquire.ask_list('Select template', templates, default=default)
-                self.vmware_template = templates[selection]
-            else:
-                self.vmware_template = templates
-
-            return self.vmware_template
         except Exception as err:
             raise VMwareDriverError(f"can not get template: {err}")
 
+        image_index().refresh(self.image_scope, templates)
+        return templates
+
     @prereq(requirements=('vmware_get_template',))
     def get_image(self):
         return self.vmware_template
 
-    def vmware_delete_template(self, name: str):
+    def vmware_delete_template(self, name: str, confirm=True):
+        """Destroy a template and wait for the task to complete"""
         inquire = ask()
 
-        if inquire.ask_yn(f"Delete template {name}", default=True):
+        if not confirm or inquire.ask_yn(f"Delete template {name}", default=True):
             try:
-                si = SmartConnectNoSSL(host=self.vmware_hostname,
-                                       user=self.vmware_username,
-                                       pwd=self.vmware_password,
-                                       port=443)
+                si = cloud_clients.vmware(self.vmware_hostname, self.vmware_username, self.vmware_password)
                 content = si.RetrieveContent()
                 container = content.viewManager.CreateContainerView(content.rootFolder, [vim.VirtualMachine], True)
                 for managed_object_ref in container.view:
                     if managed_object_ref.config.template:
                         if managed_object_ref.name == name:
                             task = managed_object_ref.Destroy_Task()
+                            WaitForTask(task)
+                container.Destroy()
             except Exception as err:
                 raise VMwareDriverError(f"can not delete template: {err}")
+            image_index().remove(self.image_scope, name)
 
     def vmware_get_build_password(self, default=None, write=None) -> str:
         inquire = ask()
@@ -216,7 +257,6 @@ class vmware(object):
 
     def vmware_get_dvs_network(self, default=None, write=None) -> str:
         inquire = ask()
-        pgList = []
 
         if write:
             self.vmware_network = write
@@ -225,17 +265,18 @@ class vmware(object):
         if self.vmware_network:
             return self.vmware_network
 
-        try:
-            si = SmartConnectNoSSL(host=self.vmware_hostname,
-                                   user=self.vmware_username,
-                                   pwd=self.vmware_password,
-                                   port=443)
+        def query():
+            pgList = []
+            si = cloud_clients.vmware(self.vmware_hostname, self.vmware_username, self.vmware_password)
             content = si.RetrieveContent()
             container = content.viewManager.CreateContainerView(self.vmware_network_folder, [vim.dvs.DistributedVirtualPortgroup], True)
             for managed_object_ref in container.view:
                 pgList.append(managed_object_ref.name)
             container.Destroy()
-            pgList = sorted(set(pgList))
+            return sorted(set(pgList))
+
+        try:
+            pgList = self.vmware_inventory('network', 'port_groups', query)
             selection = inquire.ask_list('Select port group', pgList, default=default)
             self.vmware_network = pgList[selection]
             return self.vmware_network
@@ -244,7 +285,6 @@ class vmware(object):
 
     def vmware_get_dvs_switch(self, default=None, write=None) -> str:
         inquire = ask()
-        dvsList = []
 
         if write:
             self.vmware_dvs = write
@@ -253,11 +293,9 @@ class vmware(object):
         if self.vmware_dvs:
             return self.vmware_dvs
 
-        try:
-            si = SmartConnectNoSSL(host=self.vmware_hostname,
-                                   user=self.vmware_username,
-                                   pwd=self.vmware_password,
-                                   port=443)
+        def query():
+            dvsList = []
+            si = cloud_clients.vmware(self.vmware_hostname, self.vmware_username, self.vmware_password)
             content = si.RetrieveContent()
             container = content.viewManager.CreateContainerView(self.vmware_network_folder,
                                                                 [vim.dvs.VmwareDistributedVirtualSwitch],
@@ -265,6 +303,10 @@ class vmware(object):
             for managed_object_ref in container.view:
                 dvsList.append(managed_object_ref.name)
             container.Destroy()
+            return dvsList
+
+        try:
+            dvsList = self.vmware_inventory('network', 'switches', query)
             selection = inquire.ask_list('Select distributed switch', dvsList, default=default)
             self.vmware_dvs = dvsList[selection]
             return self.vmware_dvs
@@ -362,14 +404,10 @@ class vmware(object):
         if self.vmware_datastore:
             return self.vmware_datastore
 
-        try:
-            si = SmartConnectNoSSL(host=self.vmware_hostname,
-                                   user=self.vmware_username,
-                                   pwd=self.vmware_password,
-                                   port=443)
+        def query():
+            datastores = []
+            si = cloud_clients.vmware(self.vmware_hostname, self.vmware_username, self.vmware_password)
             content = si.RetrieveContent()
-            datastore_name = []
-            datastore_type = []
             container = content.viewManager.CreateContainerView(content.rootFolder, [vim.HostSystem], True)
             esxi_hosts = container.view
             for esxi_host in esxi_hosts:
@@ -378,10 +416,15 @@ class vmware(object):
                 for host_mount_info in host_file_sys_vol_mount_info:
                     if host_mount_info.volume.type == 'VFFS' or host_mount_info.volume.type == 'OTHER':
                         continue
-                    datastore_name.append(host_mount_info.volume.name)
-                    datastore_type.append(host_mount_info.volume.type)
-            selection = inquire.ask_list('Select datastore', datastore_name, datastore_type, default=default)
+                    datastores.append({'name': host_mount_info.volume.name, 'type': host_mount_info.volume.type})
             container.Destroy()
+            return datastores
+
+        try:
+            datastores = self.vmware_inventory('storage', 'datastores', query)
+            datastore_name = [datastore['name'] for datastore in datastores]
+            datastore_type = [datastore['type'] for datastore in datastores]
+            selection = inquire.ask_list('Select datastore', datastore_name, datastore_type, default=default)
             self.vmware_datastore = datastore_name[selection]
             return self.vmware_datastore
         except Exception as err:
@@ -397,17 +440,21 @@ class vmware(object):
         if self.vmware_cluster:
             return self.vmware_cluster
 
+        def query():
+            return [c.name for c in self.vmware_host_folder.childEntity if isinstance(c, vim.ClusterComputeResource)]
+
         try:
-            clusters = []
-            for c in self.vmware_host_folder.childEntity:
-                if isinstance(c, vim.ClusterComputeResource):
-                    clusters.append(c.name)
+            clusters = self.vmware_inventory('storage', 'clusters', query)
             selection = inquire.ask_list('Select cluster', clusters, default=default)
             self.vmware_cluster = clusters[selection]
             return self.vmware_cluster
         except Exception as err:
             raise VMwareDriverError(f"can not get cluster: {err}")
 
+    def vmware_inventory(self, kind: str, query_name: str, query, *params):
+        """Get the result of an inventory query from the cache, running the query if it is not cached"""
+        return inventory_cache().get(kind, ('vmware', self.vmware_hostname, self.vmware_datacenter, query_name, *params), query)
+
     def vmware_get_datacenter(self, default=None, write=None) -> str:
         inquire = ask()
 
@@ -415,21 +462,24 @@ class vmware(object):
             self.vmware_datacenter = write
             return self.vmware_datacenter
 
-        try:
-            si = SmartConnectNoSSL(host=self.vmware_hostname,
-                                   user=self.vmware_username,
-                                   pwd=self.vmware_password,
-                                   port=443)
+        def query():
+            si = cloud_clients.vmware(self.vmware_hostname, self.vmware_username, self.vmware_password)
             content = si.RetrieveContent()
-            datacenter = []
             container = content.viewManager.CreateContainerView(content.rootFolder, [vim.Datacenter], True)
+            names = [c.name for c in container.view]
+            container.Destroy()
+            return names
 
+        try:
             if not self.vmware_datacenter:
-                for c in container.view:
-                    datacenter.append(c.name)
+                datacenter = self.vmware_inventory('zone', 'datacenters', query)
                 selection = inquire.ask_list('Select datacenter', datacenter, default=default)
                 self.vmware_datacenter = datacenter[selection]
 
+            # the folders are managed objects, so they are looked up for the selected datacenter rather than cached
+            si = cloud_clients.vmware(self.vmware_hostname, self.vmware_username, self.vmware_password)
+            content = si.RetrieveContent()
+            container = content.viewManager.CreateContainerView(content.rootFolder, [vim.Datacenter], True)
             for c in container.view:
                 if c.name == self.vmware_datacenter:
                     self.vmware_dc_folder = c
@@ -0,0 +1,100 @@
+#!/usr/bin/env -S python3 -W ignore
+
+import os
+import sys
+import pytest
+
+current = os.path.dirname(os.path.realpath(__file__))
+parent = os.path.dirname(current)
+sys.path.append(parent)
+
+from lib.catalog import instance_catalog
+
+ROWS = [
+    {'name': 'm5.xlarge', 'vcpu': 4, 'mem': 16.0, 'arch': 'x86_64', 'net': 10.0, 'burst': False},
+    {'name': 'c5.2xlarge', 'vcpu': 8, 'mem': 16.0, 'arch': 'x86_64', 'net': None, 'burst': False},
+    {'name': 'r6g.xlarge', 'vcpu': 4, 'mem': 32.0, 'arch': 'arm64', 'net': 10.0, 'burst': False},
+    {'name': 't3.large', 'vcpu': 2, 'mem': 8.0, 'arch': 'x86_64', 'net': 5.0, 'burst': True},
+]
+
+
+@pytest.fixture(autouse=True)
+def default_filter():
+    instance_catalog.set_filter()
+    yield
+    instance_catalog.set_filter()
+
+
+def names(catalog):
+    return catalog.columns['name']
+
+
+def test_numeric_predicate():
+    catalog = instance_catalog.from_rows(ROWS)
+    assert catalog.mask('vcpu>=4') == [True, True, True, False]
+    assert names(catalog.filter('vcpu=4')) == ['m5.xlarge', 'r6g.xlarge']
+
+
+def test_ratio_predicate():
+    catalog = instance_catalog.from_rows(ROWS)
+    assert catalog.mask('mem/vcpu>=4') == [True, False, True, True]
+    assert names(catalog.filter('mem/vcpu>=8')) == ['r6g.xlarge']
+
+
+def test_string_predicate():
+    catalog = instance_catalog.from_rows(ROWS)
+    assert names(catalog.filter('arch=ARM64')) == ['r6g.xlarge']
+    assert names(catalog.filter('burst!=true')) == ['m5.xlarge', 'c5.2xlarge', 'r6g.xlarge']
+
+
+def test_multiple_predicates():
+    catalog = instance_catalog.from_rows(ROWS)
+    assert names(catalog.filter('vcpu>=4 arch=x86_64')) == ['m5.xlarge', 'c5.2xlarge']
+    assert len(catalog.filter('')) == len(ROWS)
+
+
+def test_none_values_do_not_match():
+    catalog = instance_catalog.from_rows(ROWS)
+    assert catalog.mask('net>=0') == [True, False, True, True]
+    assert catalog.mask('net/vcpu>0') == [True, False, True, True]
+
+
+@pytest.mark.parametrize('term', ['vcpu>=four', 'mem>', 'cores>=4', 'arch>arm64', 'vcpu~4'])
+def test_invalid_predicate(term):
+    catalog = instance_catalog.from_rows(ROWS)
+    with pytest.raises(SystemExit):
+        catalog.mask(term)
+
+
+def test_sort():
+    catalog = instance_catalog.from_rows(ROWS)
+    assert names(catalog.sort('vcpu,mem,name')) == ['t3.large', 'm5.xlarge', 'r6g.xlarge', 'c5.2xlarge']
+    assert names(catalog.sort('-vcpu,name')) == ['c5.2xlarge', 'm5.xlarge', 'r6g.xlarge', 't3.large']
+
+
+def test_sort_none_last():
+    catalog = instance_catalog.from_rows(ROWS)
+    assert names(catalog.sort('net'))[-1] == 'c5.2xlarge'
+    assert names(catalog.sort('-net'))[-1] == 'c5.2xlarge'
+
+
+def test_narrow():
+    catalog = instance_catalog.from_rows(ROWS)
+    assert names(catalog.narrow()) == ['m5.xlarge', 'r6g.xlarge', 'c5.2xlarge']
+    assert names(catalog.narrow(arch='arm64')) == ['r6g.xlarge']
+
+
+def test_narrow_keeps_previous_selection():
+    catalog = instance_catalog.from_rows(ROWS)
+    assert names(catalog.narrow(keep='t3.large')) == ['t3.large', 'm5.xlarge', 'r6g.xlarge', 'c5.2xlarge']
+
+
+def test_narrow_falls_back_to_all_types():
+    instance_catalog.set_filter('vcpu>=64')
+    catalog = instance_catalog.from_rows(ROWS)
+    assert len(catalog.narrow(arch='x86_64')) == 3
+
+
+def test_options():
+    catalog = instance_catalog.from_rows(ROWS[:1])
+    assert catalog.options() == [{'name': 'm5.xlarge', 'cpu': 4, 'mem': 16384}]
@@ -0,0 +1,44 @@
+#!/usr/bin/env -S python3 -W ignore
+
+import os
+import sys
+
+current = os.path.dirname(os.path.realpath(__file__))
+parent = os.path.dirname(current)
+sys.path.append(parent)
+
+from lib.imagecache import market_index
+
+IMAGES = [
+    {'name': 'ubuntu-22.04-server', 'date': '2024-01-10', 'description': 'Canonical Ubuntu 22.04'},
+    {'name': 'ubuntu-20.04-server', 'date': '2024-03-01', 'description': 'Canonical Ubuntu 20.04'},
+    {'name': 'pro-ubuntu-22.04-server', 'date': '2024-05-01', 'description': 'Ubuntu Pro 22.04'},
+    {'name': 'rhel-9.2-server', 'date': '2024-04-01', 'description': 'Red Hat Enterprise Linux 9'},
+]
+
+
+def names(image_list):
+    return [image['name'] for image in image_list]
+
+
+def test_prefix_matches_first():
+    result = market_index.search(IMAGES, 'ubuntu')
+    assert names(result) == ['ubuntu-20.04-server', 'ubuntu-22.04-server', 'pro-ubuntu-22.04-server']
+
+
+def test_all_words_match():
+    assert names(market_index.search(IMAGES, 'Ubuntu 22.04')) == ['ubuntu-22.04-server', 'pro-ubuntu-22.04-server']
+    assert market_index.search(IMAGES, 'ubuntu 9.2') == []
+
+
+def test_empty_text_newest_first():
+    assert names(market_index.search(IMAGES, '')) == ['pro-ubuntu-22.04-server', 'rhel-9.2-server', 'ubuntu-20.04-server', 'ubuntu-22.04-server']
+
+
+def test_limit():
+    assert names(market_index.search(IMAGES, 'server', limit=2)) == ['pro-ubuntu-22.04-server', 'rhel-9.2-server']
+
+
+def test_search_field():
+    assert names(market_index.search(IMAGES, 'red hat', field='description')) == ['rhel-9.2-server']
+    assert names(market_index.search(IMAGES, 'canonical', field='description')) == ['ubuntu-20.04-server', 'ubuntu-22.04-server']
@@ -0,0 +1,80 @@
+#!/usr/bin/env -S python3 -W ignore
+
+import os
+import sys
+
+current = os.path.dirname(os.path.realpath(__file__))
+parent = os.path.dirname(current)
+sys.path.append(parent)
+
+from lib.packerevents import packer_event, build_timer
+
+
+def test_parse_ignores_other_output():
+    assert packer_event.parse('Build finished') is None
+    assert packer_event.parse('==> amazon-ebs.linux: Waiting for AMI') is None
+    assert packer_event.parse('1700000000,') is None
+
+
+def test_parse_unescape():
+    item = packer_event.parse('1700000000,,ui,say,==> amazon-ebs.linux: Creating AMI%!(PACKER_COMMA) please wait\\n')
+    assert item.timestamp == 1700000000
+    assert item.target == ''
+    assert item.type == 'ui'
+    assert item.ui_type == 'say'
+    assert item.text == '==> amazon-ebs.linux: Creating AMI, please wait'
+
+
+def test_step():
+    assert packer_event.parse('1700000000,,ui,say,==> amazon-ebs.linux: Launching a source AWS instance...').step == ('amazon-ebs.linux', 'Launching a source AWS instance...')
+    assert packer_event.parse('1700000000,,ui,say,    amazon-ebs.linux: Instance ID: i-0123').step is None
+    assert packer_event.parse('1700000000,,ui,message,==> amazon-ebs.linux: output').step is None
+
+
+def test_error():
+    assert packer_event.parse('1700000000,,ui,error,Build \'amazon-ebs.linux\' errored').is_error
+    assert packer_event.parse('1700000000,amazon-ebs.linux,error,timeout waiting for SSH').is_error
+    assert not packer_event.parse('1700000000,,ui,say,done').is_error
+
+
+def test_build_timer():
+    timer = build_timer()
+    for line in [
+        '1700000000,,ui,say,==> amazon-ebs.linux: Launching a source AWS instance...',
+        '1700000030,,ui,message,    amazon-ebs.linux: Instance ID: i-0123',
+        '1700000060,,ui,say,==> amazon-ebs.linux: Provisioning with shell script',
+        '1700000300,,ui,error,Script exited with non-zero exit status',
+        '1700000400,,ui,say,==> amazon-ebs.linux: Creating AMI',
+    ]:
+        timer.add(packer_event.parse(line))
+    timer.finish('amazon-ebs.linux', 1700000500)
+
+    assert timer.steps == [
+        ('amazon-ebs.linux', 'Launching a source AWS instance...', 60, 'complete'),
+        ('amazon-ebs.linux', 'Provisioning with shell script', 340, 'complete'),
+        ('amazon-ebs.linux', 'Creating AMI', 100, 'complete'),
+    ]
+    assert timer.errors == ['Script exited with non-zero exit status']
+    assert timer.last_step == 'amazon-ebs.linux: Creating AMI'
+    assert timer.table()[1].startswith('Provisioning with shell script')
+
+
+def test_artifacts():
+    timer = build_timer()
+    for line in [
+        '1700000500,amazon-ebs.linux,artifact-count,1',
+        '1700000500,amazon-ebs.linux,artifact,0,builder-id,mitchellh.amazonebs',
+        '1700000500,amazon-ebs.linux,artifact,0,id,us-east-1:ami-0123%!(PACKER_COMMA)us-west-2:ami-4567',
+        '1700000500,amazon-ebs.linux,artifact,0,string,AMIs were created:\\nus-east-1: ami-0123',
+        '1700000500,amazon-ebs.linux,artifact,0,files-count,0',
+        '1700000500,googlecompute.linux,artifact,0,id,projects/project/global/images/cbs-7-2-0-2024-01-01-1200',
+        '1700000500,azure-arm.linux,artifact,0,builder-id,Azure.ResourceManagement.VMImage',
+    ]:
+        timer.add(packer_event.parse(line))
+
+    artifacts = timer.artifact_list
+    assert len(artifacts) == 2
+    assert artifacts[0].builder_id == 'mitchellh.amazonebs'
+    assert artifacts[0].image_ids == ['ami-0123', 'ami-4567']
+    assert artifacts[0].string == 'AMIs were created:\nus-east-1: ami-0123'
+    assert artifacts[1].image_id == 'cbs-7-2-0-2024-01-01-1200'
@@ -0,0 +1,69 @@
+#!/usr/bin/env -S python3 -W ignore
+
+import os
+import sys
+import pytest
+from datetime import datetime
+
+current = os.path.dirname(os.path.realpath(__file__))
+parent = os.path.dirname(current)
+sys.path.append(parent)
+
+image_manager = pytest.importorskip('lib.imagemgr').image_manager
+
+
+def image(name, release='jammy', version='7.2.0', stage=None, arch='x86_64', base=None, created=None):
+    item = {'name': name, 'type': 'ubuntu', 'release': release, 'version': version, 'arch': arch}
+    if stage:
+        item['stage'] = stage
+    if base:
+        item['base'] = base
+    if created:
+        item['datetime'] = created
+    return item
+
+
+def prune(image_list, keep):
+    manager = image_manager.__new__(image_manager)
+    return sorted([item['name'] for item in manager.prune_candidates(image_list, keep)])
+
+
+def test_image_time():
+    assert image_manager.image_time(image('cbs-jammy-2024-01-02-0304')) == datetime(2024, 1, 2, 3, 4).timestamp()
+    assert image_manager.image_time(image('cbs-jammy-2024-01-02-0304', created=datetime(2024, 2, 1))) == datetime(2024, 2, 1).timestamp()
+    assert image_manager.image_time(image('cbs-jammy')) == 0.0
+
+
+def test_keep_newest_per_group():
+    image_list = [
+        image('cbs-jammy-2024-01-01-0000'),
+        image('cbs-jammy-2024-02-01-0000'),
+        image('cbs-jammy-2024-03-01-0000'),
+        image('cbs-focal-2024-01-01-0000', release='focal'),
+        image('cbs-jammy-7-1-2024-01-01-0000', version='7.1.0'),
+        image('cbs-jammy-arm-2024-01-01-0000', arch='arm64'),
+    ]
+    assert prune(image_list, 2) == ['cbs-jammy-2024-01-01-0000']
+    assert prune(image_list, 1) == ['cbs-jammy-2024-01-01-0000', 'cbs-jammy-2024-02-01-0000']
+
+
+def test_base_images_grouped_separately():
+    image_list = [
+        image('base-jammy-2024-01-01-0000', stage='base'),
+        image('base-jammy-2024-02-01-0000', stage='base'),
+        image('cbs-jammy-2024-03-01-0000'),
+    ]
+    assert prune(image_list, 1) == ['base-jammy-2024-01-01-0000']
+
+
+def test_base_in_use_is_kept():
+    image_list = [
+        image('base-jammy-2024-01-01-0000', stage='base'),
+        image('base-jammy-2024-02-01-0000', stage='base'),
+        image('base-jammy-2024-03-01-0000', stage='base'),
+        image('cbs-jammy-2024-01-02-0000', base='base-jammy-2024-01-01-0000'),
+        image('cbs-jammy-2024-02-02-0000', base='base-jammy-2024-01-01-0000'),
+        image('cbs-jammy-2024-03-02-0000', base='base-jammy-2024-02-01-0000'),
+    ]
+    assert prune(image_list, 1) == ['base-jammy-2024-01-01-0000', 'cbs-jammy-2024-01-02-0000', 'cbs-jammy-2024-02-02-0000']
+    assert prune(image_list, 2) == ['cbs-jammy-2024-01-02-0000']
@@ -0,0 +1,96 @@
+#!/usr/bin/env -S python3 -W ignore
+
+import os
+import sys
+import json
+
+current = os.path.dirname(os.path.realpath(__file__))
+parent = os.path.dirname(current)
+sys.path.append(parent)
+
+from lib.tfevents import tf_event, resource_timer
+
+
+def event(message_type, **fields):
+    fields['type'] = message_type
+    return tf_event.parse(json.dumps(fields))
+
+
+def hook(message_type, addr, action='create', **fields):
+    fields.update({'resource': {'addr': addr}, 'action': action})
+    return event(message_type, hook=fields)
+
+
+def diagnostic(summary, detail='', severity='error', address=None):
+    fields = {'severity': severity, 'summary': summary, 'detail': detail}
+    if address:
+        fields['address'] = address
+    return event('diagnostic', diagnostic=fields)
+
+
+def test_parse_ignores_other_output():
+    assert tf_event.parse('Initializing the backend...') is None
+    assert tf_event.parse('{not json') is None
+    assert tf_event.parse('{"@message": "no type"}') is None
+    assert tf_event.parse('[1, 2]') is None
+
+
+def test_parse_hook():
+    item = hook('apply_complete', 'aws_instance.node[0]', elapsed_seconds=42)
+    assert item.type == 'apply_complete'
+    assert item.address == 'aws_instance.node[0]'
+    assert item.action == 'create'
+    assert item.elapsed == 42
+
+
+def test_diagnostic():
+    item = diagnostic('Invalid value', address='aws_instance.node[1]')
+    assert item.is_error
+    assert item.address == 'aws_instance.node[1]'
+    assert not item.is_throttle
+    assert not diagnostic('Deprecated attribute', severity='warning').is_error
+
+
+def test_throttle_detection():
+    assert diagnostic('creating EC2 Instance', 'RequestLimitExceeded: Request limit exceeded.').is_throttle
+    assert diagnostic('Error 429 Too Many Requests').is_throttle
+    assert not diagnostic('Rate exceeded', severity='warning').is_throttle
+
+
+def test_resource_timer():
+    timer = resource_timer()
+    timer.add(event('change_summary', changes={'add': 3, 'change': 1, 'remove': 0, 'operation': 'plan'}))
+    timer.add(hook('apply_start', 'aws_instance.node[0]'))
+    timer.add(hook('apply_start', 'aws_instance.node[1]'))
+    timer.add(hook('apply_complete', 'aws_instance.node[0]', elapsed_seconds=30))
+    timer.add(hook('apply_errored', 'aws_instance.node[1]', elapsed_seconds=5))
+    timer.add(event('change_summary', changes={'add': 1, 'change': 0, 'remove': 0, 'operation': 'apply'}))
+
+    assert timer.planned == 4
+    assert timer.applied == 1
+    assert timer.running == {}
+    assert timer.steps == [('aws_instance.node[0]', 'create', 30.0, 'complete'), ('aws_instance.node[1]', 'create', 5.0, 'failed')]
+    assert timer.status_line() == "1/4 resources complete"
+    assert timer.table()[1].startswith('aws_instance.node[0]')
+
+
+def test_resource_timer_provisioner():
+    timer = resource_timer()
+    timer.add(event('provision_start', hook={'resource': {'addr': 'null_resource.setup'}, 'provisioner': 'remote-exec'}))
+    assert 'remote-exec null_resource.setup' in timer.status_line()
+    timer.add(event('provision_complete', hook={'resource': {'addr': 'null_resource.setup'}, 'provisioner': 'remote-exec'}))
+
+    assert timer.running == {}
+    assert timer.steps[0][:2] == ('null_resource.setup', 'remote-exec')
+    assert timer.steps[0][3] == 'complete'
+
+
+def test_resource_timer_diagnostics():
+    timer = resource_timer()
+    timer.add(diagnostic('Deprecated attribute', severity='warning'))
+    assert timer.errors == []
+    assert not timer.throttled
+
+    timer.add(diagnostic('creating EC2 Instance', 'ThrottlingException: Rate exceeded'))
+    assert len(timer.errors) == 1
+    assert timer.throttled
@@ -8,7 +8,9 @@ packer {
 }
 
 locals {
-  timestamp = "${formatdate("YYYY-MM-DD-hhmm", timestamp())}"
+  timestamp     = "${formatdate("YYYY-MM-DD-hhmm", timestamp())}"
+  image_role    = var.build_stage == "base" ? "base" : "couchbase"
+  image_version = var.build_stage == "base" ? "base" : var.cb_version
 }
 
 variable "cb_version" {
@@ -16,6 +18,18 @@ variable "cb_version" {
   type        = string
 }
 
+variable "build_digest" {
+  description = "Digest of the build inputs"
+  type        = string
+  default     = ""
+}
+
+variable "build_stage" {
+  description = "Build stage (full or base)"
+  type        = string
+  default     = "full"
+}
+
 variable "os_linux_type" {
   description = "Linux type"
   type        = string
@@ -151,7 +165,7 @@ source "vsphere-iso" "cb-node" {
   datastore            = var.vsphere_datastore
   folder               = var.vsphere_folder
   guest_os_type        = var.vm_guest_os_type
-  vm_name              = "${var.os_linux_type}-${var.os_linux_release}-couchbase-${local.timestamp}"
+  vm_name              = "${var.os_linux_type}-${var.os_linux_release}-${local.image_role}-${local.timestamp}"
   firmware             = "bios"
   CPUs                 = 1
   cpu_cores            = var.vm_cpu_cores
@@ -171,7 +185,7 @@ source "vsphere-iso" "cb-node" {
   vm_version           = 14
   remove_cdrom         = true
   tools_upgrade_policy = true
-  notes                = "Built by HashiCorp Packer on ${local.timestamp}."
+  notes                = "Built by HashiCorp Packer on ${local.timestamp}. Digest ${var.build_digest} Stage ${var.build_stage}"
   #iso_paths           = ["[${var.vsphere_iso_datastore}] ${var.vsphere_iso_path}/${var.iso_file}"]
   #iso_checksum        = "${var.vsphere_iso_hash}:${var.iso_checksum}"
   iso_url              = var.os_image_name
@@ -203,12 +217,17 @@ build {
     environment_vars = [
       "SW_VERSION=${var.cb_version}",
   ]
-  inline = [
-    "echo Installing Couchbase",
+  inline = concat([
+    "echo Preparing host",
     "sleep 30",
     "curl -sfL https://raw.githubusercontent.com/${var.host_prep_repo}/main/bin/bootstrap.sh | sudo -E bash -",
     "sudo git clone https://github.com/${var.host_prep_repo} /usr/local/hostprep",
+  ], var.build_stage == "base" ? [
+    "echo Applying OS updates",
+    "if command -v apt-get >/dev/null; then sudo DEBIAN_FRONTEND=noninteractive apt-get -q -y update && sudo DEBIAN_FRONTEND=noninteractive apt-get -q -y upgrade; else sudo yum -q -y update; fi",
+  ] : [
+    "echo Installing Couchbase",
     "sudo /usr/local/hostprep/bin/hostprep.sh -t couchbase -v ${var.cb_version}",
-  ]
+  ])
   }
 }
@@ -0,0 +1,133 @@
+packer {
+  required_plugins {
+    amazon = {
+      version = ">= 1.0.3"
+      source  = "github.com/hashicorp/vmware"
+    }
+  }
+}
+
+locals {
+  timestamp = "${formatdate("YYYY-MM-DD-hhmm", timestamp())}"
+}
+
+variable "cb_version" {
+  description = "Software version"
+  type        = string
+}
+
+variable "build_digest" {
+  description = "Digest of the build inputs"
+  type        = string
+  default     = ""
+}
+
+variable "base_image" {
+  description = "Base template"
+  type        = string
+}
+
+variable "os_linux_type" {
+  description = "Linux type"
+  type        = string
+}
+
+variable "os_linux_release" {
+  description = "Linux release"
+  type        = string
+}
+
+variable "vsphere_hostname" {
+  description = "vSphere API Endpoint"
+  type        = string
+}
+
+variable "vsphere_username" {
+  description = "vSphere Admin Username"
+  type        = string
+}
+
+variable "vsphere_password" {
+  description = "vSphere Admin Password"
+  type        = string
+}
+
+variable "vsphere_datacenter" {
+  description = "vSphere Datacenter"
+  type        = string
+}
+
+variable "vsphere_cluster" {
+  description = "vSphere Cluster"
+  type        = string
+}
+
+variable "vsphere_datastore" {
+  description = "vSphere Datastore"
+  type        = string
+}
+
+variable "vsphere_folder" {
+  description = "vSphere Folder"
+  type        = string
+}
+
+variable "vsphere_network" {
+  description = "vSphere Port Group"
+  type        = string
+}
+
+variable "os_image_user" {
+  description = "OS User"
+  type        = string
+}
+
+variable "build_password" {
+  description = "OS User Password"
+  type        = string
+}
+
+variable "host_prep_repo" {
+  description = "Host prep repo"
+  type        = string
+}
+
+source "vsphere-clone" "cb-node" {
+  vcenter_server       = var.vsphere_hostname
+  username             = var.vsphere_username
+  password             = var.vsphere_password
+  insecure_connection  = true
+  datacenter           = var.vsphere_datacenter
+  cluster              = var.vsphere_cluster
+  datastore            = var.vsphere_datastore
+  folder               = var.vsphere_folder
+  template             = var.base_image
+  vm_name              = "${var.os_linux_type}-${var.os_linux_release}-couchbase-${local.timestamp}"
+  network              = var.vsphere_network
+  notes                = "Built by HashiCorp Packer on ${local.timestamp}. Digest ${var.build_digest} Stage couchbase Base ${var.base_image}"
+  ip_wait_timeout      = "20m"
+  shutdown_command     = "echo '${var.build_password}' | sudo -S -E shutdown -P now"
+  shutdown_timeout     = "15m"
+  communicator         = "ssh"
+  ssh_username         = var.os_image_user
+  ssh_password         = var.build_password
+  ssh_port             = 22
+  ssh_timeout          = "30m"
+  convert_to_template  = true
+}
+
+build {
+  sources = [
+    "source.vsphere-clone.cb-node"
+  ]
+  provisioner "shell" {
+    environment_vars = [
+      "SW_VERSION=${var.cb_version}",
+  ]
+  inline = [
+    "echo Installing Couchbase",
+    "cd /usr/local/hostprep && sudo git pull -q",
+    "sudo /usr/local/hostprep/bin/hostprep.sh -t couchbase -v ${var.cb_version}",
+  ]
+  }
+}